@@ -5,14 +5,47 @@ from django.utils import timezone
 from datetime import datetime
 from django.utils.safestring import mark_safe
 from django.contrib import admin
-from django.db.models import F, Sum
+from django.core.cache import cache
+from django.db.models import F, Min, Prefetch, Q, Sum
 from django.utils.html import format_html
 from mptt.admin import DraggableMPTTAdmin
 from django.db import models
 
+from seh_1.changelist import (ComputedColumnsMixin, ConditionalChangelistMixin,
+                              KeysetPaginationMixin, ReferencedFieldListFilter,
+                              computed_column)
+from seh_1.ledger import StockAdjustmentAdminMixin
+from seh_1.search import FullTextSearchMixin
+from seh_1.versions import versioned_cache_key
+
 from .models import Product, Warehouse, Sales, ProductComponent, SalesEvent, Selling
 
 
+# Summaries are keyed by the data versions of the models they read, so the
+# timeout only bounds how long unused entries stay around.
+SUMMARY_CACHE_TIMEOUT = 60 * 60
+
+
+def currency_summary(queryset, currency_field, **fields):
+    """
+    Sum every ``fields`` value (``name=field``) of ``queryset`` separately for
+    each currency with one conditional aggregate query. Returns formatted
+    ``{name: {currency: total}}``, leaving out currencies without rows.
+    """
+    currencies = [code for code, label in Product.CURRENCY_CHOICES]
+    values = queryset.aggregate(**{
+        f'{name}_{n}': Sum(field, filter=Q(**{currency_field: currency}))
+        for name, field in fields.items()
+        for n, currency in enumerate(currencies)
+    })
+    return {
+        name: {currency: "{:,.1f}".format(values[f'{name}_{n}'])
+               for n, currency in enumerate(currencies)
+               if values[f'{name}_{n}'] is not None}
+        for name in fields
+    }
+
+
 class ProductComponentInline(admin.TabularInline):
     model = ProductComponent
     extra = 1
@@ -22,8 +55,9 @@ class ProductComponentInline(admin.TabularInline):
     verbose_name = 'komponent'
 
 
-class ProductAdmin(DraggableMPTTAdmin):
+class ProductAdmin(FullTextSearchMixin, StockAdjustmentAdminMixin, DraggableMPTTAdmin):
     mptt_indent_field = "title"
+    stock_counters = ('total',)
     list_filter = ('parent',)
     autocomplete_fields = ('parent',)
     search_fields = ('title',)
@@ -128,8 +162,9 @@ class ProductAdmin(DraggableMPTTAdmin):
     highlight_total.admin_order_field = 'total'
 
 
-class WarehouseAdmin(admin.ModelAdmin):
+class WarehouseAdmin(ConditionalChangelistMixin, KeysetPaginationMixin, admin.ModelAdmin):
     list_filter = ('arrival_time', 'component')
+    etag_models = (Warehouse, Product)
     date_hierarchy = 'arrival_time'
     ordering = ('-arrival_time',)
     exclude = ('user', 'price', 'total_price')
@@ -159,28 +194,18 @@ class WarehouseAdmin(admin.ModelAdmin):
         except:
             queryset = self.get_queryset(request)
 
-        # Calculate total prices for each currency
-        currency_totals = queryset.values('component__currency').annotate(
-            total_price=Sum('total_price'))
-
-        # Create a dictionary to store the formatted currency totals
-        formatted_currency_totals = {}
-        for currency_total in currency_totals:
-            currency = currency_total['component__currency']
-            total_price = currency_total['total_price'] or 0
-            if currency in formatted_currency_totals:
-                formatted_currency_totals[currency] += total_price
-            else:
-                formatted_currency_totals[currency] = total_price
-
-        for currency, total_price in formatted_currency_totals.items():
-            formatted_price = "{:,.1f}".format(total_price)
-            formatted_currency_totals[currency] = formatted_price
-
-        try:
-            response.context_data['currency_totals'] = formatted_currency_totals
-        except:
-            pass
+        if request.user.is_superuser:
+            key = versioned_cache_key('anvar_warehouse_summary', (Warehouse, Product),
+                                      request.GET.urlencode())
+            summary = cache.get(key)
+            if summary is None:
+                summary = currency_summary(
+                    queryset, 'component__currency', totals='total_price')
+                cache.set(key, summary, SUMMARY_CACHE_TIMEOUT)
+            try:
+                response.context_data['currency_totals'] = summary['totals']
+            except:
+                pass
 
         return response
 
@@ -247,9 +272,60 @@ class SalesInline(admin.TabularInline):
             return True
 
 
-class SellingAdmin(admin.ModelAdmin):
-    list_filter = ('sold_time', 'buyer', 'user')
+SALES_SET = Prefetch(
+    'sales_set', queryset=Sales.objects.select_related('component'))
+
+
+def format_currency_totals(totals):
+    return " va ".join(f"{total:,.1f}{currency}" for currency, total in totals.items())
+
+
+def attach_selling_totals(rows):
+    """
+    Compute the sold products, per-currency sold totals and payments of all
+    ``rows`` with one grouped query over ``Sales`` and one over the payments,
+    and store them on the rows as ``sold_lines``, ``sold_totals`` and
+    ``paid_totals``.
+    """
+    rows = {row.pk: row for row in rows}
+    for row in rows.values():
+        row.sold_lines = []
+        row.sold_totals = {}
+        row.paid_totals = {}
+    if not rows:
+        return
+
+    lines = Sales.objects.filter(selling_id__in=rows).values(
+        'selling_id', 'component__title', 'component__currency',
+        'component__measurement',
+    ).annotate(
+        total_price=Sum('total_price'),
+        profit=Sum('profit'),
+        total_measurement=Sum(F('quantity') * F('quantity_in_measurement'),
+                              output_field=models.FloatField()),
+        first_id=Min('id'),
+    ).order_by('selling_id', 'first_id')
+    for line in lines:
+        row = rows[line['selling_id']]
+        row.sold_lines.append(line)
+        currency = line['component__currency']
+        row.sold_totals[currency] = row.sold_totals.get(currency, 0) + line['total_price']
+    for row in rows.values():
+        row.sold_totals = dict(sorted(row.sold_totals.items()))
+
+    payments = SalesEvent.objects.filter(selling_id__in=rows).values(
+        'selling_id', 'currency').annotate(total=Sum('price')).order_by(
+        'selling_id', 'currency')
+    for payment in payments:
+        rows[payment['selling_id']].paid_totals[payment['currency']] = payment['total']
+
+
+class SellingAdmin(ConditionalChangelistMixin, FullTextSearchMixin, KeysetPaginationMixin, ComputedColumnsMixin, admin.ModelAdmin):
+    list_filter = ('sold_time', ('buyer_customer', ReferencedFieldListFilter), 'user')
+    etag_models = (Selling, Sales, SalesEvent, Product)
     date_hierarchy = 'sold_time'
+    ordering = ('-sold_time',)
+    list_select_related = ('user',)
     inlines = [SalesInline, SalesEventtInline]
     search_fields = ['buyer']
     exclude = ('user', 'sold_time')
@@ -262,15 +338,18 @@ class SellingAdmin(admin.ModelAdmin):
         else:
             return ('buyer', 'get_sold_products_user', 'user', 'sold_time')
 
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        if request.user.is_superuser:
+            attach_selling_totals(changelist.result_list)
+        return changelist
+
     def get_sold_products(self, obj):
-        sales = obj.sales_set.values(
-            'component__title', 'component__currency', 'component__measurement').annotate(
-                total_price=Sum('total_price')).annotate(
-                profit=Sum('profit')).annotate(total_measurement=Sum(F('quantity')*F('quantity_in_measurement')))
-        return mark_safe("<br>".join(f"{text['total_measurement']}{text['component__measurement']} {text['component__title']} - {text['total_price']:,.1f}{text['component__currency']} - ({text['profit']:,.1f}{text['component__currency']})"
-                                     for text in sales
+        return mark_safe("<br>".join(f"{line['total_measurement']}{line['component__measurement']} {line['component__title']} - {line['total_price']:,.1f}{line['component__currency']} - ({line['profit']:,.1f}{line['component__currency']})"
+                                     for line in obj.sold_lines
                                      ))
 
+    @computed_column(prefetch=[SALES_SET])
     def get_sold_products_user(self, obj):
         sales = obj.sales_set.all()
         return "; ".join(
@@ -294,65 +373,35 @@ class SellingAdmin(admin.ModelAdmin):
         except:
             queryset = self.get_queryset(request)
 
-        # Calculate total prices for each currency
-        currency_totals = queryset.values('sales__component__currency').annotate(
-            total_price=Sum('sales__total_price'))
-
-        # Create a dictionary to store the formatted currency totals
-        formatted_currency_totals = {}
-        for currency_total in currency_totals:
-            currency = currency_total['sales__component__currency']
-            total_price = currency_total['total_price'] or 0
-            if currency in formatted_currency_totals:
-                formatted_currency_totals[currency] += total_price
-            else:
-                formatted_currency_totals[currency] = total_price
-
-        for currency, total_price in formatted_currency_totals.items():
-            formatted_price = "{:,.1f}".format(total_price)
-            formatted_currency_totals[currency] = formatted_price
-
-        try:
-            response.context_data['currency_totals'] = formatted_currency_totals
-        except:
-            pass
-
-        ############ profit ############
-        currency_totals = queryset.values('sales__component__currency').annotate(
-            total_price=Sum('sales__profit'))
-
-        # Create a dictionary to store the formatted currency totals
-        formatted_currency_totals = {}
-        for currency_total in currency_totals:
-            currency = currency_total['sales__component__currency']
-            total_price = currency_total['total_price'] or 0
-            if currency in formatted_currency_totals:
-                formatted_currency_totals[currency] += total_price
-            else:
-                formatted_currency_totals[currency] = total_price
-
-        for currency, total_price in formatted_currency_totals.items():
-            formatted_price = "{:,.1f}".format(total_price)
-            formatted_currency_totals[currency] = formatted_price
-
-        try:
-            response.context_data['currency_profits'] = formatted_currency_totals
-        except:
-            pass
+        if request.user.is_superuser:
+            key = versioned_cache_key('anvar_selling_summary',
+                                      (Selling, Sales, SalesEvent, Product),
+                                      request.GET.urlencode())
+            summary = cache.get(key)
+            if summary is None:
+                summary = currency_summary(
+                    Sales.objects.filter(selling__in=queryset), 'component__currency',
+                    totals='total_price', profits='profit')
+                summary.update(currency_summary(
+                    SalesEvent.objects.filter(selling__in=queryset), 'currency',
+                    paid='price'))
+                cache.set(key, summary, SUMMARY_CACHE_TIMEOUT)
+            try:
+                response.context_data['currency_totals'] = summary['totals']
+                response.context_data['currency_profits'] = summary['profits']
+                response.context_data['currency_paid'] = summary['paid']
+            except:
+                pass
 
         return response
 
     def get_paid(self, obj):
-        return obj.get_total_price_by_currency()
-
-        return total_paid
+        return format_currency_totals(obj.paid_totals)
 
     get_paid.short_description = "To'langan"
 
     def total_price(self, obj):
-        return obj.total_price()
-
-        return total_paid
+        return format_currency_totals(obj.sold_totals)
 
     total_price.short_description = "Umumiy narx(lar)"
 
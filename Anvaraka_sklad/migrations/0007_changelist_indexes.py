@@ -0,0 +1,33 @@
+# Generated by Django 4.2.5 on 2026-10-17 22:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Anvaraka_sklad', '0006_normalize_selling_buyer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='selling',
+            index=models.Index(fields=['sold_time'], name='anvar_selling_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='selling',
+            index=models.Index(fields=['buyer', 'sold_time'], name='anvar_selling_buyer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='selling',
+            index=models.Index(fields=['user', 'sold_time'], name='anvar_selling_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warehouse',
+            index=models.Index(fields=['arrival_time'], name='anvar_warehouse_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warehouse',
+            index=models.Index(fields=['component', 'arrival_time'], name='anvar_warehouse_component_idx'),
+        ),
+    ]
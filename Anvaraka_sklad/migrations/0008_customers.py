@@ -0,0 +1,69 @@
+# Generated by Django 4.2.5 on 2026-10-17 22:20
+
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+import django.db.models.deletion
+
+CHUNK_SIZE = 500
+
+
+# A frozen copy of seh_1.utils.link_customers as of this migration.
+def link_customers(Customer, queryset, fields):
+    for foreign_key, text_field in fields.items():
+        variants = {}
+        names = queryset.order_by().values_list(text_field, flat=True).distinct()
+        for name in names.iterator(chunk_size=CHUNK_SIZE):
+            if name and name.strip():
+                variants.setdefault(' '.join(name.split()).casefold(), []).append(name)
+
+        keys = list(variants)
+        customers = {}
+        for start in range(0, len(keys), CHUNK_SIZE):
+            customers.update(Customer.objects.filter(
+                key__in=keys[start:start + CHUNK_SIZE]).values_list('key', 'pk'))
+        missing = [Customer(key=key, name=' '.join(variants[key][0].split()).title())
+                   for key in keys if key not in customers]
+        Customer.objects.bulk_create(missing, batch_size=CHUNK_SIZE)
+        for start in range(0, len(missing), CHUNK_SIZE):
+            customers.update(Customer.objects.filter(key__in=[
+                customer.key for customer in missing[start:start + CHUNK_SIZE]
+            ]).values_list('key', 'pk'))
+
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            queryset.filter(**{f'{text_field}__in': [
+                name for key in chunk for name in variants[key]]}).update(**{
+                    f'{foreign_key}_id': Case(
+                        *[When(**{f'{text_field}__in': variants[key]},
+                               then=Value(customers[key])) for key in chunk])})
+
+
+def backfill(apps, schema_editor):
+    Customer = apps.get_model('seh_1', 'Customer')
+    Selling = apps.get_model('Anvaraka_sklad', 'Selling')
+    link_customers(Customer, Selling.objects.all(), {'buyer_customer': 'buyer'})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seh_1', '0027_customers'),
+        ('Anvaraka_sklad', '0007_changelist_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='selling',
+            name='buyer_customer',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='sellings', to='seh_1.customer', verbose_name='Xaridor'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='selling',
+            name='anvar_selling_buyer_idx',
+        ),
+        migrations.AddIndex(
+            model_name='selling',
+            index=models.Index(fields=['buyer_customer', 'sold_time'], name='anvar_selling_buyer_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# The FTS5 trigram tables of seh_1.search as of this migration: the table,
+# its DDL and the statement filling it (the primary key is the rowid).
+SEARCH_INDEXES = (
+    ('Anvaraka_sklad_product_search',
+     "CREATE VIRTUAL TABLE Anvaraka_sklad_product_search USING fts5(title, tokenize='trigram')",
+     "INSERT INTO Anvaraka_sklad_product_search (rowid, title) "
+     "SELECT id, COALESCE(title, '') FROM Anvaraka_sklad_product"),
+    ('Anvaraka_sklad_selling_search',
+     "CREATE VIRTUAL TABLE Anvaraka_sklad_selling_search USING fts5(buyer, tokenize='trigram')",
+     "INSERT INTO Anvaraka_sklad_selling_search (rowid, buyer) "
+     "SELECT id, COALESCE(buyer, '') FROM Anvaraka_sklad_selling"),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, create, fill in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+        schema_editor.execute(create)
+        schema_editor.execute(fill)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, create, fill in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Anvaraka_sklad', '0008_customers'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -2,6 +2,8 @@ from django.db.models import Sum
 from mptt.models import MPTTModel
 from django.db import models
 from django.contrib.auth import get_user_model
+
+from seh_1.models import Customer
 User = get_user_model()
 
 
@@ -87,6 +89,10 @@ class Warehouse(models.Model):
     class Meta:
         verbose_name = 'Keltirilgan Mahsulot '
         verbose_name_plural = 'Ombor'
+        indexes = [
+            models.Index(fields=['arrival_time'], name='anvar_warehouse_time_idx'),
+            models.Index(fields=['component', 'arrival_time'], name='anvar_warehouse_component_idx'),
+        ]
 
     def __str__(self):
         return f"{self.quantity * self.quantity_in_measurement} {self.component.get_measurement_display()} - {self.component.title}"
@@ -103,13 +109,22 @@ class Selling(models.Model):
         User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='xodim', related_name='salsekeeper')
     sold_time = models.DateTimeField(
         auto_now_add=True, verbose_name='Sotilgan sana')
+    buyer_customer = models.ForeignKey(
+        Customer, on_delete=models.PROTECT, null=True, blank=True, editable=False,
+        db_index=False, related_name='sellings', verbose_name='Xaridor')
 
     class Meta:
         verbose_name = 'Sotilgan Mahsulot '
         verbose_name_plural = 'Sotuvlar'
+        indexes = [
+            models.Index(fields=['sold_time'], name='anvar_selling_time_idx'),
+            models.Index(fields=['buyer_customer', 'sold_time'], name='anvar_selling_buyer_idx'),
+            models.Index(fields=['user', 'sold_time'], name='anvar_selling_user_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         self.buyer = self.buyer.title()
+        self.buyer_customer = Customer.for_name(self.buyer)
         super().save(*args, **kwargs)
 
     def get_total_price_by_currency(self):
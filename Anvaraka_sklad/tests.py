@@ -1,3 +1,143 @@
+import importlib
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from seh_1.ledger import verify_counters
+
+from . import views
+from .models import Product, Sales, SalesEvent, Selling, Warehouse
+
+
+class ViewsImportTest(TestCase):
+    def test_import_does_not_touch_database(self):
+        Selling.objects.bulk_create([Selling(buyer='ali') for _ in range(50)])
+        with CaptureQueriesContext(connection) as queries:
+            importlib.reload(views)
+        self.assertEqual(len(queries), 0)
+
+
+class StockLedgerTest(TestCase):
+    def test_counter_matches_ledger(self):
+        section = Product.objects.create(
+            title='Sim', price=0, sell_price=0, measurement='m')
+        product = Product.objects.create(
+            parent=section, title='Mis sim', price=2, sell_price=3, measurement='m')
+        warehouse = Warehouse.objects.create(
+            component=product, quantity=10, quantity_in_measurement=5)
+        selling = Selling.objects.create(buyer='ali')
+        Sales.objects.create(component=product, selling=selling,
+                             quantity=2, quantity_in_measurement=5)
+        warehouse.quantity = 12
+        warehouse.save()
+
+        product.refresh_from_db()
+        self.assertEqual(product.total, 50)
+        self.assertEqual(verify_counters(Product, 'total'), [])
+
+    def test_changing_the_component_moves_its_stock(self):
+        section = Product.objects.create(
+            title='Sim', price=0, sell_price=0, measurement='m')
+        copper, steel = [Product.objects.create(
+            parent=section, title=title, price=2, sell_price=3, measurement='m')
+            for title in ('Mis sim', 'Po\'lat sim')]
+        warehouse = Warehouse.objects.create(
+            component=copper, quantity=10, quantity_in_measurement=5)
+        sale = Sales.objects.create(component=copper, selling=Selling.objects.create(buyer='ali'),
+                                    quantity=2, quantity_in_measurement=5)
+
+        warehouse.component = steel
+        warehouse.save()
+        sale.component = steel
+        sale.save()
+
+        copper.refresh_from_db()
+        steel.refresh_from_db()
+        self.assertEqual((copper.total, steel.total), (0, 40))
+        self.assertEqual(verify_counters(Product, 'total'), [])
+
+
+class SellingAdminTest(TestCase):
+    def setUp(self):
+        section = Product.objects.create(
+            title='Sim', price=0, sell_price=0, measurement='m')
+        self.product = Product.objects.create(
+            parent=section, title='Mis sim', price=2, sell_price=3,
+            measurement='m', total=100000)
+        self.client.force_login(
+            User.objects.create_superuser('admin', password='x'))
+        self.url = reverse('admin:Anvaraka_sklad_selling_changelist') + \
+            f'?sold_time__year={timezone.now().year}'
+
+    def add_sellings(self, count):
+        for n in range(count):
+            selling = Selling.objects.create(buyer=f'ali {n}')
+            for quantity in (1, 2):
+                Sales.objects.create(component=self.product, selling=selling,
+                                     quantity=quantity, quantity_in_measurement=5)
+            SalesEvent.objects.create(selling=selling, price=10, currency='$')
+            SalesEvent.objects.create(selling=selling, price=5000, currency='sum')
+
+    def test_rows_show_grouped_totals(self):
+        self.add_sellings(1)
+        response = self.client.get(self.url)
+        self.assertContains(response, '15.0m Mis sim - 45.0$ - (15.0$)')
+        self.assertContains(response, '10.0$ va 5,000.0sum')
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_sellings(2)
+        self.client.get(self.url)
+        self.add_sellings(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.add_sellings(10)
+        with CaptureQueriesContext(connection) as more_queries:
+            self.client.get(self.url)
+        self.assertEqual(len(more_queries), len(queries))
+
+
+class CurrencySummaryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        section = Product.objects.create(
+            title='Sim', price=0, sell_price=0, measurement='m')
+        self.product = Product.objects.create(
+            parent=section, title='Mis sim', price=2, sell_price=3,
+            measurement='m', total=100000)
+        self.selling = Selling.objects.create(buyer='ali')
+        Sales.objects.create(component=self.product, selling=self.selling,
+                             quantity=2, quantity_in_measurement=5)
+        SalesEvent.objects.create(selling=self.selling, price=10, currency='$')
+        Warehouse.objects.create(
+            component=self.product, quantity=10, quantity_in_measurement=5)
+        self.client.force_login(
+            User.objects.create_superuser('admin', password='x'))
+        self.url = reverse('admin:Anvaraka_sklad_selling_changelist') + \
+            f'?sold_time__year={timezone.now().year}'
+
+    def test_selling_summary_is_cached_until_sales_change(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['currency_totals'], {'$': '30.0'})
+        self.assertEqual(response.context['currency_profits'], {'$': '10.0'})
+        self.assertEqual(response.context['currency_paid'], {'$': '10.0'})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(any('SUM(' in query['sql'].upper() and 'CASE' in query['sql']
+                             for query in queries.captured_queries))
+
+        Sales.objects.create(component=self.product, selling=self.selling,
+                             quantity=1, quantity_in_measurement=5)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['currency_totals'], {'$': '45.0'})
 
-# Create your tests here.
+    def test_warehouse_summary(self):
+        response = self.client.get(
+            reverse('admin:Anvaraka_sklad_warehouse_changelist') +
+            f'?arrival_time__year={timezone.now().year}')
+        self.assertEqual(response.context['currency_totals'], {'$': '100.0'})
@@ -1,20 +1,30 @@
 from django.db.models.signals import post_delete, post_save, pre_save
-from . models import Warehouse, Sales, Product, ProductComponent, Selling
+from . models import Warehouse, Sales, SalesEvent, Product, ProductComponent, Selling
 from django.dispatch import receiver
 
-sales = Selling.objects.all()
+from seh_1.ledger import move_stock
+from seh_1.versions import bump_version
 
-for sale in sales:
-    sale.buyer = sale.buyer.title()
-    sale.save()
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+@receiver(post_save, sender=Selling)
+@receiver(post_delete, sender=Selling)
+@receiver(post_save, sender=Sales)
+@receiver(post_delete, sender=Sales)
+@receiver(post_save, sender=SalesEvent)
+@receiver(post_delete, sender=SalesEvent)
+def data_changed(sender, **kwargs):
+    bump_version(sender)
 
 
 @receiver(post_save, sender=Warehouse)
 def warehouse_add(sender, instance, created, **kwargs):
     if created:
-        component = instance.component
-        component.total += instance.quantity * instance.quantity_in_measurement
-        component.save()
+        move_stock(Product, instance.component_id, 'arrival',
+                   total=instance.quantity * instance.quantity_in_measurement)
 
         ######## product component ##########
         product_component, created = ProductComponent.objects.get_or_create(
@@ -33,11 +43,12 @@ def warehouse_presave(sender, instance, **kwargs):
     if instance.pk:
         old_warehouse = Warehouse.objects.get(pk=instance.pk)
 
-        component = instance.component
-        component.total = component.total - \
-            (old_warehouse.quantity*old_warehouse.quantity_in_measurement) + \
-            (instance.quantity*instance.quantity_in_measurement)
-        component.save()
+        if ((old_warehouse.component_id, old_warehouse.quantity, old_warehouse.quantity_in_measurement) !=
+                (instance.component_id, instance.quantity, instance.quantity_in_measurement)):
+            move_stock(Product, old_warehouse.component_id, 'reversal',
+                       total=-old_warehouse.quantity*old_warehouse.quantity_in_measurement)
+            move_stock(Product, instance.component_id, 'arrival',
+                       total=instance.quantity*instance.quantity_in_measurement)
 
         if old_warehouse.component.component.filter(quantity_in_measurement=old_warehouse.quantity_in_measurement):
             product_component = old_warehouse.component.component.get(
@@ -62,9 +73,8 @@ def warehouse_presave(sender, instance, **kwargs):
 
 @receiver(post_delete, sender=Warehouse)
 def warehouse_delete(sender, instance, **kwargs):
-    component = instance.component
-    component.total -= (instance.quantity*instance.quantity_in_measurement)
-    component.save()
+    move_stock(Product, instance.component_id, 'reversal',
+               total=-instance.quantity*instance.quantity_in_measurement)
 
     if instance.component.component.filter(quantity_in_measurement=instance.quantity_in_measurement):
         product_component = instance.component.component.get(
@@ -84,10 +94,6 @@ def sales_add(sender, instance, created, **kwargs):
         # Calculate the cumulative quantities
         total_quantity = instance.quantity * instance.quantity_in_measurement
 
-        # Update the component totals
-        component.total -= total_quantity
-        component.save()
-
         try:
             product_component = component.component.get(
                 quantity_in_measurement=instance.quantity_in_measurement)
@@ -111,9 +117,8 @@ def sales_add(sender, instance, created, **kwargs):
             total_quantity += sales_instance.quantity * \
                 sales_instance.quantity_in_measurement
 
-            component.total -= sales_instance.quantity * \
-                sales_instance.quantity_in_measurement
-            component.save()
+        # Update the component totals
+        move_stock(Product, component.pk, 'sale', total=-total_quantity)
 
         # Update the instance's total_price based on the cumulative quantities
         instance.total_price = instance.price * total_quantity
@@ -124,11 +129,12 @@ def sales_add(sender, instance, created, **kwargs):
 def sales_presave(sender, instance, **kwargs):
     if instance.pk:
         old_sales = Sales.objects.get(pk=instance.pk)
-        component = instance.component
-        component.total = component.total + \
-            (old_sales.quantity*old_sales.quantity_in_measurement) - \
-            (instance.quantity*instance.quantity_in_measurement)
-        component.save()
+        if ((old_sales.component_id, old_sales.quantity, old_sales.quantity_in_measurement) !=
+                (instance.component_id, instance.quantity, instance.quantity_in_measurement)):
+            move_stock(Product, old_sales.component_id, 'reversal',
+                       total=old_sales.quantity*old_sales.quantity_in_measurement)
+            move_stock(Product, instance.component_id, 'sale',
+                       total=-instance.quantity*instance.quantity_in_measurement)
 
         if old_sales.component.component.filter(quantity_in_measurement=old_sales.quantity_in_measurement):
             product_component = old_sales.component.component.get(
@@ -150,8 +156,8 @@ def sales_presave(sender, instance, **kwargs):
 @receiver(post_delete, sender=Sales)
 def sales_delete(sender, instance, **kwargs):
     component = instance.component
-    component.total += instance.quantity * instance.quantity_in_measurement
-    component.save()
+    move_stock(Product, component.pk, 'reversal',
+               total=instance.quantity * instance.quantity_in_measurement)
 
     if component.component.filter(quantity_in_measurement=instance.quantity_in_measurement):
         product_component = component.component.get(
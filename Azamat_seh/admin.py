@@ -1,24 +1,48 @@
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.urls import reverse
 from django.urls import path
-import plotly.graph_objects as go
 from django.shortcuts import render
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.admin import AdminSite
+from django.contrib.admin.options import IncorrectLookupParameters
 from django.contrib.auth.models import User
-from django.db.models import F,  Sum
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, F, FloatField, Q, Sum
 from django.utils import timezone
+from django.utils.cache import (add_never_cache_headers, get_conditional_response,
+                                patch_cache_control)
 from django.utils.html import format_html
+from django.utils.http import quote_etag
 from django.utils.translation import gettext_lazy as _
 from mptt.admin import DraggableMPTTAdmin
 
+from seh_1.changelist import (ConditionalChangelistMixin, KeysetPaginationMixin,
+                              ReferencedFieldListFilter, SubtreeAggregatesMixin)
+from seh_1.costing import recalculate_unit_costs
+from seh_1.exports import ExportAdminMixin, ExportSpec, naive
+from seh_1.ledger import StockAdjustmentAdminMixin
+from seh_1.search import FullTextSearchMixin
+from seh_1.versions import versioned_cache_key
+
+from .views import plotly_js_url
+
 from .models import (Component, Product, ProductComponent,
                      ProductProduction, Sales, SalesEvent, Warehouse)
 
+# Report entries are keyed by the data versions of the models they read, so
+# the timeout only bounds how long unused entries stay around.
+REPORT_CACHE_TIMEOUT = 60 * 60
+
 
-class ComponentAdmin(DraggableMPTTAdmin):
+class ComponentAdmin(FullTextSearchMixin, SubtreeAggregatesMixin, StockAdjustmentAdminMixin, DraggableMPTTAdmin):
     mptt_indent_field = "title"
+    stock_counters = ('total',)
+    subtree_aggregates = {
+        'subtree_price': Sum(F('price') * F('total')),
+        'subtree_low_stock': Count('pk', filter=Q(total__lt=F('notification_limit'))),
+    }
     list_filter = ('parent',)
     autocomplete_fields = ('parent',)
     search_fields = ('title',)
@@ -32,9 +56,8 @@ class ComponentAdmin(DraggableMPTTAdmin):
                     'highlight_total', 'measurement')
 
     def get_total_price(self, obj):
-        if not obj.parent:
-            total_child_price = obj.children.annotate(total_price=F(
-                'price') * F('total')).aggregate(total=Sum('total_price'))['total']
+        if not obj.parent_id:
+            total_child_price = obj.subtree_price or 0
             return "{:,.2f}".format(total_child_price).rstrip("0").rstrip(".")+'sum'
         formatted_price = "{:,.1f}".format(
             obj.total * obj.price).rstrip("0").rstrip(".")
@@ -43,7 +66,7 @@ class ComponentAdmin(DraggableMPTTAdmin):
     get_total_price.short_description = 'Mavjud komponent narxi'
 
     def get_price(self, obj):
-        if not obj.parent:
+        if not obj.parent_id:
             return '-'
         formatted_price = "{:,.2f}".format(obj.price).rstrip("0").rstrip(".")
         return formatted_price+' sum'
@@ -51,14 +74,14 @@ class ComponentAdmin(DraggableMPTTAdmin):
     get_price.admin_order_field = 'price'
 
     def highlight_total(self, obj):
-        if obj.parent:
+        if obj.parent_id:
             if obj.total < obj.notification_limit:  # Specify your desired threshold value here
                 return format_html(
                     '<span style="background-color:#FF0E0E; color:white; padding: 2px 5px;">{}</span>',
                     str(obj.total)+' '+obj.measurement
                 )
             return str(obj.total)+' '+obj.measurement
-        elif not obj.parent and obj.highlight:
+        elif not obj.parent_id and obj.subtree_low_stock:
             return format_html('<span style="background-color:#FF0E0E; color:white; padding: 2px 10px;">-</span>')
 
     highlight_total.short_description = 'Umumiy'
@@ -74,12 +97,14 @@ class ProductComponentInline(admin.TabularInline):
     verbose_name = 'komponent'
 
 
-class ProductAdmin(DraggableMPTTAdmin):
+class ProductAdmin(FullTextSearchMixin, StockAdjustmentAdminMixin, DraggableMPTTAdmin):
     mptt_indent_field = "name"
+    stock_counters = ('total_new',)
     list_filter = ('parent',)
     autocomplete_fields = ('parent',)
     search_fields = ('name',)
     inlines = [ProductComponentInline]
+    actions = ['recalculate_costs']
 
     change_list_template = 'admin/product_change.html'
 
@@ -128,21 +153,67 @@ class ProductAdmin(DraggableMPTTAdmin):
 
     def tannarx(self, obj):
         if obj.parent:
-            product_price = 0
-            for productcomponent in obj.productcomponent_set.all():
-                product_price += productcomponent.quantity*productcomponent.component.price
-            return "{:,.1f}".format(product_price).rstrip("0").rstrip(".")+' sum'
+            return "{:,.1f}".format(obj.unit_cost).rstrip("0").rstrip(".")+' sum'
         else:
             return '-'
     tannarx.short_description = 'Tan narxi'
+    tannarx.admin_order_field = 'unit_cost'
+
+    @admin.action(description='Tan narxlarini qayta hisoblash', permissions=['costing'])
+    def recalculate_costs(self, request, queryset):
+        updated = recalculate_unit_costs(queryset, Component, ProductComponent)
+        self.message_user(
+            request, f"{queryset.count()} ta tovar tekshirildi, {updated} ta tan narxi yangilandi.", messages.SUCCESS)
+
+    def has_costing_permission(self, request):
+        return request.user.is_superuser
+
+
+def _format_amount(value):
+    return "{:,.1f}".format(value).rstrip("0").rstrip(".")
+
+
+def production_rollup(queryset):
+    """
+    Produced weight and quantity of ``queryset`` per section, then per
+    product, each sorted by weight, as ``(name, weight, quantity)`` rows.
 
+    One query grouped by product; the section rows are summed from the same
+    result.
+    """
+    rows = queryset.order_by().values('product__parent__name', 'product__name').annotate(
+        weight=Sum(F('quantity') * F('product__weight'), output_field=FloatField()),
+        total_quantity=Sum('quantity'))
+    parents = {}
+    products = {}
+    for row in rows:
+        for totals, name in ((parents, row['product__parent__name']),
+                             (products, row['product__name'])):
+            weight, quantity = totals.get(name, (0, 0))
+            totals[name] = (weight + (row['weight'] or 0), quantity + row['total_quantity'])
 
-class ProductProductionAdmin(admin.ModelAdmin):
+    return [(name, _format_amount(weight), _format_amount(quantity))
+            for totals in (parents, products)
+            for name, (weight, quantity) in sorted(
+                totals.items(), key=lambda item: item[1][0], reverse=True)]
+
+
+class ProductProductionAdmin(ConditionalChangelistMixin, ExportAdminMixin, KeysetPaginationMixin, admin.ModelAdmin):
     list_display = ('__str__', 'quantity', 'user', 'date')
+    etag_models = (ProductProduction, Product)
     list_filter = ('user', 'product', 'date',)
     readonly_fields = ('user', 'date')
     date_hierarchy = 'date'
+    ordering = ('-date',)
     change_list_template = 'admin/production_azamat.html'
+    export_spec = ExportSpec(
+        'azamat_production.xlsx',
+        [('Produkt', lambda production: str(production.product)),
+         ('Kesilmaganlar soni', 'quantity'),
+         ('Xodim', 'user__username'),
+         ('Ishlab chiqarilish vaqti', lambda production: naive(production.date))],
+        select_related=['product', 'user'], widths=[20, 20, 20, 30],
+        depends_on=[ProductProduction, Product])
 
     def changelist_view(self, request, extra_context=None):
         if not request.GET and not request.session.get('current_page') == request.path:
@@ -155,8 +226,6 @@ class ProductProductionAdmin(admin.ModelAdmin):
             )
         response = super().changelist_view(request, extra_context=extra_context)
 
-        queryset = self.get_queryset(request)
-
         # Apply filters and search terms to the queryset
         try:
             cl = response.context_data['cl']
@@ -164,59 +233,18 @@ class ProductProductionAdmin(admin.ModelAdmin):
         except:
             queryset = self.get_queryset(request)
 
-        # Calculate total price
-
-        summary = queryset.values('product__parent__name', 'product__weight').annotate(
-            total_quantity=Sum('quantity'))
-        summary_list = {}
-        for result in summary:
-            product__name = result['product__parent__name']
-            total_weight = result['total_quantity']*result['product__weight']
-
-            if product__name in summary_list:
-                summary_list[product__name] += total_weight
-            else:
-                summary_list[product__name] = total_weight
-
-        sorted_data = sorted(summary_list.items(),
-                             key=lambda x: x[1], reverse=True)
-
-        summary = queryset.values('product__name', 'product__weight').annotate(
-            total_quantity=Sum('quantity'))
-
-        summary_list = {}
-        summary_list2 = {}
-        for result in summary:
-            product__name = result['product__name']
-            total_weight = result['total_quantity']*result['product__weight']
-            total_quantity = result['total_quantity']
-
-            if product__name in summary_list:
-                summary_list[product__name] += total_weight
-            else:
-                summary_list[product__name] = total_weight
-            ############################
-            if product__name in summary_list2:
-                summary_list2[product__name] += total_quantity
-            else:
-                summary_list2[product__name] = total_quantity
-
-        sorted_data += sorted(summary_list.items(),
-                              key=lambda x: x[1], reverse=True)
-
-        sorted_dict = {item[0]: item[1] for item in sorted_data}
-
-        items_with_quantity = []
-        for name, quantity in sorted_dict.items():
-            items_with_quantity.append((name, "{:,.1f}".format(quantity).rstrip("0").rstrip(
-                "."), "{:,.1f}".format(summary_list2.get(name, 0)).rstrip("0").rstrip(".")))
-
-        print(items_with_quantity)
-
-        try:
-            response.context_data['total'] = items_with_quantity
-        except:
-            pass
+        if request.user.is_superuser:
+            key = versioned_cache_key('azamat_production_rollup',
+                                      (ProductProduction, Product),
+                                      request.GET.urlencode())
+            items_with_quantity = cache.get(key)
+            if items_with_quantity is None:
+                items_with_quantity = production_rollup(queryset)
+                cache.set(key, items_with_quantity, REPORT_CACHE_TIMEOUT)
+            try:
+                response.context_data['total'] = items_with_quantity
+            except:
+                pass
 
         return response
 
@@ -234,8 +262,9 @@ class ProductProductionAdmin(admin.ModelAdmin):
         return super().has_change_permission(request, obj)
 
 
-class WarehouseAdmin(admin.ModelAdmin):
+class WarehouseAdmin(ConditionalChangelistMixin, KeysetPaginationMixin, admin.ModelAdmin):
     list_filter = ('date', 'component')
+    etag_models = (Warehouse, Component)
     date_hierarchy = 'date'
     ordering = ('-date',)
     exclude = ('user', 'price')
@@ -317,15 +346,31 @@ class SalesEventInline(admin.TabularInline):
         return fields
 
 
-class SalesAdmin(admin.ModelAdmin):
+class SalesAdmin(ConditionalChangelistMixin, ExportAdminMixin, FullTextSearchMixin, KeysetPaginationMixin, admin.ModelAdmin):
+    etag_models = (Sales, SalesEvent, Product)
     inlines = [SalesEventInline]
-    list_filter = ['buyer', 'seller', 'user', 'date']
+    list_filter = [('buyer_customer', ReferencedFieldListFilter),
+                   ('seller_customer', ReferencedFieldListFilter), 'user', 'date']
     search_fields = ['buyer', 'seller']
     date_hierarchy = 'date'
+    ordering = ('-date',)
     # readonly_fields = ('seller',)
     exclude = ('user',)
 
     change_list_template = 'admin/sales_azamat.html'
+    export_spec = ExportSpec(
+        'azamat_seh_sales.xlsx',
+        [('Haridor', 'buyer'),
+         ('Sotuvchi', 'seller'),
+         ('Kesilgan mahsulotlar', lambda sale: ", ".join(
+             str(sale_event)+f' ({sale_event.single_sold_price} dan)'
+             for sale_event in sale.selling_cut.all())),
+         ('Narx', lambda sale: "{:,.1f}".format(
+             sum(event.total_sold_price for event in sale.selling_cut.all()))),
+         ('Xodim', lambda sale: sale.user.username if sale.user else '-'),
+         ('Sotilgan sana', lambda sale: naive(sale.date))],
+        select_related=['user'], prefetch_related=['selling_cut__product'],
+        widths=[20, 20, 100, 50, 20, 20, 20, 20], depends_on=[Sales, SalesEvent, Product])
 
     def changelist_view(self, request, extra_context=None):
         if not request.GET and not request.session.get('current_page') == request.path:
@@ -345,35 +390,68 @@ class SalesAdmin(admin.ModelAdmin):
         except:
             queryset = self.get_queryset(request)
 
-        sales_events = SalesEvent.objects.filter(sales__in=queryset)
-
-        products = sales_events.values('product__name').annotate(
-            total_sales=Sum('quantity_sold')
-        )
-        product_names = [product['product__name'] for product in products]
-        total_sales = [product['total_sales'] for product in products]
-
-        fig = go.Figure(data=[go.Bar(x=product_names, y=total_sales)])
-        div = fig.to_html(full_html=False)
-
-        # Calculate total price
-        total_sold_price = SalesEvent.objects.filter(sales__in=queryset).aggregate(
-            total_sold_price=Sum(F('total_sold_price')))['total_sold_price']
-
-        total_profit_price = SalesEvent.objects.filter(sales__in=queryset).aggregate(
-            total_profit_price=Sum(F('profit')))['total_profit_price']
+        totals = SalesEvent.objects.filter(sales__in=queryset).aggregate(
+            total_sold_price=Sum('total_sold_price'), total_profit_price=Sum('profit'))
 
         try:
             response.context_data['total'] = "{:,.1f}".format(
-                total_sold_price)+'sum'
-            response.context_data['graph'] = div
+                totals['total_sold_price'] or 0)+'sum'
             response.context_data['profit'] = "{:,.1f}".format(
-                total_profit_price)+'sum'
+                totals['total_profit_price'] or 0)+'sum'
+            response.context_data['chart_url'] = reverse('admin:Azamat_seh_sales_chart')
+            response.context_data['plotly_js_url'] = plotly_js_url()
         except:
             pass
 
         return response
 
+    def get_urls(self):
+        return [
+            path('chart/', self.admin_site.admin_view(self.chart_view, cacheable=True),
+                 name='Azamat_seh_sales_chart'),
+        ] + super().get_urls()
+
+    def chart_view(self, request):
+        """
+        Quantity sold per product for the changelist filters in the query
+        string, as ``{"x": names, "y": quantities}`` for the bar chart. The
+        versioned cache key is also the ETag, so an unchanged chart is a 304.
+        """
+        if not request.user.is_superuser:
+            raise PermissionDenied
+        key = versioned_cache_key('azamat_sales_chart', (Sales, SalesEvent, Product),
+                                  request.GET.urlencode())
+        etag = quote_etag(key)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            data = self.chart_data(request, key)
+            if data is None:
+                response = JsonResponse({'x': [], 'y': []}, status=400)
+                add_never_cache_headers(response)
+                return response
+            response = JsonResponse(data)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def chart_data(self, request, key):
+        data = cache.get(key)
+        if data is None:
+            try:
+                # The filtered queryset only, without the page and counts.
+                queryset = self.get_export_queryset(request)
+            except IncorrectLookupParameters:
+                return None
+            products = SalesEvent.objects.filter(sales__in=queryset).order_by(
+                'product__name').values('product__name').annotate(
+                total_sales=Sum('quantity_sold'))
+            data = {
+                'x': [product['product__name'] for product in products],
+                'y': [product['total_sales'] for product in products],
+            }
+            cache.set(key, data, REPORT_CACHE_TIMEOUT)
+        return data
+
     def get_list_display(self, request):
         if request.user.is_superuser:
             return ['buyer', 'seller',
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.5 on 2026-10-17 21:41
+
+from django.db import migrations, models
+from django.db.models import F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill(apps, schema_editor):
+    # A frozen copy of seh_1.utils.refresh_unit_costs as of this migration.
+    Product = apps.get_model('Azamat_seh', 'Product')
+    ProductComponent = apps.get_model('Azamat_seh', 'ProductComponent')
+    cost = ProductComponent.objects.filter(
+        product=OuterRef('pk')).order_by().values('product').annotate(
+        cost=Sum(F('quantity') * F('component__price'))).values('cost')
+    Product.objects.update(unit_cost=Coalesce(
+        Subquery(cost, output_field=FloatField()), Value(0.0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Azamat_seh', '0014_normalize_sales_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='unit_cost',
+            field=models.FloatField(default=0, editable=False, verbose_name='Tan narxi'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
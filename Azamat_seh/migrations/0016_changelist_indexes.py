@@ -0,0 +1,49 @@
+# Generated by Django 4.2.5 on 2026-10-17 22:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Azamat_seh', '0015_product_unit_cost'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productproduction',
+            index=models.Index(fields=['date'], name='azamat_production_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productproduction',
+            index=models.Index(fields=['user', 'date'], name='azamat_production_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productproduction',
+            index=models.Index(fields=['product', 'date'], name='azamat_production_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['date'], name='azamat_sales_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['buyer', 'date'], name='azamat_sales_buyer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['seller', 'date'], name='azamat_sales_seller_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['user', 'date'], name='azamat_sales_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warehouse',
+            index=models.Index(fields=['date'], name='azamat_warehouse_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warehouse',
+            index=models.Index(fields=['component', 'date'], name='azamat_warehouse_component_idx'),
+        ),
+    ]
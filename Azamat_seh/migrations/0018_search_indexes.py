@@ -0,0 +1,45 @@
+from django.db import migrations
+
+# The FTS5 trigram tables of seh_1.search as of this migration: the table,
+# its DDL and the statement filling it (the primary key is the rowid).
+SEARCH_INDEXES = (
+    ('Azamat_seh_component_search',
+     "CREATE VIRTUAL TABLE Azamat_seh_component_search USING fts5(title, tokenize='trigram')",
+     "INSERT INTO Azamat_seh_component_search (rowid, title) "
+     "SELECT id, COALESCE(title, '') FROM Azamat_seh_component"),
+    ('Azamat_seh_product_search',
+     "CREATE VIRTUAL TABLE Azamat_seh_product_search USING fts5(name, tokenize='trigram')",
+     "INSERT INTO Azamat_seh_product_search (rowid, name) "
+     "SELECT id, COALESCE(name, '') FROM Azamat_seh_product"),
+    ('Azamat_seh_sales_search',
+     "CREATE VIRTUAL TABLE Azamat_seh_sales_search USING fts5(buyer, seller, tokenize='trigram')",
+     "INSERT INTO Azamat_seh_sales_search (rowid, buyer, seller) "
+     "SELECT id, COALESCE(buyer, ''), COALESCE(seller, '') FROM Azamat_seh_sales"),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, create, fill in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+        schema_editor.execute(create)
+        schema_editor.execute(fill)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, create, fill in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Azamat_seh', '0017_customers'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
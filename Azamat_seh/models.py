@@ -2,11 +2,13 @@ from openpyxl import Workbook
 from mptt.models import MPTTModel
 from django.utils import timezone
 from django.http import HttpResponse
-from django.db.models import Q
+from django.db.models import F, Q, Sum
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.contrib import admin
 from django.contrib.auth import get_user_model
+
+from seh_1.models import Customer
 User = get_user_model()
 
 
@@ -60,16 +62,16 @@ class Product(MPTTModel):
         default=0, verbose_name="Ishlab chiqarilganlar soni")
     
     weight = models.FloatField(verbose_name='Vazni (kg)')
+    unit_cost = models.FloatField(
+        default=0, editable=False, verbose_name='Tan narxi')
 
     class Meta:
         verbose_name = 'Tovar '
         verbose_name_plural = 'Tovarlar'
 
     def calculate_product_price(self):
-        product_price = 0
-        for productcomponent in self.productcomponent_set.all():
-            product_price += productcomponent.quantity*productcomponent.component.price
-        return product_price
+        return self.productcomponent_set.aggregate(
+            price=Sum(F('quantity') * F('component__price')))['price'] or 0
 
     def __str__(self):
         return self.name
@@ -104,6 +106,11 @@ class ProductProduction(models.Model):
         verbose_name = 'Tovar '
         verbose_name_plural = 'Tovarlar Ishlab Chiqarish'
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date'], name='azamat_production_date_idx'),
+            models.Index(fields=['user', 'date'], name='azamat_production_user_idx'),
+            models.Index(fields=['product', 'date'], name='azamat_production_product_idx'),
+        ]
 
     def __str__(self):
         return f'{self.quantity} dona {self.product}'
@@ -123,6 +130,10 @@ class Warehouse(models.Model):
     class Meta:
         verbose_name = 'Keltirilgan Komponentlar '
         verbose_name_plural = 'Ombor'
+        indexes = [
+            models.Index(fields=['date'], name='azamat_warehouse_date_idx'),
+            models.Index(fields=['component', 'date'], name='azamat_warehouse_component_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         self.price = self.component.price * self.quantity
@@ -140,10 +151,22 @@ class Sales(models.Model):
         User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Xodim', related_name='sale')
     date = models.DateTimeField(
         auto_now_add=True, verbose_name='Sotilgan sana')
+    buyer_customer = models.ForeignKey(
+        Customer, on_delete=models.PROTECT, null=True, blank=True, editable=False,
+        db_index=False, related_name='azamat_sales_as_buyer', verbose_name='Sotuvchi')
+    seller_customer = models.ForeignKey(
+        Customer, on_delete=models.PROTECT, null=True, blank=True, editable=False,
+        db_index=False, related_name='azamat_sales_as_seller', verbose_name='Haridor')
 
     class Meta:
         verbose_name = 'Sotuv '
         verbose_name_plural = "Sotuv Bo'limi "
+        indexes = [
+            models.Index(fields=['date'], name='azamat_sales_date_idx'),
+            models.Index(fields=['buyer_customer', 'date'], name='azamat_sales_buyer_idx'),
+            models.Index(fields=['seller_customer', 'date'], name='azamat_sales_seller_idx'),
+            models.Index(fields=['user', 'date'], name='azamat_sales_user_idx'),
+        ]
 
     def calculate_total_price(self):
         sales_events = self.selling_cut.all()
@@ -153,6 +176,8 @@ class Sales(models.Model):
     def save(self, *args, **kwargs):
         self.buyer = self.buyer.title()
         self.seller = self.seller.title()
+        self.buyer_customer = Customer.for_name(self.buyer)
+        self.seller_customer = Customer.for_name(self.seller)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -186,7 +211,7 @@ class SalesEvent(models.Model):
         self.total_sold_price = self.single_sold_price * self.quantity_sold
 
         self.profit = self.total_sold_price - \
-            (self.product.calculate_product_price() * self.quantity_sold)
+            (self.product.unit_cost * self.quantity_sold)
 
         super().save(*args, **kwargs)
 
@@ -1,3 +1,220 @@
-from django.test import TestCase
+import importlib
+import tempfile
+from io import BytesIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from seh_1.exports import build_pending_exports
+
+from . import views
+from .models import (Component, Product, ProductComponent, ProductProduction,
+                     Sales, SalesEvent)
+
+
+class ViewsImportTest(TestCase):
+    def test_import_does_not_touch_database(self):
+        Sales.objects.bulk_create(
+            [Sales(buyer='ali', seller='vali') for _ in range(50)])
+        with CaptureQueriesContext(connection) as queries:
+            importlib.reload(views)
+        self.assertEqual(len(queries), 0)
+
+
+class ProductionStockTest(TestCase):
+    def test_production_updates_totals_and_reverts_on_delete(self):
+        section = Component.objects.create(
+            title='Granula', price=0, measurement='kg')
+        component = Component.objects.create(
+            parent=section, title='PE', price=1, measurement='kg', total=100)
+        product = Product.objects.create(name='Paket', price=5, weight=1)
+        ProductComponent.objects.create(
+            product=product, component=component, quantity=0.5)
+
+        production = ProductProduction.objects.create(
+            product=product, quantity=40)
+        component.refresh_from_db()
+        product.refresh_from_db()
+        self.assertEqual((component.total, product.total_new), (80, 40))
+
+        production.delete()
+        component.refresh_from_db()
+        product.refresh_from_db()
+        self.assertEqual((component.total, product.total_new), (100, 0))
+
+
+class UnitCostTest(TestCase):
+    def test_follows_bom_and_price_changes(self):
+        section = Component.objects.create(
+            title='Granula', price=0, measurement='kg')
+        component = Component.objects.create(
+            parent=section, title='PE', price=2, measurement='kg')
+        product = Product.objects.create(name='Paket', price=5, weight=1)
+        ProductComponent.objects.create(
+            product=product, component=component, quantity=0.5)
+        product.refresh_from_db()
+        self.assertEqual(product.unit_cost, 1)
+
+        component.price = 3
+        component.save()
+        product.refresh_from_db()
+        self.assertEqual(product.unit_cost, 1.5)
+
+
+class ComponentChangelistTest(TestCase):
+    QUERY_BUDGET = 12
+
+    def test_query_budget_does_not_grow_with_sections(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        self.client.get(reverse('admin:Azamat_seh_component_changelist'))
+        counts = []
+        for sections in (2, 8):
+            for i in range(sections):
+                section = Component.objects.create(
+                    title=f'Granula {sections}-{i}', price=0, measurement='kg')
+                for j in range(3):
+                    Component.objects.create(
+                        parent=section, title=f'PE {j}', price=1000, measurement='kg',
+                        total=5 * j, notification_limit=6)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('admin:Azamat_seh_component_changelist'))
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[1], self.QUERY_BUDGET)
+        self.assertContains(response, '15,000sum')
+
+
+class SalesChartTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser('admin', 'a@a.uz', 'pw')
+        self.client.force_login(self.user)
+        self.product = Product.objects.create(
+            name='Paket', price=5, weight=1, total_new=100)
+        self.sales = Sales.objects.create(buyer='ali', seller='vali')
+        SalesEvent.objects.create(
+            product=self.product, sales=self.sales, quantity_sold=3)
+
+    def test_chart_data_is_cached_until_sales_change(self):
+        url = reverse('admin:Azamat_seh_sales_chart') + \
+            f'?date__year={timezone.now().year}'
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).json(),
+                             {'x': ['Paket'], 'y': [3]})
+        sales = [query['sql'] for query in queries.captured_queries
+                 if 'FROM "Azamat_seh_sales"' in query['sql']]
+        self.assertFalse(any('COUNT(' in sql or 'LIMIT' in sql for sql in sales))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse(any('"Azamat_seh_salesevent"' in query['sql']
+                             for query in queries.captured_queries))
+
+        SalesEvent.objects.create(
+            product=self.product, quantity_sold=2,
+            sales=Sales.objects.create(buyer='ali', seller='vali'))
+        self.assertEqual(self.client.get(url).json(),
+                         {'x': ['Paket'], 'y': [5]})
+
+    def test_unchanged_chart_is_not_modified(self):
+        url = reverse('admin:Azamat_seh_sales_chart') + \
+            f'?date__year={timezone.now().year}'
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('no-store', response['Cache-Control'])
+
+        SalesEvent.objects.create(
+            product=self.product, quantity_sold=1,
+            sales=Sales.objects.create(buyer='ali', seller='vali'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json(), {'x': ['Paket'], 'y': [4]})
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_changelist_links_the_bundle_instead_of_inlining_it(self):
+        response = self.client.get(
+            reverse('admin:Azamat_seh_sales_changelist') +
+            f'?date__year={timezone.now().year}')
+        self.assertContains(response, response.context['plotly_js_url'])
+        self.assertLess(len(response.content), 200_000)
+
+        asset = self.client.get(response.context['plotly_js_url'])
+        self.assertIn('immutable', asset['Cache-Control'])
+        self.assertEqual(self.client.get(reverse(
+            'plotly_js', args=['0' * 16])).status_code, 404)
+
+
+class ProductionRollupTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        section = Product.objects.create(name='Paketlar', price=0, weight=0)
+        self.small = Product.objects.create(
+            name='Kichik', parent=section, price=1, weight=0.5)
+        big = Product.objects.create(name='Katta', parent=section, price=2, weight=2)
+        for product, quantity in ((self.small, 10), (self.small, 30), (big, 15)):
+            ProductProduction.objects.create(product=product, quantity=quantity)
+        self.url = reverse('admin:Azamat_seh_productproduction_changelist') + \
+            f'?date__year={timezone.now().year}'
+
+    def test_rollup_is_one_query_and_cached_until_production_changes(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['total'], [
+            ('Paketlar', '50', '55'), ('Katta', '30', '15'), ('Kichik', '20', '40')])
+        self.assertEqual(len([query for query in queries.captured_queries
+                              if '"weight")' in query['sql']]), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(any('"weight")' in query['sql']
+                             for query in queries.captured_queries))
+
+        ProductProduction.objects.create(product=self.small, quantity=2)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['total'][0], ('Paketlar', '51', '57'))
+
+
+EXPORT_ROOT = tempfile.TemporaryDirectory()
+
+
+@override_settings(EXPORT_ROOT=EXPORT_ROOT.name)
+class SalesExportTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        self.product = Product.objects.create(name='Paket', price=5, weight=1)
+
+    def add_sales(self, count):
+        for _ in range(count):
+            SalesEvent.objects.create(
+                product=self.product, quantity_sold=2,
+                sales=Sales.objects.create(buyer='ali', seller='vali'))
+
+    def export(self):
+        with CaptureQueriesContext(connection) as queries:
+            # Queue the job, build it as build_exports does, fetch the file.
+            self.client.get(reverse('sales_excel_export'))
+            build_pending_exports()
+            response = self.client.get(reverse('sales_excel_export'))
+        self.assertTrue(response.streaming)
+        rows = list(load_workbook(BytesIO(b''.join(response.streaming_content))).active.values)
+        return rows, len(queries)
+
+    def test_export_streams_rows_with_constant_queries(self):
+        self.add_sales(2)
+        self.export()
+        # Every sale changes the data version, so each export is rebuilt.
+        self.add_sales(1)
+        rows, small = self.export()
+        self.add_sales(3)
+        rows, large = self.export()
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[1][:4], ('Ali', 'Vali', '2 ta Paket (5.0 dan)', '10.0'))
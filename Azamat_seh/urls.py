@@ -8,4 +8,6 @@ urlpatterns = [
          name='azamat_production_excel'),
     path('sales/export-excel/', views.sales_excel_export,
          name='sales_excel_export'),
+    path('assets/plotly-<str:digest>.js', views.plotly_js,
+         name='plotly_js'),
 ]
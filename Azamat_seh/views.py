@@ -1,69 +1,86 @@
+import hashlib
 from datetime import datetime
+from functools import lru_cache
 
 import requests
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
+from django.db import transaction
 from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse
 from django.urls import reverse
-from openpyxl import Workbook
 from openpyxl.styles import Alignment
 from openpyxl.utils import get_column_letter
+from plotly.offline import get_plotlyjs
 from pytz import timezone
 
 from conf import settings
+from seh_1.costing import discard_bom_matrix
+from seh_1.exports import export_changelist
+from seh_1.ledger import move_stock, record_movements
+from seh_1.utils import consume_components, refresh_unit_costs
+from seh_1.versions import bump_version
 
-from .models import (Product, ProductProduction, Sales, SalesEvent, Warehouse)
+from .models import (Component, Product, ProductComponent, ProductProduction,
+                     Sales, SalesEvent, Warehouse)
 
-from .models import Sales
 
-sales = Sales.objects.all()
+@receiver(pre_save, sender=Component)
+def component_remember_price(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not instance.pk or (update_fields is not None and 'price' not in update_fields):
+        return
+    instance._stored_price = Component.objects.filter(
+        pk=instance.pk).values_list('price', flat=True).first()
 
-for sale in sales:
-    sale.buyer = sale.buyer.title()
-    sale.seller = sale.seller.title()
-    sale.save()
+
+@receiver(post_save, sender=Component)
+def component_price_update(sender, instance, created, **kwargs):
+    # Stock, title and parent edits leave the unit costs alone.
+    stored_price = instance.__dict__.pop('_stored_price', None)
+    if created or stored_price is None or stored_price == instance.price:
+        return
+    refresh_unit_costs(Product.objects.filter(
+        productcomponent__component=instance), ProductComponent)
+
+
+@receiver(post_save, sender=ProductComponent)
+@receiver(post_delete, sender=ProductComponent)
+def product_component_update(sender, instance, **kwargs):
+    refresh_unit_costs(Product.objects.filter(
+        pk=instance.product_id), ProductComponent)
+    discard_bom_matrix(ProductComponent)
 
 
 @receiver(post_save, sender=ProductProduction)
 def subtract_component_total(sender, instance, created, **kwargs):
     if created:
-        product_components = instance.product.productcomponent_set.all()
-        product = instance.product
-        product.total_new += instance.quantity
-        product.save()
-
-        for product_component in product_components:
-            total_quantity_by_component = product_component.quantity * \
-                instance.quantity
-            component = product_component.component
-            component.total -= total_quantity_by_component
-
-            component.save()
+        with transaction.atomic():
+            move_stock(Product, instance.product_id, 'production',
+                       total_new=instance.quantity)
+            bom = ProductComponent.objects.filter(
+                product_id=instance.product_id).values_list('component_id', 'quantity')
+            amounts = consume_components(Component, bom, instance.quantity)
+            record_movements(Component, 'total', {
+                pk: -amount for pk, amount in amounts.items()}, 'consumption')
 
 
 @receiver(post_delete, sender=ProductProduction)
 def delete_component_total(sender, instance, **kwargs):
-    product_components = instance.product.productcomponent_set.all()
-    product = instance.product
-    product.total_new -= instance.quantity
-    product.save()
-
-    for product_component in product_components:
-        total_quantity_by_component = product_component.quantity * instance.quantity
-        component = product_component.component
-        component.total += total_quantity_by_component
-        component.save()
+    with transaction.atomic():
+        move_stock(Product, instance.product_id, 'reversal',
+                   total_new=-instance.quantity)
+        bom = ProductComponent.objects.filter(
+            product_id=instance.product_id).values_list('component_id', 'quantity')
+        amounts = consume_components(Component, bom, -instance.quantity)
+        record_movements(Component, 'total', {
+            pk: -amount for pk, amount in amounts.items()}, 'reversal')
 
 
 @receiver(post_save, sender=Warehouse)
 def add_component_total(sender, instance, created, **kwargs):
     if created:
-        print("qo'shildi" * 88)
-        component = instance.component
-        component.total += instance.quantity
-        component.save()
+        move_stock(Component, instance.component_id, 'arrival',
+                   total=instance.quantity)
 
 
 @receiver(pre_save, sender=Warehouse)
@@ -71,37 +88,32 @@ def update_component_total_on_edit(sender, instance, **kwargs):
     if instance.pk:
         # Warehouse object is being edited (not a new object)
         old_warehouse = Warehouse.objects.get(pk=instance.pk)
-        component = instance.component
-        component.total = component.total - old_warehouse.quantity + instance.quantity
-        component.save()
+        if (old_warehouse.component_id, old_warehouse.quantity) != (instance.component_id, instance.quantity):
+            move_stock(Component, old_warehouse.component_id, 'reversal',
+                       total=-old_warehouse.quantity)
+            move_stock(Component, instance.component_id, 'arrival',
+                       total=instance.quantity)
 
 
 @receiver(post_delete, sender=Warehouse)
 def update_component_total_on_delete(sender, instance, **kwargs):
-    component = instance.component
-    component.total -= instance.quantity
-    component.save()
+    move_stock(Component, instance.component_id, 'reversal',
+               total=-instance.quantity)
 
 
 @receiver(post_save, sender=SalesEvent)
 def sales_create(sender, instance, created, **kwargs):
     if created:
-        try:
-            product = instance.product
-            product.total_new -= instance.quantity_sold
-            product.save()
-
-        except Exception as e:
-            print(e)
+        move_stock(Product, instance.product_id, 'sale',
+                   total_new=-instance.quantity_sold)
 
 
 @receiver(post_delete, sender=SalesEvent)
 def sales_delete(sender, instance, **kwargs):
-    try:
-        product = instance.product
-        product.total_new += instance.quantity_sold
-        product.save()
+    move_stock(Product, instance.product_id, 'reversal',
+               total_new=instance.quantity_sold)
 
+    try:
         sales = instance.sales
         if sales.selling_cut.all().count() == 0:
             sales.delete()
@@ -109,122 +121,48 @@ def sales_delete(sender, instance, **kwargs):
         print(e)
 
 
-@login_required
-def sales_excel_export(request):
-    queryset = Sales.objects.all().order_by('-id')
-
-    # Create a new workbook
-    workbook = Workbook()
-    worksheet = workbook.active
-
-    search_query = request.GET.get('q')
-    if search_query:
-        queryset = queryset.filter(
-            Q(buyer__icontains=search_query) | Q(seller__icontains=search_query))
-
-    filters = request.GET.dict()
-    filters.pop('q', None)
-    filters.pop('o', None)
-    filters.pop('p', None)
-    filters.pop('all', None)
-
-    if filters:
-        queryset = queryset.filter(**filters)
-
-    # Write headers
-    headers = ['Haridor', 'Sotuvchi',
-               'Kesilgan mahsulotlar', 'Narx', 'Xodim', 'Sotilgan sana']
-    worksheet.append(headers)
-
-    # Write data rows
-    for sale in queryset:
-        sales_events = sale.selling_cut.all()
-        cuts = ", ".join(str(
-            sale_event)+f' ({sale_event.single_sold_price} dan)' for sale_event in sales_events)
-
-        total_price = sum(event.total_sold_price for event in sales_events)
-
-        formatted_price = "{:,.1f}".format(total_price)
-
-        row = [
-            sale.buyer,
-            sale.seller,
-            cuts,
-            formatted_price,
-            sale.user.username if sale.user else '-',
-            sale.date.replace(
-                tzinfo=None),  # Remove timezone information
-        ]
-        worksheet.append(row)
-
-    worksheet.column_dimensions['A'].width = 20
-    worksheet.column_dimensions['B'].width = 20
-    worksheet.column_dimensions['C'].width = 100
-    worksheet.column_dimensions['D'].width = 50
-    worksheet.column_dimensions['E'].width = 20
-    worksheet.column_dimensions['F'].width = 20
-    worksheet.column_dimensions['G'].width = 20
-    worksheet.column_dimensions['H'].width = 20
-    # Set the response headers for file download
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=azamat_seh_sales.xlsx'
-
-    # Save workbook to response
-    workbook.save(response)
+@receiver(post_save, sender=Sales)
+@receiver(post_delete, sender=Sales)
+@receiver(post_save, sender=SalesEvent)
+@receiver(post_delete, sender=SalesEvent)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductProduction)
+@receiver(post_delete, sender=ProductProduction)
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+def data_changed(sender, **kwargs):
+    bump_version(sender)
+
+
+@lru_cache(maxsize=None)
+def _plotly_js():
+    content = get_plotlyjs().encode()
+    return content, hashlib.sha256(content).hexdigest()[:16]
+
+
+def plotly_js_url():
+    return reverse('plotly_js', args=[_plotly_js()[1]])
 
+
+def plotly_js(request, digest):
+    """
+    The plotly.js bundle under a content-hashed URL, so browsers download it
+    once and keep it until the plotly package is upgraded.
+    """
+    content, current = _plotly_js()
+    if digest != current:
+        raise Http404
+    response = HttpResponse(content, content_type='text/javascript; charset=utf-8')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
     return response
 
 
 @login_required
-def azamat_production_excel(request):
-    queryset = ProductProduction.objects.all().order_by('-id')
-
-    # Create a new workbook
-    workbook = Workbook()
-    worksheet = workbook.active
-
-    search_query = request.GET.get('q')
-    if search_query:
-        queryset = queryset.filter(Q(series=search_query))
-
-    filters = request.GET.dict()
-    filters.pop('q', None)
-    filters.pop('o', None)
-    filters.pop('p', None)
-    filters.pop('all', None)
-
-    if filters:
-        queryset = queryset.filter(**filters)
-
-    # Write headers
-    headers = ['Produkt', 'Kesilmaganlar soni',
-               'Xodim', 'Ishlab chiqarilish vaqti']
-    worksheet.append(headers)
-
-    # Write data rows
-    for production in queryset:
-        row = [
-            str(production.product),
-            production.quantity,
-            production.user.username,
-            production.date.replace(
-                tzinfo=None),  # Remove timezone information
-        ]
-        worksheet.append(row)
-
-    # Set column width for Arrival Time
-    worksheet.column_dimensions['A'].width = 20
-    worksheet.column_dimensions['B'].width = 20
-    worksheet.column_dimensions['C'].width = 20
-    worksheet.column_dimensions['D'].width = 30
-
-    # Set the response headers for file download
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=azamat_production.xlsx'
-
-    # Save workbook to response
-    workbook.save(response)
+def sales_excel_export(request):
+    return export_changelist(request, Sales)
 
-    return response
+
+@login_required
+def azamat_production_excel(request):
+    return export_changelist(request, ProductProduction)
@@ -0,0 +1,45 @@
+"""
+Bootstrap Django for the standalone benchmark scripts.
+
+Each script is run from the project root, e.g. ``python benchmarks/boot.py``.
+The benchmarks use a throw-away in-memory test database, never db.sqlite3.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'conf.settings')
+os.environ.setdefault('TOKEN', 'benchmark')
+os.environ.setdefault('ADMINS', '0')
+os.environ.setdefault('HOSTNAME', 'http://localhost')
+
+
+def setup():
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+
+
+@contextmanager
+def measure():
+    """Yield a dict filled with elapsed seconds and executed query count."""
+    from django.db import connection
+
+    result = {'queries': 0}
+
+    def count(execute, sql, params, many, context):
+        result['queries'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        start = time.perf_counter()
+        yield result
+        result['seconds'] = time.perf_counter() - start
@@ -0,0 +1,61 @@
+"""
+Recording a production of a product with a 50-component BOM.
+
+Compares the previous per-component read-modify-write loop with the
+set-based ``subtract_component_total`` signal handler.
+"""
+from _django import measure, setup
+
+BOM_SIZE = 50
+PRODUCTIONS = 40
+
+
+def per_component_loop(production):
+    product = production.product
+    product.total_new += production.quantity
+    product.save()
+    for product_component in product.productcomponent_set.all():
+        component = product_component.component
+        component.total -= product_component.quantity * production.quantity
+        component.save()
+
+
+def main():
+    setup()
+
+    from django.db.models.signals import post_save
+
+    from seh_1 import views
+    from seh_1.models import (Component, Product, ProductComponent,
+                              ProductProduction)
+
+    section = Component.objects.create(
+        title='Bench', price=0, measurement='kg')
+    product = Product.objects.create(name='Bench', invalid_price=1, price=1)
+    for i in range(BOM_SIZE):
+        component = Component.objects.create(
+            parent=section, title=f'Bench {i}', price=1, measurement='kg',
+            total=10 ** 9, notification_limit=0)
+        ProductComponent.objects.create(
+            product=product, component=component, quantity=1)
+
+    with measure() as set_based:
+        for _ in range(PRODUCTIONS):
+            ProductProduction.objects.create(
+                series='B', product=product, quantity=1)
+
+    post_save.disconnect(views.subtract_component_total,
+                         sender=ProductProduction)
+    with measure() as loop:
+        for _ in range(PRODUCTIONS):
+            per_component_loop(ProductProduction.objects.create(
+                series='B', product=product, quantity=1))
+
+    print(f'{BOM_SIZE}-component BOM, {PRODUCTIONS} productions')
+    for name, result in (('per-component loop', loop), ('set-based', set_based)):
+        print(f"{name:>20}: {result['queries'] / PRODUCTIONS:6.1f} queries, "
+              f"{result['seconds'] * 1000 / PRODUCTIONS:6.2f} ms per production")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Worker boot cost versus sales table size.
+
+Re-imports the three views modules (what every worker does on start-up)
+with a growing number of un-normalized sales rows in the database.
+"""
+import importlib
+
+from _django import measure, setup
+
+SIZES = (0, 1000, 10000, 50000)
+
+
+def main():
+    setup()
+
+    from Anvaraka_sklad import views as anvaraka_views
+    from Anvaraka_sklad.models import Selling
+    from Azamat_seh import views as azamat_views
+    from Azamat_seh.models import Sales as AzamatSales
+    from seh_1 import views as seh_views
+    from seh_1.models import Sales
+
+    print(f"{'rows':>8} {'queries':>8} {'ms':>8}")
+    seeded = 0
+    for size in SIZES:
+        missing = size - seeded
+        Sales.objects.bulk_create(
+            [Sales(series=str(i), buyer='ali', seller='vali') for i in range(missing)])
+        AzamatSales.objects.bulk_create(
+            [AzamatSales(buyer='ali', seller='vali') for _ in range(missing)])
+        Selling.objects.bulk_create([Selling(buyer='ali') for _ in range(missing)])
+        seeded = size
+
+        with measure() as result:
+            for module in (seh_views, azamat_views, anvaraka_views):
+                importlib.reload(module)
+        print(f"{size:>8} {result['queries']:>8} {result['seconds'] * 1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
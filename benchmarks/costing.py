@@ -0,0 +1,69 @@
+"""
+Costing a 1k product x 200 component catalogue.
+
+Compares the previous per-product ``productcomponent_set`` loop (as used by
+``ProductAdmin.tannarx`` and ``export_excel``) with the sparse matrix engine
+in ``seh_1.costing``, and times a material requirements report for a plan
+covering the whole catalogue.
+"""
+import random
+
+from _django import measure, setup
+
+PRODUCTS = 1000
+COMPONENTS = 200
+BOM_SIZE = 20
+
+
+def per_product_loop(products):
+    costs = {}
+    for product in products:
+        product_price = 0
+        for productcomponent in product.productcomponent_set.all():
+            product_price += productcomponent.quantity*productcomponent.component.price
+        costs[product.pk] = product_price
+    return costs
+
+
+def main():
+    setup()
+
+    from seh_1.costing import catalogue_costs
+    from seh_1.reports import material_requirements
+    from seh_1.models import Component, Product, ProductComponent
+
+    rng = random.Random(8)
+    section = Component.objects.create(
+        title='Bench', price=0, measurement='kg')
+    components = Component.objects.bulk_create([Component(
+        parent=section, title=f'Bench {i}', price=rng.uniform(1, 100),
+        measurement='kg', tree_id=section.tree_id, level=1, lft=0, rght=0)
+        for i in range(COMPONENTS)])
+    products = Product.objects.bulk_create([Product(
+        name=f'Bench {i}', invalid_price=1, price=1) for i in range(PRODUCTS)])
+    ProductComponent.objects.bulk_create([ProductComponent(
+        product=product, component=component, quantity=rng.uniform(0.1, 5))
+        for product in products
+        for component in rng.sample(components, BOM_SIZE)], batch_size=2000)
+
+    with measure() as loop:
+        expected = per_product_loop(Product.objects.all())
+    with measure() as matrix:
+        costs = catalogue_costs(Component, ProductComponent)
+
+    plan = {product.pk: rng.randint(0, 500) for product in products}
+    with measure() as requirements:
+        material_requirements('seh_1', plan)
+
+    assert all(abs(costs[pk] - cost) < 1e-6 for pk, cost in expected.items())
+
+    print(f'{PRODUCTS} products x {COMPONENTS} components, {BOM_SIZE} per BOM')
+    for name, result in (('per-product loop', loop), ('sparse matrix', matrix)):
+        print(f"{name:>20}: {result['queries']:6d} queries, "
+              f"{result['seconds'] * 1000:8.1f} ms")
+    print(f"{'requirements':>20}: {requirements['queries']:6d} queries, "
+          f"{requirements['seconds'] * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
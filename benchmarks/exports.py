@@ -0,0 +1,115 @@
+"""
+Peak memory of the sales export versus the number of exported rows.
+
+    python benchmarks/exports.py [rows ...]
+
+Every measurement runs in a fresh process that seeds the sales table and
+then downloads the export through the test client. The growth of the
+peak RSS over the seeded process is reported for the streaming view and
+for the same rows written the way the views used to: a regular openpyxl
+``Workbook`` over the whole queryset, saved into memory.
+"""
+import gc
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from _django import setup
+
+SIZES = (10000, 50000, 150000)
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed(rows):
+    from django.db import connection
+
+    # Inserted by SQLite itself, so seeding does not raise the peak RSS.
+    summary = json.dumps([{'quantity': 2, 'product': 'Stretch', 'price': 10.0}])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < %s) '
+            'INSERT INTO seh_1_sales (series, buyer, seller, date, total_price, '
+            'total_profit, cut_summary, uncut_summary) '
+            "SELECT i, 'Buyer ' || (i %% 1000), 'Seller ' || (i %% 100), "
+            "datetime('now', '-' || i || ' minutes'), 120, 20, %s, %s FROM n",
+            [rows, summary, summary])
+
+
+def in_memory_export():
+    from io import BytesIO
+
+    from openpyxl import Workbook
+
+    from seh_1.models import Sales
+
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(['Haridor', 'Sotuvchi', 'Kesilgan mahsulotlar',
+                      'Kesilmagan mahsulotlar', 'Narx', 'Xodim', 'Sotilgan sana'])
+    for sale in Sales.objects.select_related('user'):
+        worksheet.append([
+            sale.buyer, sale.seller,
+            Sales.summary_text(sale.cut_summary, ''),
+            Sales.summary_text(sale.uncut_summary, ''),
+            "{:,.1f}".format(sale.total_price),
+            sale.user.username if sale.user else '-',
+            sale.date.replace(tzinfo=None),
+        ])
+    output = BytesIO()
+    workbook.save(output)
+    return len(output.getvalue())
+
+
+def streaming_export():
+    import tempfile
+
+    from django.contrib.auth.models import User
+    from django.test import Client, override_settings
+    from django.urls import reverse
+
+    from seh_1.exports import build_pending_exports
+
+    client = Client()
+    client.force_login(User.objects.create_superuser('bench-admin', password='x'))
+    # The request queues the job; build it here as build_exports does.
+    with tempfile.TemporaryDirectory() as root, override_settings(EXPORT_ROOT=root):
+        client.get(reverse('sales_export_excel'))
+        build_pending_exports()
+        response = client.get(reverse('sales_export_excel'))
+        return sum(len(chunk) for chunk in response.streaming_content)
+
+
+def child(mode, rows):
+    setup()
+    seed(rows)
+    gc.collect()
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    size = {'streaming': streaming_export, 'in-memory': in_memory_export}[mode]()
+    print(json.dumps({'seconds': time.perf_counter() - start,
+                      'peak_mb': peak_rss_mb() - before, 'size': size}))
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+    print(f"{'rows':>8} {'mode':>10} {'peak RSS +MB':>13} {'s':>7} {'xlsx MB':>8}")
+    for rows in sizes:
+        for mode in ('in-memory', 'streaming'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--child', mode, str(rows)],
+                check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{rows:>8} {mode:>10} {result['peak_mb']:>13.1f} "
+                  f"{result['seconds']:>7.1f} {result['size'] / 2 ** 20:>8.1f}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
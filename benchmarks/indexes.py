@@ -0,0 +1,157 @@
+"""
+Admin changelist filters on seeded seh_1 tables, without and with the
+``Meta.indexes``: EXPLAIN QUERY PLAN and median latency of each query.
+
+    python benchmarks/indexes.py [rows]
+
+``rows`` is the number of rows seeded into each of the Sales,
+ProductProduction and Warehouse tables (default 100000, up to 1000000).
+The querysets come from the real admin ChangeList, so they carry the same
+date hierarchy ranges, list_filter lookups and ordering as the pages.
+"""
+import statistics
+import sys
+import time
+
+from _django import setup
+
+ROWS = 100_000
+USERS = 20
+PRODUCTS = 200
+COMPONENTS = 200
+BUYERS = 1000
+SELLERS = 100
+SERIES = 500
+DAYS = 3 * 365
+REPEAT = 5
+
+
+def seed(rows):
+    from django.contrib.auth.models import User
+    from django.db import connection
+
+    from seh_1.models import (Component, Customer, Product,
+                              ProductProduction, Sales, Warehouse)
+    from seh_1.utils import link_customers
+
+    users = User.objects.bulk_create(
+        [User(username=f'bench{i}') for i in range(USERS)])
+    section = Component.objects.create(title='Bench', price=0, measurement='kg')
+    components = Component.objects.bulk_create([Component(
+        parent=section, title=f'Bench {i}', price=1, measurement='kg',
+        tree_id=section.tree_id, level=1, lft=0, rght=0) for i in range(COMPONENTS)])
+    products = Product.objects.bulk_create([Product(
+        name=f'Bench {i}', invalid_price=1, price=1) for i in range(PRODUCTS)])
+
+    Sales.objects.bulk_create((Sales(
+        series=f'S{n % SERIES}', buyer=f'Buyer {n * 7 % BUYERS}',
+        seller=f'Seller {n * 3 % SELLERS}', user=users[n % USERS])
+        for n in range(rows)), batch_size=5000)
+    link_customers(Customer, Sales.objects.all(), {
+        'buyer_customer': 'buyer', 'seller_customer': 'seller'})
+    ProductProduction.objects.bulk_create((ProductProduction(
+        series=f'S{n % SERIES}', product=products[n * 13 % PRODUCTS],
+        user=users[n % USERS], quantity=1) for n in range(rows)), batch_size=5000)
+    Warehouse.objects.bulk_create((Warehouse(
+        component=components[n * 11 % COMPONENTS], user=users[n % USERS],
+        quantity=1) for n in range(rows)), batch_size=5000)
+
+    # auto_now_add stamps every seeded row with the same instant; spread them
+    # over the last three years instead.
+    with connection.cursor() as cursor:
+        for model, field in ((Sales, 'date'), (ProductProduction, 'date'),
+                             (Warehouse, 'arrival_time')):
+            cursor.execute(
+                f'UPDATE {connection.ops.quote_name(model._meta.db_table)} '
+                f'SET {connection.ops.quote_name(field)} = '
+                f"datetime('now', '-' || (id * 7919 % {DAYS * 86400}) || ' seconds')")
+    return users, products, components
+
+
+def cases(users, products, components):
+    from django.utils import timezone
+
+    from seh_1.models import Customer, ProductProduction, Sales, Warehouse
+
+    buyer = Customer.objects.get(key='buyer 7')
+    today = timezone.now()
+    month = f'date__year={today.year}&date__month={today.month}'
+    return [
+        ('sales: month page', Sales, f'?{month}'),
+        ('sales: buyer', Sales, f'?buyer_customer__id__exact={buyer.pk}'),
+        ('sales: user + year', Sales, f'?user__id__exact={users[3].pk}&date__year={today.year}'),
+        ('production: product + month', ProductProduction,
+         f'?product__id__exact={products[5].pk}&{month}'),
+        ('production: series', ProductProduction, '?series__exact=S42'),
+        ('warehouse: component + year', Warehouse,
+         f'?component__id__exact={components[9].pk}&arrival_time__year={today.year}'),
+    ]
+
+
+def changelist_queryset(model, query_string, user):
+    from django.contrib import admin
+    from django.test import RequestFactory
+
+    request = RequestFactory().get('/' + query_string)
+    request.user = user
+    changelist = admin.site._registry[model].get_changelist_instance(request)
+    return changelist.queryset
+
+
+def median_ms(run):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def measure(label, queries):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    print(f'\n== {label}')
+    for name, queryset in queries:
+        page = queryset[:100]
+        plan = page.explain().replace('\n', '\n' + ' ' * 18)
+        print(f'{name}\n  plan (page):    {plan}')
+        print(f'  page: {median_ms(lambda: list(page.all())):8.2f} ms   '
+              f'count: {median_ms(queryset.count):8.2f} ms')
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    rows = min(rows, 1_000_000)
+    setup()
+
+    from django.contrib.auth.models import User
+    from django.db import connection
+
+    from seh_1.models import ProductProduction, Sales, Warehouse
+
+    start = time.perf_counter()
+    users, products, components = seed(rows)
+    print(f'seeded {rows} rows per table in {time.perf_counter() - start:.1f} s')
+
+    admin_user = User.objects.create_superuser('bench-admin', password='x')
+    queries = [(name, changelist_queryset(model, query_string, admin_user))
+               for name, model, query_string in cases(users, products, components)]
+
+    models = (Sales, ProductProduction, Warehouse)
+    with connection.schema_editor() as editor:
+        for model in models:
+            for index in model._meta.indexes:
+                editor.remove_index(model, index)
+    measure('without Meta.indexes', queries)
+
+    with connection.schema_editor() as editor:
+        for model in models:
+            for index in model._meta.indexes:
+                editor.add_index(model, index)
+    measure('with Meta.indexes', queries)
+
+
+if __name__ == '__main__':
+    main()
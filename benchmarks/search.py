@@ -0,0 +1,70 @@
+"""
+Sales changelist search versus table size: the default ``icontains`` search
+(``LIKE '%q%'`` over buyer and seller) against the FTS5 trigram index, for
+the first page and the count of the results.
+
+    python benchmarks/search.py
+"""
+import statistics
+import time
+
+from _django import setup
+
+SIZES = (1000, 10000, 100000, 300000)
+BUYERS = 5000
+TERMS = ('buyer 4217', '421', 'ozod')
+REPEAT = 5
+
+
+def median_ms(run):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    setup()
+
+    from django.contrib import admin
+    from django.test import RequestFactory
+
+    from seh_1.models import Sales
+    from seh_1.search import FullTextSearchMixin
+
+    model_admin = admin.site._registry[Sales]
+    index = model_admin.search_index
+    request = RequestFactory().get('/')
+
+    def like(term):
+        queryset, _ = super(FullTextSearchMixin, model_admin).get_search_results(
+            request, Sales.objects.all(), term)
+        return queryset
+
+    def fts(term):
+        return index.filter(Sales.objects.all(), term)
+
+    def page(queryset):
+        return lambda: list(queryset.order_by('-pk')[:100])
+
+    print(f"{'rows':>8} {'term':>12} {'page: like':>11} {'fts':>7} "
+          f"{'count: like':>12} {'fts':>7}  (ms)")
+    seeded = 0
+    for size in SIZES:
+        # bulk_create skips the signals, so the index is rebuilt afterwards.
+        Sales.objects.bulk_create((Sales(
+            series=str(n), buyer=f'Buyer {n * 7 % BUYERS}', seller=f'Seller {n % 100}')
+            for n in range(seeded, size)), batch_size=5000)
+        seeded = size
+        index.refresh()
+        for term in TERMS:
+            assert like(term).count() == fts(term).count()
+            print(f'{size:>8} {term:>12} {median_ms(page(like(term))):>11.2f} '
+                  f'{median_ms(page(fts(term))):>7.2f} '
+                  f'{median_ms(like(term).count):>12.2f} {median_ms(fts(term).count):>7.2f}')
+
+
+if __name__ == '__main__':
+    main()
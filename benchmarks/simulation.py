@@ -0,0 +1,71 @@
+"""
+Full-catalogue what-if simulation: every component price raised by 10% on a
+1k product x 200 component catalogue with a year of sales history.
+"""
+import random
+from datetime import timedelta
+
+from _django import measure, setup
+
+PRODUCTS = 1000
+COMPONENTS = 200
+BOM_SIZE = 20
+SALES = 5000
+EVENTS_PER_SALE = 20
+
+
+def main():
+    setup()
+
+    from django.core.cache import cache
+    from django.utils import timezone
+
+    from seh_1.models import (Component, Product, ProductComponent, Sales,
+                              SalesEvent)
+    from seh_1.reports import price_simulation
+
+    rng = random.Random(10)
+    section = Component.objects.create(
+        title='Bench', price=0, measurement='kg')
+    components = Component.objects.bulk_create([Component(
+        parent=section, title=f'Bench {i}', price=rng.uniform(1, 100),
+        measurement='kg', tree_id=section.tree_id, level=1, lft=0, rght=0)
+        for i in range(COMPONENTS)])
+    products = Product.objects.bulk_create([Product(
+        name=f'Bench {i}', invalid_price=1, price=rng.uniform(500, 2000))
+        for i in range(PRODUCTS)])
+    ProductComponent.objects.bulk_create([ProductComponent(
+        product=product, component=component, quantity=rng.uniform(0.1, 5))
+        for product in products
+        for component in rng.sample(components, BOM_SIZE)], batch_size=2000)
+
+    now = timezone.now()
+    sales = Sales.objects.bulk_create([Sales(
+        series='B', buyer='Bench', seller='Bench') for _ in range(SALES)])
+    for sale in sales:
+        sale.date = now - timedelta(days=rng.randint(0, 365))
+    Sales.objects.bulk_update(sales, ['date'], batch_size=1000)
+    SalesEvent.objects.bulk_create([SalesEvent(
+        product=product, sales=sale, quantity_sold=rng.randint(1, 50),
+        single_sold_price=1, total_sold_price=rng.uniform(100, 10000),
+        profit=rng.uniform(0, 1000))
+        for sale in sales for product in rng.sample(products, EVENTS_PER_SALE)],
+        batch_size=2000)
+
+    prices = {component.pk: component.price * 1.1 for component in components}
+    since = now - timedelta(days=90)
+
+    cache.clear()
+    with measure() as cold:
+        result = price_simulation('seh_1', prices, since)
+    with measure() as warm:
+        price_simulation('seh_1', prices, since)
+
+    print(f'{PRODUCTS} products x {COMPONENTS} components, '
+          f'{SALES * EVENTS_PER_SALE} sales events, {len(result["rows"])} products affected')
+    for name, run in (('cold cache', cold), ('warm cache', warm)):
+        print(f"{name:>12}: {run['queries']:3d} queries, {run['seconds'] * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
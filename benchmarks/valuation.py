@@ -0,0 +1,57 @@
+"""
+Point-in-time stock valuation over a year of ledger history.
+
+Seeds a year of daily movements for every seh_1 component, takes the daily
+snapshots and times stock_valuation() at a few moments of that year.
+"""
+import random
+from datetime import timedelta
+
+from _django import measure, setup
+
+COMPONENTS = 200
+DAYS = 365
+MOVEMENTS_PER_DAY = 5
+
+
+def main():
+    setup()
+
+    from django.contrib.contenttypes.models import ContentType
+    from django.utils import timezone
+
+    from seh_1.ledger import day_start, take_snapshots
+    from seh_1.models import Component, StockMovement
+    from seh_1.reports import stock_valuation
+
+    section = Component.objects.create(
+        title='Bench', price=0, measurement='kg')
+    components = [Component.objects.create(
+        parent=section, title=f'Bench {i}', price=1, measurement='kg')
+        for i in range(COMPONENTS)]
+    content_type = ContentType.objects.get_for_model(Component)
+
+    first_day = timezone.localdate() - timedelta(days=DAYS)
+    for offset in range(DAYS):
+        start = day_start(first_day + timedelta(days=offset))
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                content_type=content_type, object_id=component.pk,
+                counter='total', reason='arrival', quantity=random.randint(-50, 100),
+                date=start + timedelta(minutes=random.randint(0, 24 * 60 - 1)))
+            for component in components for _ in range(MOVEMENTS_PER_DAY)
+        ])
+        take_snapshots(first_day + timedelta(days=offset))
+
+    print(f'{StockMovement.objects.count()} movements, '
+          f'{COMPONENTS} components, {DAYS} daily snapshots')
+    for days_ago in (300, 180, 30, 1, 0):
+        when = timezone.now() - timedelta(days=days_ago, hours=5)
+        with measure() as result:
+            stock_valuation(when)
+        print(f"{when:%Y-%m-%d %H:%M}: {result['queries']} queries, "
+              f"{result['seconds'] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -21,6 +21,7 @@ env.read_env()
 TOKEN = env.str('TOKEN')
 ADMINS = env.list('ADMINS')
 HOSTNAME = env.str('HOSTNAME')
+TELEGRAM_API_URL = env.str('TELEGRAM_API_URL', 'https://api.telegram.org')
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -205,6 +206,11 @@ STATIC_URL = '/static/'
 #     os.path.join(BASE_DIR, 'staticfiles'),
 # ]
 
+# XLSX exports are kept here. They are built by `manage.py build_exports
+# --loop`, which runs next to the web app (an always-on task on
+# PythonAnywhere); the admin only queues them.
+EXPORT_ROOT = BASE_DIR / 'exports'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -5,16 +5,28 @@ from django.contrib import admin
 from django.contrib.admin import AdminSite
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from django.db.models import F, Sum
+from django.db.models import Count, F, Prefetch, Q, Sum
 from django.utils import timezone
+from openpyxl.styles import Alignment
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from mptt.admin import DraggableMPTTAdmin
 from django.contrib import messages
-
-from .models import (Component, CuttingEvent, Product, ProductComponent,
-                     ProductProduction, ProductReProduction, Sales, SalesEvent,
-                     SalesEvent2, Warehouse)
+from django.apps import apps
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import get_object_or_404, render
+from django.urls import path
+
+from .changelist import (ComputedColumnsMixin, ConditionalChangelistMixin,
+                         KeysetPaginationMixin, ReferencedFieldListFilter,
+                         SubtreeAggregatesMixin, computed_column)
+from .costing import catalogue_costs, recalculate_unit_costs
+from .exports import ExportAdminMixin, ExportSpec, export_file_response, naive
+from .ledger import StockAdjustmentAdminMixin
+from .models import (Component, Customer, CuttingEvent, ExportJob, Product,
+                     ProductComponent, ProductProduction, ProductReProduction,
+                     Sales, SalesEvent, SalesEvent2, Warehouse)
+from .search import FullTextSearchMixin
 from .views import export_warehouse_excel
 
 
@@ -72,13 +84,26 @@ admin.site.unregister(User)  # Unregister the default UserAdmin
 admin.site.register(User, CustomUserAdmin)
 
 
-class ComponentAdmin(DraggableMPTTAdmin):
+class ComponentAdmin(ExportAdminMixin, FullTextSearchMixin, SubtreeAggregatesMixin, StockAdjustmentAdminMixin, DraggableMPTTAdmin):
     mptt_indent_field = "title"
+    stock_counters = ('total',)
+    subtree_aggregates = {
+        'subtree_price': Sum(F('price') * F('total')),
+        'subtree_low_stock': Count('pk', filter=Q(total__lt=F('notification_limit'))),
+    }
     list_filter = ('parent',)
     autocomplete_fields = ('parent',)
     search_fields = ('title',)
 
     change_list_template = 'admin/component_change_list.html'
+    export_spec = ExportSpec(
+        'component.xlsx',
+        [('Bo\'lim', 'parent__title'),
+         ('Nomi', 'title'),
+         ('Narxi', lambda component: str(component.price)+'$'),
+         ('O\'lchov birligi', 'measurement'),
+         ('Umumiy', 'total')],
+        select_related=['parent'], filter=Q(parent__isnull=False), widths=[20] * 8)
 
     def changelist_view(self, request, extra_context=None):
         response = super().changelist_view(request, extra_context=extra_context)
@@ -122,9 +147,8 @@ class ComponentAdmin(DraggableMPTTAdmin):
                     'highlight_total', 'measurement')
 
     def get_total_price(self, obj):
-        if not obj.parent:
-            total_child_price = obj.children.annotate(total_price=F(
-                'price') * F('total')).aggregate(total=Sum('total_price'))['total'] or 0
+        if not obj.parent_id:
+            total_child_price = obj.subtree_price or 0
             return "{:,.2f}".format(total_child_price).rstrip("0").rstrip(".")+'$'
         formatted_price = "{:,.2f}".format(
             obj.total * obj.price).rstrip("0").rstrip(".")
@@ -133,7 +157,7 @@ class ComponentAdmin(DraggableMPTTAdmin):
     get_total_price.short_description = 'Mavjud komponent narxi'
 
     def get_price(self, obj):
-        if not obj.parent:
+        if not obj.parent_id:
             return '-'
         formatted_price = "{:,.2f}".format(obj.price).rstrip("0").rstrip(".")
         return formatted_price+'$'
@@ -141,14 +165,14 @@ class ComponentAdmin(DraggableMPTTAdmin):
     get_price.admin_order_field = 'price'
 
     def highlight_total(self, obj):
-        if obj.parent:
+        if obj.parent_id:
             if obj.total < obj.notification_limit:  # Specify your desired threshold value here
                 return format_html(
                     '<span style="background-color:#FF0E0E; color:white; padding: 2px 5px;">{}</span>',
                     str(obj.total)+' '+obj.measurement
                 )
             return "{:,.1f}".format(obj.total).rstrip("0").rstrip(".")+' '+obj.measurement
-        elif not obj.parent and obj.highlight:
+        elif not obj.parent_id and obj.subtree_low_stock:
             return format_html('<span style="background-color:#FF0E0E; color:white; padding: 2px 10px;">-</span>')
 
     highlight_total.short_description = 'Umumiy'
@@ -164,10 +188,28 @@ class ProductComponentInline(admin.TabularInline):
     verbose_name = 'komponent'
 
 
-class ProductAdmin(admin.ModelAdmin):
+class ProductExportSpec(ExportSpec):
+    def get_columns(self, queryset):
+        costs = catalogue_costs(Component, ProductComponent, queryset.values('pk'))
+        return [
+            ('Nomi', 'name'),
+            ('Tan narxi', lambda product: "{:,.1f}".format(costs.get(product.pk, 0))+'$'),
+            ('Sotuv narxi', lambda product: str(product.price)+'$'),
+            ('Kesilmaganlar soni', 'total_new'),
+            ('Kesilganlar soni', 'total_cut'),
+            ('Mavjud tovar narxi', lambda product: "{:,.1f}".format(
+                (product.total_new + product.total_cut)*product.price)),
+        ]
+
+
+class ProductAdmin(ExportAdminMixin, FullTextSearchMixin, StockAdjustmentAdminMixin, admin.ModelAdmin):
     inlines = [ProductComponentInline]
+    stock_counters = ('total_new', 'total_cut')
+    actions = ['recalculate_costs']
     list_filter = ['name']
     search_fields = ('name',)
+    export_spec = ProductExportSpec('products.xlsx', widths=[20] * 8,
+                                    depends_on=[Product, Component, ProductComponent])
 
     def get_fieldsets(self, request, obj=None):
         fieldsets = (
@@ -201,19 +243,21 @@ class ProductAdmin(admin.ModelAdmin):
     non_sold_price.admin_order_field = 'non_sold_price'
 
     def tannarx(self, obj):
-        product_price = 0
-        for productcomponent in obj.productcomponent_set.all():
-            product_price += productcomponent.quantity*productcomponent.component.price
-        return "{:,.2f}".format(product_price)+'$'
+        return "{:,.2f}".format(obj.unit_cost)+'$'
     tannarx.short_description = 'Tan narxi'
-    tannarx.admin_order_field = 'single_product_price'
+    tannarx.admin_order_field = 'unit_cost'
+
+    @admin.action(description='Tan narxlarini qayta hisoblash', permissions=['costing'])
+    def recalculate_costs(self, request, queryset):
+        updated = recalculate_unit_costs(queryset, Component, ProductComponent)
+        self.message_user(
+            request, f"{queryset.count()} ta tovar tekshirildi, {updated} ta tan narxi yangilandi.", messages.SUCCESS)
+
+    def has_costing_permission(self, request):
+        return request.user.is_superuser
 
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
-        queryset = queryset.annotate(
-            single_product_price=Sum(
-                F('productcomponent__quantity') * F('productcomponent__component__price'))
-        )
         queryset = queryset.annotate(
             non_sold_price=Sum(
                 F('price') * (F('total_new')+F('total_cut')))
@@ -244,16 +288,27 @@ class ProductAdmin(admin.ModelAdmin):
         return response
 
 
-class ProductProductionAdmin(admin.ModelAdmin):
-    search_fields = ('title',)
+class ProductProductionAdmin(ConditionalChangelistMixin, ExportAdminMixin, KeysetPaginationMixin, admin.ModelAdmin):
+    search_fields = ('=series',)
+    etag_models = (ProductProduction, Product)
 
     list_display = ('get_title', 'quantity', 'user', 'date')
     list_filter = ('user', 'product', 'date', 'series')
     readonly_fields = ('user', 'date',)
     # exclude = ['cutting_complate']
     date_hierarchy = 'date'
+    ordering = ('-date',)
     list_display_links = ('get_title',)
     change_list_template = 'admin/production_change_list.html'
+    export_spec = ExportSpec(
+        'production.xlsx',
+        [('Seriya', 'series'),
+         ('Produkt', lambda production: str(production.product)),
+         ('Kesilmaganlar soni', 'quantity'),
+         ('Xodim', 'user__username'),
+         ('Ishlab chiqarilish vaqti', lambda production: naive(production.date))],
+        select_related=['product', 'user'], widths=[20, 20, 20, 20, 20, 20, 30, 20],
+        depends_on=[ProductProduction, Product])
 
     def changelist_view(self, request, extra_context=None):
         current_month = timezone.now().month
@@ -286,13 +341,23 @@ class ProductProductionAdmin(admin.ModelAdmin):
         return super().has_change_permission(request, obj)
 
 
-class WarehouseAdmin(admin.ModelAdmin):
+class WarehouseAdmin(ConditionalChangelistMixin, ExportAdminMixin, KeysetPaginationMixin, admin.ModelAdmin):
     list_filter = ('arrival_time', 'component')
+    etag_models = (Warehouse, Component)
     date_hierarchy = 'arrival_time'
     ordering = ('-arrival_time',)
     exclude = ('user', 'price')
 
     change_list_template = 'admin/warehouse_change_list.html'
+    export_spec = ExportSpec(
+        'warehouse.xlsx',
+        [('Komponent', lambda warehouse: str(warehouse.component)),
+         ('Miqdori', 'quantity'),
+         ('Keltirilgan narxi', 'price'),
+         ('Keltirilgan vaqti', lambda warehouse: naive(warehouse.arrival_time)),
+         ('Xodim', 'user__username')],
+        select_related=['component', 'user'], widths=[20] * 8,
+        alignment=Alignment(horizontal='left'), depends_on=[Warehouse, Component])
 
     def get_list_display(self, request):
         if request.user.is_superuser:
@@ -359,16 +424,28 @@ class CuttingEventInline(admin.TabularInline):
     autocomplete_fields = ('product_reproduction',)
 
 
-class ProductReProductionAdmin(admin.ModelAdmin):
+class ProductReProductionAdmin(ConditionalChangelistMixin, ExportAdminMixin, FullTextSearchMixin, ComputedColumnsMixin, admin.ModelAdmin):
+    etag_models = (ProductReProduction, CuttingEvent, Product)
     inlines = [CuttingEventInline]
     list_display = ['user', 'total_cut',
                     'get_cutting_events', 'date']
+    list_select_related = ['user']
     search_fields = ['user__username']
     list_filter = ['user', 'date']
     date_hierarchy = 'date'
     readonly_fields = ('user', 'date')
 
     change_list_template = 'admin/reproduction_change_list.html'
+    export_spec = ExportSpec(
+        'reproduction.xlsx',
+        [('Xodim', 'user__username'),
+         ('Umumiy kesilganlar', 'total_cut'),
+         ('Kesilgan mahsulotlar', 'get_cutting_events'),
+         ('Kesilgan vaqti', lambda reproduction: naive(reproduction.date))],
+        select_related=['user'],
+        prefetch_related=[Prefetch('cutting', queryset=CuttingEvent.objects.select_related('product'))],
+        widths=[20, 20, 50, 20, 20, 20, 20, 20],
+        depends_on=[ProductReProduction, CuttingEvent, Product])
 
     def changelist_view(self, request, extra_context=None):
         current_month = timezone.now().month
@@ -383,25 +460,20 @@ class ProductReProductionAdmin(admin.ModelAdmin):
 
         return super().changelist_view(request, extra_context)
 
+    @computed_column(prefetch=[Prefetch(
+        'cutting', queryset=CuttingEvent.objects.select_related('product'))])
     def get_cutting_events(self, obj):
         cutting_events = obj.cutting.all()
         return ", ".join(str(str(cutting_event.quantity_cut) + ' ta ' + cutting_event.product.name) for cutting_event in cutting_events)
     get_cutting_events.short_description = 'Kesilgan  mahsulotlar'
 
+    @computed_column(annotations={'total_cut': Sum('cutting__quantity_cut')})
     def total_cut(self, obj):
-        total_cut = 0
-        for cuttingevent in obj.cutting.all():
-            total_cut += cuttingevent.quantity_cut
-        return total_cut
+        return obj.total_cut or 0
 
     total_cut.short_description = 'Umumiy kesilganlar'
     total_cut.admin_order_field = 'total_cut'
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        queryset = queryset.annotate(total_cut=Sum('cutting__quantity_cut'))
-        return queryset
-
     def save_model(self, request, obj, form, change):
         obj.user = request.user
         super().save_model(request, obj, form, change)
@@ -450,15 +522,30 @@ class SalesEventInline2(admin.TabularInline):
         return fields
 
 
-class SalesAdmin(admin.ModelAdmin):
+class SalesAdmin(ConditionalChangelistMixin, ExportAdminMixin, FullTextSearchMixin, KeysetPaginationMixin, admin.ModelAdmin):
     inlines = [SalesEventInline, SalesEventInline2]
-    list_filter = ['seller', 'buyer', 'user', 'date']
+    etag_models = (Sales, SalesEvent, SalesEvent2, Product)
+    list_filter = [('seller_customer', ReferencedFieldListFilter),
+                   ('buyer_customer', ReferencedFieldListFilter), 'user', 'date']
+    list_select_related = ['user']
     search_fields = ['buyer', 'seller']
     date_hierarchy = 'date'
+    ordering = ('-date',)
     # readonly_fields = ('seller',)
     exclude = ('user',)
 
     change_list_template = 'admin/sales_change_list.html'
+    export_spec = ExportSpec(
+        'sales.xlsx',
+        [('Haridor', 'buyer'),
+         ('Sotuvchi', 'seller'),
+         ('Kesilgan mahsulotlar', lambda sale: Sales.summary_text(sale.cut_summary, '')),
+         ('Kesilmagan mahsulotlar', lambda sale: Sales.summary_text(sale.uncut_summary, '')),
+         ('Narx', lambda sale: "{:,.1f}".format(sale.total_price)),
+         ('Xodim', lambda sale: sale.user.username if sale.user else '-'),
+         ('Sotilgan sana', lambda sale: naive(sale.date))],
+        select_related=['user'], widths=[20, 20, 50, 50, 20, 20, 20, 20],
+        depends_on=[Sales, SalesEvent, SalesEvent2, Product])
 
     def changelist_view(self, request, extra_context=None):
         current_month = timezone.now().month
@@ -478,10 +565,10 @@ class SalesAdmin(admin.ModelAdmin):
         except:
             queryset = self.get_queryset(request)
 
-        total_price = queryset.aggregate(
-            total_price=Sum('selling_cut__total_sold_price'))['total_price']
-        total_profit = queryset.aggregate(
-            total_profit=Sum('selling_cut__profit'))['total_profit']
+        totals = queryset.aggregate(
+            total_price=Sum('total_price'), total_profit=Sum('total_profit'))
+        total_price = totals['total_price'] or 0
+        total_profit = totals['total_profit'] or 0
 
         try:
             response.context_data['total_price'] = "{:,.1f}".format(
@@ -502,50 +589,38 @@ class SalesAdmin(admin.ModelAdmin):
                     'get_sales_events_user', 'get_sales_event2s_user', 'user', 'date']
 
     def get_total_price(self, obj):
-        sales_events = obj.selling_cut.all()
-        total_price = sum(event.total_sold_price for event in sales_events)
-
-        sales_events2 = obj.selling.all()
-        total_price2 = sum(event.total_sold_price for event in sales_events2)
         formatted_price = "{:,.2f}".format(
-            total_price + total_price2).rstrip("0").rstrip(".")
+            obj.total_price).rstrip("0").rstrip(".")
         return formatted_price+'$'
 
     get_total_price.short_description = 'Umumiy narx'
+    get_total_price.admin_order_field = 'total_price'
 
     def get_total_profit(self, obj):
-        sales_events = obj.selling_cut.all()
-        total_price = sum(event.profit for event in sales_events)
-
-        sales_events2 = obj.selling.all()
-        total_price2 = sum(event.profit for event in sales_events2)
         formatted_price = "{:,.2f}".format(
-            total_price + total_price2).rstrip("0").rstrip(".")
+            obj.total_profit).rstrip("0").rstrip(".")
         return formatted_price+'$'
 
     get_total_profit.short_description = 'Umumiy foyda'
+    get_total_profit.admin_order_field = 'total_profit'
 
     def get_sales_events(self, obj):
-        sales_events = obj.selling_cut.all()
-        return ", ".join(str(sale_event)+f' ({sale_event.single_sold_price}$ dan)' for sale_event in sales_events)
+        return Sales.summary_text(obj.cut_summary, '$')
 
     get_sales_events.short_description = 'Kesilgan mahsulotlar'
 
     def get_sales_events_user(self, obj):
-        sales_events = obj.selling_cut.all()
-        return ", ".join(str(sale_event) for sale_event in sales_events)
+        return Sales.summary_text(obj.cut_summary)
 
     get_sales_events_user.short_description = 'Kesilgan mahsulotlar'
 
     def get_sales_event2s(self, obj):
-        sales_event2s = obj.selling.all()
-        return ", ".join(str(sale_event2)+f' ({sale_event2.single_sold_price}$ dan)' for sale_event2 in sales_event2s)
+        return Sales.summary_text(obj.uncut_summary, '$')
 
     get_sales_event2s.short_description = 'Kesilmagan mahsulotlar'
 
     def get_sales_event2s_user(self, obj):
-        sales_event2s = obj.selling.all()
-        return ", ".join(str(sale_event2) for sale_event2 in sales_event2s)
+        return Sales.summary_text(obj.uncut_summary)
 
     get_sales_event2s_user.short_description = 'Kesilmagan mahsulotlar'
 
@@ -565,7 +640,88 @@ class SalesAdmin(admin.ModelAdmin):
         return False
 
 
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+    # Customers are created from the buyer/seller names of the sales.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'model', 'query', 'status', 'get_progress',
+                    'user', 'created', 'get_download')
+    list_filter = ('status', 'model')
+    list_select_related = ('user',)
+
+    # Jobs are created by the export buttons of the changelists.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if not request.user.is_superuser:
+            queryset = queryset.filter(user=request.user)
+        return queryset
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/status/', self.admin_site.admin_view(self.status_view),
+                 name='seh_1_exportjob_status'),
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view, cacheable=True),
+                 name='seh_1_exportjob_download'),
+            *super().get_urls(),
+        ]
+
+    def get_job(self, request, pk):
+        # Users asking for the same export share its job, so any user who
+        # can view the exported model may follow it.
+        job = get_object_or_404(ExportJob, pk=pk)
+        model_admin = self.admin_site._registry.get(apps.get_model(job.model))
+        if model_admin is None or not model_admin.has_view_or_change_permission(request):
+            raise PermissionDenied
+        return job
+
+    def status_view(self, request, pk):
+        job = self.get_job(request, pk)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': job.filename,
+            'job': job,
+            'opts': self.model._meta,
+        }
+        return render(request, 'admin/export_job.html', context)
+
+    def download_view(self, request, pk):
+        job = self.get_job(request, pk)
+        if job.status != 'done' or not job.path.exists():
+            return HttpResponseRedirect(reverse('admin:seh_1_exportjob_status', args=[job.pk]))
+        return export_file_response(request, job)
+
+    @admin.display(description='Jarayon')
+    def get_progress(self, obj):
+        if obj.total:
+            return f'{obj.progress} / {obj.total}'
+        return obj.progress
+
+    @admin.display(description='Fayl')
+    def get_download(self, obj):
+        if obj.status != 'done':
+            return '-'
+        return format_html('<a href="{}">Yuklab olish</a>',
+                           reverse('admin:seh_1_exportjob_download', args=[obj.pk]))
+
+
 admin.site.register(ProductReProduction, ProductReProductionAdmin)
+admin.site.register(ExportJob, ExportJobAdmin)
+admin.site.register(Customer, CustomerAdmin)
 
 admin.site.register(Component, ComponentAdmin)
 admin.site.register(Product, ProductAdmin)
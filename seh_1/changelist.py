@@ -0,0 +1,337 @@
+from django.contrib.admin import RelatedFieldListFilter
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db.models import Prefetch, Q
+from django.urls import path
+from django.utils.cache import (add_never_cache_headers, get_conditional_response,
+                                patch_cache_control)
+from django.utils.functional import cached_property
+
+from .versions import versioned_cache_key, versioned_etag
+
+# Query string parameters of keyset-paginated changelists. They are not
+# filters, so KeysetChangeList keeps them out of the lookups.
+CURSOR_VAR = 'cursor'
+COUNT_VAR = 'count'
+APPROXIMATE_COUNT = 'approx'
+
+# Exact counts are keyed by the model data version; approximate counts are
+# reused across writes until this timeout.
+APPROXIMATE_COUNT_TIMEOUT = 60 * 10
+COUNT_CACHE_TIMEOUT = 60 * 60
+
+
+class SubtreeAggregatesMixin:
+    """
+    Attach aggregates over the descendants of every parent row on a
+    changelist page to the row objects before rendering.
+
+    ``subtree_aggregates`` maps attribute names to aggregate expressions. They
+    are computed for all parent rows of the page with one query grouped by
+    ``tree_id``, selecting the descendants through the MPTT ``lft``/``rght``
+    bounds. Sections are tree roots here, so every tree has a single parent
+    row. Leaf rows get ``None``.
+    """
+    subtree_aggregates = {}
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        self.attach_subtree_aggregates(changelist.result_list)
+        return changelist
+
+    def attach_subtree_aggregates(self, rows):
+        rows = list(rows)
+        opts = self.model._mptt_meta
+        parents = {}
+        for row in rows:
+            for name in self.subtree_aggregates:
+                setattr(row, name, None)
+            if getattr(row, opts.right_attr) - getattr(row, opts.left_attr) > 1:
+                parents[getattr(row, opts.tree_id_attr)] = row
+        if not parents:
+            return
+
+        descendants = Q()
+        for tree_id, row in parents.items():
+            descendants |= Q(**{
+                opts.tree_id_attr: tree_id,
+                f'{opts.left_attr}__gt': getattr(row, opts.left_attr),
+                f'{opts.right_attr}__lt': getattr(row, opts.right_attr),
+            })
+        values = self.model._default_manager.filter(descendants).order_by().values(
+            opts.tree_id_attr).annotate(**self.subtree_aggregates)
+        for value in values:
+            row = parents[value.pop(opts.tree_id_attr)]
+            for name, aggregate in value.items():
+                setattr(row, name, aggregate)
+
+
+class ReferencedFieldListFilter(RelatedFieldListFilter):
+    """
+    Offer only the related objects this model references through this
+    foreign key, rather than every row of the related table (``Customer``
+    is shared by the sales of all sections, as buyers and sellers).
+
+    Exports never show the sidebar, so they filter without reading the
+    choices.
+    """
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.exporting = getattr(request, 'exporting', False)
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def field_choices(self, field, request, model_admin):
+        if self.exporting:
+            return []
+        referenced = field.model._default_manager.values(field.attname).distinct()
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        return field.get_choices(include_blank=False, ordering=ordering,
+                                 limit_choices_to={'pk__in': referenced})
+
+    def has_output(self):
+        # The changelist only applies filters that have output.
+        return self.exporting or super().has_output()
+
+
+def computed_column(annotations=None, prefetch=()):
+    """
+    Declare what a ``list_display`` callable needs from the changelist
+    queryset: ``annotations`` is a ``{name: expression}`` mapping and
+    ``prefetch`` a sequence of lookups or ``Prefetch`` objects. The column
+    itself should then only read the annotated attributes and the
+    ``.all()`` of the prefetched relations.
+    """
+    def decorator(func):
+        func.annotations = annotations or {}
+        func.prefetch = tuple(prefetch)
+        return func
+    return decorator
+
+
+class ComputedColumnsMixin:
+    """
+    Apply the annotations and prefetches declared with ``computed_column`` by
+    the columns of ``get_list_display`` once in ``get_queryset``.
+    """
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        annotations = {}
+        prefetch = {}
+        for name in self.get_list_display(request):
+            column = name if callable(name) else getattr(self, name, None)
+            annotations.update(getattr(column, 'annotations', {}))
+            for lookup in getattr(column, 'prefetch', ()):
+                if not isinstance(lookup, Prefetch):
+                    lookup = Prefetch(lookup)
+                prefetch.setdefault(lookup.prefetch_to, lookup)
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch.values())
+        return queryset
+
+
+class KeysetPaginator(Paginator):
+    """
+    Paginator for querysets ordered by ``('-<field>', '-pk')``.
+
+    Pages reached through a ``cursor`` (the boundary row of the adjacent page)
+    and the last page are fetched with a seek on ``(field, pk)`` instead of an
+    OFFSET, so their cost does not depend on how deep they are. Other pages
+    fall back to the OFFSET query. The count is cached: exactly, under the
+    model data version, or approximately (ignoring writes for a while).
+    """
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, cursor=None, approximate_count=False):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.cursor = cursor
+        self.approximate_count = approximate_count
+
+    @cached_property
+    def key_field(self):
+        """Name of the seek field, or ``None`` if the ordering does not allow it."""
+        # ChangeList repeats the ModelAdmin ordering already on the queryset.
+        ordering = tuple(dict.fromkeys(self.object_list.query.order_by))
+        if len(ordering) != 2 or ordering[1] not in ('-pk', f'-{self.object_list.model._meta.pk.name}'):
+            return None
+        name = ordering[0]
+        if not name.startswith('-') or '__' in name:
+            return None
+        return name[1:]
+
+    def cursor_for(self, row, direction):
+        field = self.object_list.model._meta.get_field(self.key_field)
+        return f'{direction}{field.value_to_string(row)}_{row.pk}'
+
+    def _parse_cursor(self):
+        try:
+            direction, value = self.cursor[0], self.cursor[1:]
+            value, pk = value.rsplit('_', 1)
+            field = self.object_list.model._meta.get_field(self.key_field)
+            value = field.to_python(value)
+            pk = self.object_list.model._meta.pk.to_python(pk)
+        except Exception:
+            return None
+        if direction not in 'ab' or value is None:
+            return None
+        return direction, value, pk
+
+    @cached_property
+    def count(self):
+        try:
+            sql = str(self.object_list.order_by().query)
+        except EmptyResultSet:
+            return 0
+        approximate_key = versioned_cache_key('changelist_count', (), sql)
+        if self.approximate_count:
+            count = cache.get(approximate_key)
+            if count is not None:
+                return count
+        exact_key = versioned_cache_key(
+            'changelist_count', (self.object_list.model,), sql)
+        count = cache.get(exact_key)
+        if count is None:
+            count = super().count
+            cache.set(exact_key, count, COUNT_CACHE_TIMEOUT)
+        cache.set(approximate_key, count, APPROXIMATE_COUNT_TIMEOUT)
+        return count
+
+    def seek(self, number):
+        """Queryset of page ``number`` found by seeking, or ``None``."""
+        if self.key_field is None or number == 1 or self.orphans:
+            return None
+        field = self.key_field
+        cursor = self._parse_cursor() if self.cursor else None
+        if cursor is not None:
+            direction, value, pk = cursor
+            if direction == 'a':
+                return self.object_list.filter(
+                    Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+                )[:self.per_page]
+            rows = self.object_list.filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+            ).order_by(field, 'pk').values('pk')[:self.per_page]
+            return self.object_list.filter(pk__in=rows)
+        if number == self.num_pages:
+            rows = self.object_list.order_by(field, 'pk').values('pk')[
+                :self.count - (number - 1) * self.per_page]
+            return self.object_list.filter(pk__in=rows)
+        return None
+
+    def page(self, number):
+        number = self.validate_number(number)
+        object_list = self.seek(number)
+        if object_list is None:
+            return super().page(number)
+        return self._get_page(object_list, number, self)
+
+
+class KeysetChangeList(ChangeList):
+    """
+    ChangeList for ``KeysetPaginator``: keeps the cursor and count mode out of
+    the filters and puts seek cursors into the previous/next page links.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        super().__init__(request, *args, **kwargs)
+        self.count_toggle = None
+        if request.user.is_superuser:
+            if self.params.get(COUNT_VAR) == APPROXIMATE_COUNT:
+                self.count_toggle = ('Aniq son', self.get_query_string({COUNT_VAR: None}))
+            else:
+                self.count_toggle = ('Taxminiy son', self.get_query_string(
+                    {COUNT_VAR: APPROXIMATE_COUNT}))
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        lookup_params.pop(COUNT_VAR, None)
+        return lookup_params
+
+    def page_cursor(self, number):
+        paginator = getattr(self, 'paginator', None)
+        if (paginator is None or paginator.key_field is None or self.show_all or
+                number == 1 or abs(number - self.page_num) != 1):
+            return None
+        rows = list(self.result_list)
+        if not rows:
+            return None
+        if number > self.page_num:
+            return paginator.cursor_for(rows[-1], 'a')
+        return paginator.cursor_for(rows[0], 'b')
+
+    def get_query_string(self, new_params=None, remove=None):
+        new_params = dict(new_params or {})
+        remove = [*(remove or []), CURSOR_VAR]
+        if PAGE_VAR in new_params:
+            new_params[CURSOR_VAR] = self.page_cursor(int(new_params[PAGE_VAR]))
+        return super().get_query_string(new_params, remove)
+
+
+class KeysetPaginationMixin:
+    """
+    Paginate a changelist ordered by ``('-<date field>',)`` with
+    ``KeysetPaginator`` and skip the unfiltered total count.
+    """
+    paginator = KeysetPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return self.paginator(
+            queryset, per_page, orphans, allow_empty_first_page,
+            cursor=request.GET.get(CURSOR_VAR),
+            approximate_count=(request.user.is_superuser and
+                               request.GET.get(COUNT_VAR) == APPROXIMATE_COUNT))
+
+
+class ConditionalChangelistMixin:
+    """
+    Answer changelist requests with ``If-None-Match`` from the data versions
+    of ``etag_models`` (default: the model): a matching ETag gets a 304
+    before the changelist, its summaries or counts are computed.
+
+    The ETag covers the full path, the user, the session and the CSRF
+    cookie. Requests without a query string (which the changelists redirect
+    to the current month) and requests with messages waiting to be shown
+    are always rendered. The changelist URL is registered without ``never_cache``, whose ``no-store``
+    would keep browsers from revalidating; other responses still get it.
+    """
+    etag_models = ()
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('', self.admin_site.admin_view(self.conditional_changelist_view, cacheable=True),
+                 name='%s_%s_changelist' % info),
+            *super().get_urls(),
+        ]
+
+    def get_changelist_etag(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.GET:
+            return None
+        if len(get_messages(request)):
+            return None
+        # The page embeds the CSRF token, which a new login rotates.
+        return versioned_etag(self.etag_models or (self.model,),
+                              request.get_full_path(), request.user.pk,
+                              request.session.session_key, request.META.get('CSRF_COOKIE'))
+
+    def conditional_changelist_view(self, request, extra_context=None):
+        etag = self.get_changelist_etag(request)
+        response = get_conditional_response(request, etag=etag) if etag else None
+        if response is None:
+            response = self.changelist_view(request, extra_context)
+        if etag is not None and response.status_code in (200, 304):
+            response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            add_never_cache_headers(response)
+        return response
@@ -0,0 +1,165 @@
+"""
+Whole-catalogue BOM costing.
+
+All ``ProductComponent`` rows of an app are loaded with one query into a
+sparse product x component matrix kept in CSR form (``indptr``/``indices``/
+``data`` arrays, one row per product). Unit costs for the whole catalogue are
+then a single matrix-vector product against the component price vector,
+instead of walking ``productcomponent_set`` product by product.
+"""
+import math
+from array import array
+from operator import mul
+
+from django.core.cache import cache
+from django.db.models import Case, FloatField, Value, When
+
+# The cached matrix is dropped by the ProductComponent signal handlers of the
+# current process; other workers pick up BOM changes after this timeout.
+BOM_CACHE_TIMEOUT = 60 * 5
+
+
+class BOMMatrix:
+    def __init__(self, product_ids, component_ids, indptr, indices, data):
+        self.product_ids = product_ids
+        self.component_ids = component_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    @classmethod
+    def load(cls, bom_model, products=None):
+        """
+        Build the matrix from ``bom_model`` rows.
+
+        ``products`` optionally limits the rows to a product queryset or list
+        of ids. Products without components are not part of the matrix.
+        """
+        rows = bom_model._default_manager.order_by('product_id', 'component_id')
+        if products is not None:
+            rows = rows.filter(product__in=products)
+
+        product_ids = []
+        component_ids = []
+        column = {}
+        indptr = array('l', [0])
+        indices = array('l')
+        data = array('d')
+
+        for product_id, component_id, quantity in rows.values_list(
+                'product_id', 'component_id', 'quantity').iterator(chunk_size=2000):
+            if not product_ids or product_ids[-1] != product_id:
+                if product_ids:
+                    indptr.append(len(indices))
+                product_ids.append(product_id)
+            if component_id not in column:
+                column[component_id] = len(component_ids)
+                component_ids.append(component_id)
+            indices.append(column[component_id])
+            data.append(quantity)
+        if product_ids:
+            indptr.append(len(indices))
+
+        return cls(product_ids, component_ids, indptr, indices, data)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def price_vector(self, component_model):
+        """Current ``price`` of every matrix column, in column order."""
+        prices = dict(component_model._default_manager.filter(
+            pk__in=self.component_ids).values_list('pk', 'price'))
+        return array('d', (prices.get(pk, 0) for pk in self.component_ids))
+
+    def override(self, vector, prices):
+        """Copy of ``vector`` with the ``{component_id: price}`` changes applied."""
+        vector = array('d', vector)
+        for column, pk in enumerate(self.component_ids):
+            if pk in prices:
+                vector[column] = prices[pk]
+        return vector
+
+    def dot(self, vector):
+        """Return the matrix-vector product as a list, one value per row."""
+        gathered = array('d', (vector[i] for i in self.indices))
+        data = self.data
+        indptr = self.indptr
+        return [sum(map(mul, data[indptr[row]:indptr[row + 1]],
+                        gathered[indptr[row]:indptr[row + 1]]))
+                for row in range(len(self.product_ids))]
+
+    def rdot(self, weights):
+        """Return ``weights`` times the matrix as a list, one value per column."""
+        result = [0.0] * len(self.component_ids)
+        indices = self.indices
+        data = self.data
+        indptr = self.indptr
+        for row, weight in enumerate(weights):
+            if weight:
+                for k in range(indptr[row], indptr[row + 1]):
+                    result[indices[k]] += data[k] * weight
+        return result
+
+    def requirements(self, plan):
+        """
+        ``{component_id: quantity}`` needed to build ``plan``, a mapping of
+        ``{product_id: planned quantity}``.
+        """
+        return dict(zip(self.component_ids, self.rdot(
+            [plan.get(pk, 0) for pk in self.product_ids])))
+
+    def costs(self, prices):
+        """``{product_id: unit_cost}`` for the given price vector."""
+        return dict(zip(self.product_ids, self.dot(prices)))
+
+
+def _bom_cache_key(bom_model):
+    return f'bom_matrix:{bom_model._meta.label_lower}'
+
+
+def get_bom_matrix(bom_model):
+    """Whole-catalogue matrix of ``bom_model``, cached until the BOM changes."""
+    matrix = cache.get(_bom_cache_key(bom_model))
+    if matrix is None:
+        matrix = BOMMatrix.load(bom_model)
+        cache.set(_bom_cache_key(bom_model), matrix, BOM_CACHE_TIMEOUT)
+    return matrix
+
+
+def discard_bom_matrix(bom_model):
+    cache.delete(_bom_cache_key(bom_model))
+
+
+def catalogue_costs(component_model, bom_model, products=None):
+    """
+    Unit cost of every product in ``products`` (default: the whole catalogue).
+
+    Runs two queries regardless of catalogue size: one for the BOM and one for
+    the component prices. Products without a BOM are missing from the result.
+    """
+    matrix = BOMMatrix.load(bom_model, products)
+    return matrix.costs(matrix.price_vector(component_model))
+
+
+def recalculate_unit_costs(queryset, component_model, bom_model, chunk_size=500):
+    """
+    Store freshly computed costs in ``unit_cost`` for every product of
+    ``queryset``, writing only the rows whose stored value is out of date.
+    Returns the number of updated products.
+    """
+    costs = catalogue_costs(
+        component_model, bom_model, queryset.values('pk'))
+    changed = {}
+    for pk, stored in queryset.values_list('pk', 'unit_cost').iterator():
+        cost = costs.get(pk, 0)
+        if not math.isclose(stored, cost, rel_tol=1e-9, abs_tol=1e-9):
+            changed[pk] = cost
+
+    manager = queryset.model._default_manager
+    pks = list(changed)
+    for start in range(0, len(pks), chunk_size):
+        chunk = pks[start:start + chunk_size]
+        manager.filter(pk__in=chunk).update(unit_cost=Case(
+            *[When(pk=pk, then=Value(changed[pk])) for pk in chunk],
+            output_field=FloatField()))
+    return len(changed)
@@ -0,0 +1,379 @@
+"""
+Cached XLSX exports of admin changelists.
+
+A ``ModelAdmin`` with ``ExportAdminMixin`` declares its columns in an
+``ExportSpec``. The export takes the queryset of the real ``ChangeList`` of
+the request, so it has the same filters, search and ordering as the
+screen, and adds the joins and prefetches declared by the spec.
+
+Exports run as ``ExportJob`` rows built into ``settings.EXPORT_ROOT`` by
+the ``build_exports`` management command, outside the web process; the
+request only queues the job and shows its progress. A job is keyed by the
+model, the changelist query and the data versions of the models the spec
+reads, so asking again for the same export returns the finished file until
+one of those tables changes. The key is also the ETag of the file:
+a client sending it back in ``If-None-Match`` gets a 304 after one query
+for the data versions.
+
+Rows go into a write-only openpyxl workbook, which keeps only the current
+row in memory, and are read through ``iterator(chunk_size=EXPORT_CHUNK_SIZE)``,
+so the memory used by an export does not depend on the number of rows.
+"""
+import hashlib
+import os
+from datetime import timedelta
+from functools import lru_cache
+from urllib.parse import urlencode
+
+from django.apps import apps
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ALL_VAR, ERROR_FLAG, PAGE_VAR
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import PermissionDenied
+from django.db.models import Prefetch
+from django.http import FileResponse, HttpRequest, HttpResponseRedirect, QueryDict
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.cache import (add_never_cache_headers, get_conditional_response,
+                                patch_cache_control)
+from django.utils.http import quote_etag
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from .changelist import COUNT_VAR, CURSOR_VAR
+from .versions import get_versions
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Rows fetched (and prefetched for) per database round trip; progress is
+# reported after each of them.
+EXPORT_CHUNK_SIZE = 2000
+
+# Changelist parameters that do not change the exported rows.
+IGNORED_PARAMS = (PAGE_VAR, ALL_VAR, ERROR_FLAG, CURSOR_VAR, COUNT_VAR)
+
+# A job that has not reported progress for this long is assumed lost (its
+# worker was restarted) and is queued again on the next request.
+STALE_JOB_TIMEOUT = timedelta(minutes=10)
+# Jobs and their files are removed this long after they were created.
+EXPORT_RETENTION = timedelta(days=1)
+
+
+def write_xlsx(file, headers, rows, widths=(), alignment=None):
+    """
+    Write ``headers`` and the ``rows`` iterable to ``file`` as a one-sheet
+    workbook. ``widths`` are the column widths from column A on;
+    ``alignment`` is applied to every column with a header.
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    # Write-only sheets need the column settings before the first row.
+    for number, width in enumerate(widths, 1):
+        worksheet.column_dimensions[get_column_letter(number)].width = width
+    if alignment is not None:
+        for number in range(1, len(headers) + 1):
+            worksheet.column_dimensions[get_column_letter(number)].alignment = alignment
+    worksheet.append(headers)
+    for row in rows:
+        worksheet.append(row)
+    workbook.save(file)
+
+
+def naive(value):
+    """``value`` without its timezone; Excel cells cannot hold one."""
+    return value.replace(tzinfo=None) if value else value
+
+
+class ExportSpec:
+    """
+    Columns of a changelist export.
+
+    ``columns`` is a sequence of ``(header, value)`` pairs. ``value`` is a
+    callable taking the row, the name of a ``ModelAdmin`` method (called
+    like a ``list_display`` column) or a ``__`` separated attribute path
+    such as ``'user__username'``. ``filter`` narrows the changelist rows,
+    ``select_related``/``prefetch_related`` are added to its queryset and
+    ``widths`` are the column widths from column A on. ``depends_on`` lists
+    the models whose data versions key the cached files (default: the
+    exported model).
+    """
+
+    def __init__(self, filename, columns=(), select_related=(), prefetch_related=(),
+                 filter=None, widths=(), alignment=None, depends_on=()):
+        self.filename = filename
+        self.columns = tuple(columns)
+        self.select_related = tuple(select_related)
+        self.prefetch_related = tuple(prefetch_related)
+        self.filter = filter
+        self.widths = tuple(widths)
+        self.alignment = alignment
+        self.depends_on = tuple(depends_on)
+
+    def get_queryset(self, queryset):
+        if self.filter is not None:
+            queryset = queryset.filter(self.filter)
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        # The admin may already prefetch a lookup for its own columns.
+        seen = {lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+                for lookup in queryset._prefetch_related_lookups}
+        lookups = [lookup for lookup in self.prefetch_related
+                   if (lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup) not in seen]
+        if lookups:
+            queryset = queryset.prefetch_related(*lookups)
+        return queryset
+
+    def get_columns(self, queryset):
+        """``(header, value)`` pairs; override to compute per-export data."""
+        return self.columns
+
+    def write(self, file, queryset, model_admin, progress=None):
+        """
+        Write the rows of ``queryset`` (already passed through
+        ``get_queryset``) to ``file``, calling ``progress(rows_written)``
+        after every chunk.
+        """
+        columns = self.get_columns(queryset)
+        values = [_column_value(value, model_admin) for _, value in columns]
+
+        def rows():
+            written = 0
+            for obj in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+                yield [value(obj) for value in values]
+                written += 1
+                if progress is not None and written % EXPORT_CHUNK_SIZE == 0:
+                    progress(written)
+
+        write_xlsx(file, [header for header, _ in columns], rows(),
+                   self.widths, self.alignment)
+
+
+def _column_value(value, model_admin):
+    if callable(value):
+        return value
+    method = getattr(model_admin, value, None)
+    if callable(method):
+        return method
+
+    def attribute(obj):
+        for name in value.split('__'):
+            if obj is None:
+                return None
+            obj = getattr(obj, name)
+        return obj
+    return attribute
+
+
+def _skip_results(self, request):
+    # The export reads self.queryset itself; the page and counts are unused.
+    self.result_list = []
+    self.result_count = self.full_result_count = 0
+    self.paginator = None
+    self.show_all = self.can_show_all = self.multi_page = False
+
+
+@lru_cache(maxsize=None)
+def export_changelist_class(changelist_class):
+    """``changelist_class`` without fetching a page of results."""
+    return type(f'Export{changelist_class.__name__}', (changelist_class,),
+                {'get_results': _skip_results})
+
+
+class ExportAdminMixin:
+    """
+    Serve ``export_spec`` of the changelist at ``<changelist>/export/``
+    with the query string of the changelist.
+    """
+    export_spec = None
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('export/', self.admin_site.admin_view(self.export_view, cacheable=True),
+                 name='%s_%s_export' % info),
+            *super().get_urls(),
+        ]
+
+    def get_changelist(self, request, **kwargs):
+        changelist = super().get_changelist(request, **kwargs)
+        if getattr(request, 'exporting', False):
+            return export_changelist_class(changelist)
+        return changelist
+
+    def get_export_queryset(self, request):
+        """Queryset of the changelist of ``request``, without pagination."""
+        request.exporting = True
+        try:
+            return self.get_changelist_instance(request).queryset
+        finally:
+            request.exporting = False
+
+    def export_view(self, request):
+        """
+        Send the finished file of this export, or start building it and
+        show its progress page.
+        """
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        key = export_job_key(self, request)
+        response = get_conditional_response(request, etag=quote_etag(key))
+        if response is not None:
+            return export_cache_headers(response, key)
+        try:
+            # Checks the filters before a job is queued.
+            self.get_export_queryset(request)
+        except IncorrectLookupParameters:
+            info = self.model._meta.app_label, self.model._meta.model_name
+            response = HttpResponseRedirect(
+                reverse('admin:%s_%s_changelist' % info) + f'?{ERROR_FLAG}=1')
+            add_never_cache_headers(response)
+            return response
+        job = start_export_job(self, request, key)
+        if job.status == 'done':
+            return export_file_response(request, job)
+        response = HttpResponseRedirect(reverse('admin:seh_1_exportjob_status', args=[job.pk]))
+        add_never_cache_headers(response)
+        return response
+
+
+def export_changelist(request, model):
+    """The changelist export of ``model`` for ``request``."""
+    return admin.site._registry[model].export_view(request)
+
+
+def export_query(params):
+    """Canonical query string of the changelist ``params`` that affect rows."""
+    return urlencode(sorted(
+        (name, value) for name, values in params.lists() if name not in IGNORED_PARAMS
+        for value in values))
+
+
+def export_key(model, query, versions):
+    label = model._meta.label_lower
+    return hashlib.sha256(repr((label, query, versions)).encode()).hexdigest()
+
+
+def export_job_key(model_admin, request):
+    """Key of the export of ``request``; one query for the data versions."""
+    model = model_admin.model
+    depends_on = model_admin.export_spec.depends_on or (model,)
+    return export_key(model, export_query(request.GET), get_versions(*depends_on))
+
+
+def start_export_job(model_admin, request, key=None):
+    """
+    The job of the export of ``request``: the finished or running job with
+    the same key, or a newly queued one.
+    """
+    from .models import ExportJob
+
+    model = model_admin.model
+    spec = model_admin.export_spec
+    query = export_query(request.GET)
+    if key is None:
+        key = export_job_key(model_admin, request)
+
+    job = ExportJob.objects.filter(key=key).exclude(status='failed').first()
+    if job is not None:
+        if job.status == 'done' and job.path.exists():
+            return job
+        if job.status == 'pending' or (
+                job.status == 'running' and job.updated > timezone.now() - STALE_JOB_TIMEOUT):
+            return job
+
+    purge_expired_exports()
+    return ExportJob.objects.create(
+        key=key, model=model._meta.label, query=query, filename=spec.filename,
+        user=request.user if request.user.is_authenticated else None)
+
+
+def claim_export_job():
+    """
+    Claim the oldest pending job and return its pk, or ``None`` if no job
+    is waiting. The claim is a conditional ``UPDATE`` on the status, so
+    several ``build_exports`` workers never build the same job.
+    """
+    from .models import ExportJob
+
+    pending = ExportJob.objects.filter(status='pending')
+    while True:
+        pk = pending.order_by('pk').values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        if pending.filter(pk=pk).update(status='running', updated=timezone.now()):
+            return pk
+
+
+def build_pending_exports(limit=None):
+    """Build pending jobs, at most ``limit`` of them; the number built."""
+    built = 0
+    while limit is None or built < limit:
+        pk = claim_export_job()
+        if pk is None:
+            break
+        run_export_job(pk)
+        built += 1
+    return built
+
+
+def _job_request(job):
+    request = HttpRequest()
+    request.method = 'GET'
+    request.GET = QueryDict(job.query)
+    request.user = job.user or AnonymousUser()
+    return request
+
+
+def run_export_job(pk):
+    """Build the file of the export job ``pk``."""
+    from .models import ExportJob
+
+    job = ExportJob.objects.select_related('user').get(pk=pk)
+    jobs = ExportJob.objects.filter(pk=pk)
+    jobs.update(status='running', updated=timezone.now())
+    partial = job.path.with_suffix('.part')
+    try:
+        model_admin = admin.site._registry[apps.get_model(job.model)]
+        spec = model_admin.export_spec
+        queryset = spec.get_queryset(model_admin.get_export_queryset(_job_request(job)))
+        total = queryset.count()
+        jobs.update(total=total, updated=timezone.now())
+
+        job.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(partial, 'wb') as file:
+            spec.write(file, queryset, model_admin, progress=lambda written: jobs.update(
+                progress=written, updated=timezone.now()))
+        os.replace(partial, job.path)
+    except Exception as error:
+        partial.unlink(missing_ok=True)
+        jobs.update(status='failed', error=repr(error), updated=timezone.now())
+        return
+    jobs.update(status='done', progress=total, updated=timezone.now())
+
+
+def purge_expired_exports():
+    """Delete jobs created before ``EXPORT_RETENTION`` and their files."""
+    from .models import ExportJob
+
+    expired = ExportJob.objects.filter(created__lt=timezone.now() - EXPORT_RETENTION)
+    keys = set(expired.values_list('key', flat=True))
+    expired.delete()
+    for key in keys - set(ExportJob.objects.filter(key__in=keys).values_list('key', flat=True)):
+        ExportJob(key=key).path.unlink(missing_ok=True)
+
+
+def export_cache_headers(response, key):
+    """Let browsers keep the file of ``key`` and revalidate it on every use."""
+    response['ETag'] = quote_etag(key)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def export_file_response(request, job):
+    """The finished file of ``job``, or a 304 if the client already has it."""
+    response = get_conditional_response(request, etag=quote_etag(job.key))
+    if response is None:
+        response = FileResponse(open(job.path, 'rb'), as_attachment=True,
+                                filename=job.filename, content_type=XLSX_CONTENT_TYPE)
+    return export_cache_headers(response, job.key)
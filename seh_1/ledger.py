@@ -0,0 +1,131 @@
+from datetime import datetime, time, timedelta
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from .models import StockMovement, StockSnapshot
+from .versions import bump_version
+
+# Every stock counter that is kept in the ledger: (app_label, model, field)
+TRACKED_COUNTERS = (
+    ('seh_1', 'Component', 'total'),
+    ('seh_1', 'Product', 'total_new'),
+    ('seh_1', 'Product', 'total_cut'),
+    ('Azamat_seh', 'Component', 'total'),
+    ('Azamat_seh', 'Product', 'total_new'),
+    ('Anvaraka_sklad', 'Product', 'total'),
+)
+
+
+def tracked_counters():
+    for app_label, model_name, counter in TRACKED_COUNTERS:
+        yield apps.get_model(app_label, model_name), counter
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def record_movements(model, counter, deltas, reason):
+    """Append one ledger row per ``{object_id: signed_quantity}`` item."""
+    content_type = ContentType.objects.get_for_model(model)
+    StockMovement.objects.bulk_create([
+        StockMovement(content_type=content_type, object_id=object_id,
+                      counter=counter, quantity=quantity, reason=reason)
+        for object_id, quantity in deltas.items() if quantity
+    ])
+    # The counters were changed with update(), which sends no signals.
+    bump_version(model)
+
+
+def move_stock(model, object_id, reason, **deltas):
+    """
+    Change stock counters of one row with ``UPDATE ... SET f = f + delta``
+    and append the matching ledger rows, e.g.
+    ``move_stock(Product, pk, 'cut', total_new=-5, total_cut=5)``.
+    """
+    model._default_manager.filter(pk=object_id).update(
+        **{counter: F(counter) + delta for counter, delta in deltas.items()})
+    for counter, delta in deltas.items():
+        record_movements(model, counter, {object_id: delta}, reason)
+
+
+def stock_at(model, counter, when):
+    """
+    Return ``{object_id: quantity}`` of ``counter`` at the moment ``when``.
+
+    Starts from the latest daily snapshot taken before that day and adds the
+    movements between the end of the snapshot day and ``when``.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    snapshots = StockSnapshot.objects.filter(
+        content_type=content_type, counter=counter)
+    movements = StockMovement.objects.filter(
+        content_type=content_type, counter=counter, date__lt=when)
+
+    stock = {}
+    snapshot_day = snapshots.filter(date__lt=timezone.localdate(when)).aggregate(
+        day=Max('date'))['day']
+    if snapshot_day:
+        stock = dict(snapshots.filter(date=snapshot_day).values_list(
+            'object_id', 'quantity'))
+        movements = movements.filter(
+            date__gte=day_start(snapshot_day + timedelta(days=1)))
+
+    for object_id, quantity in movements.values('object_id').annotate(
+            total=Sum('quantity')).values_list('object_id', 'total'):
+        stock[object_id] = stock.get(object_id, 0) + quantity
+    return stock
+
+
+def take_snapshots(day):
+    """Store the closing stock of ``day`` for every tracked counter."""
+    created = 0
+    for model, counter in tracked_counters():
+        stock = stock_at(model, counter, day_start(day + timedelta(days=1)))
+        content_type = ContentType.objects.get_for_model(model)
+
+        StockSnapshot.objects.filter(
+            content_type=content_type, counter=counter, date=day).delete()
+        created += len(StockSnapshot.objects.bulk_create([
+            StockSnapshot(content_type=content_type, object_id=object_id,
+                          counter=counter, date=day, quantity=quantity)
+            for object_id, quantity in stock.items()
+        ]))
+    return created
+
+
+def verify_counters(model, counter):
+    """Return ``[(object_id, counter_value, ledger_value)]`` that disagree."""
+    content_type = ContentType.objects.get_for_model(model)
+    ledger = dict(StockMovement.objects.filter(
+        content_type=content_type, counter=counter).values('object_id').annotate(
+            total=Sum('quantity')).values_list('object_id', 'total'))
+
+    mismatches = []
+    for object_id, value in model._default_manager.values_list('pk', counter):
+        expected = ledger.get(object_id, 0)
+        if abs(value - expected) > 1e-6:
+            mismatches.append((object_id, value, expected))
+    return mismatches
+
+
+class StockAdjustmentAdminMixin:
+    """Record manual edits of stock counters made in the admin form."""
+    stock_counters = ()
+
+    def save_model(self, request, obj, form, change):
+        counters = [
+            field for field in self.stock_counters if field in form.changed_data]
+        old = {}
+        if counters and change:
+            old = type(obj)._default_manager.filter(
+                pk=obj.pk).values(*counters).first() or {}
+
+        super().save_model(request, obj, form, change)
+
+        for counter in counters:
+            delta = getattr(obj, counter) - (old.get(counter) or 0)
+            record_movements(type(obj), counter, {obj.pk: delta}, 'adjustment')
@@ -0,0 +1,48 @@
+from django.core.cache import cache
+from django.db.models import F
+
+LOW_STOCK_CACHE_KEY = 'seh_1:low_stock_components'
+# Every process keeps its own copy with the default local-memory cache, so
+# changes made by other workers are picked up at the latest after this timeout.
+LOW_STOCK_TIMEOUT = 60 * 5
+
+
+def _load_low_stock():
+    from .models import Component
+
+    return dict(Component.objects.filter(
+        parent__isnull=False, total__lt=F('notification_limit')).values_list('id', 'title'))
+
+
+def get_low_stock():
+    """Return ``{component_id: title}`` of child components below their limit."""
+    low_stock = cache.get(LOW_STOCK_CACHE_KEY)
+    if low_stock is None:
+        low_stock = _load_low_stock()
+        cache.set(LOW_STOCK_CACHE_KEY, low_stock, LOW_STOCK_TIMEOUT)
+    return low_stock
+
+
+def update_low_stock(*components):
+    """Add or remove the given components after their ``total`` has changed."""
+    low_stock = cache.get(LOW_STOCK_CACHE_KEY)
+    if low_stock is None:
+        # Nothing cached yet, the next reader loads a fresh set.
+        return
+
+    for component in components:
+        if component.parent_id and component.total < component.notification_limit:
+            low_stock[component.pk] = component.title
+        else:
+            low_stock.pop(component.pk, None)
+    cache.set(LOW_STOCK_CACHE_KEY, low_stock, LOW_STOCK_TIMEOUT)
+
+
+def discard_low_stock(*component_ids):
+    low_stock = cache.get(LOW_STOCK_CACHE_KEY)
+    if low_stock is None:
+        return
+
+    for component_id in component_ids:
+        low_stock.pop(component_id, None)
+    cache.set(LOW_STOCK_CACHE_KEY, low_stock, LOW_STOCK_TIMEOUT)
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from seh_1.exports import build_pending_exports
+
+
+class Command(BaseCommand):
+    help = "Build queued changelist exports"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep polling for queued exports instead of exiting")
+        parser.add_argument('--interval', type=float, default=2,
+                            help="Seconds to sleep between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            build_pending_exports()
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from seh_1.utils import normalize_names
+
+NAME_FIELDS = (
+    ('seh_1', 'Sales', ('buyer', 'seller')),
+    ('Azamat_seh', 'Sales', ('buyer', 'seller')),
+    ('Anvaraka_sklad', 'Selling', ('buyer',)),
+)
+
+
+class Command(BaseCommand):
+    help = "Title-case buyer/seller names of all sales tables in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for app_label, model_name, fields in NAME_FIELDS:
+            model = apps.get_model(app_label, model_name)
+            updated = normalize_names(
+                model.objects.all(), fields, chunk_size=options['chunk_size'])
+            self.stdout.write(
+                f'{app_label}.{model_name}: {updated} ta yozuv yangilandi')
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from seh_1.notifications import send_pending
+
+
+class Command(BaseCommand):
+    help = "Deliver queued Telegram notifications from the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep polling the outbox instead of exiting")
+        parser.add_argument('--interval', type=float, default=5,
+                            help="Seconds to sleep between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            delivered = send_pending(batch_size=options['batch_size'])
+            while delivered == options['batch_size']:
+                delivered = send_pending(batch_size=options['batch_size'])
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from seh_1.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Store the closing stock of a day for every tracked counter (run daily)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat,
+                            help="Day to snapshot, YYYY-MM-DD (default: yesterday)")
+        parser.add_argument('--days', type=int, default=1,
+                            help="Number of consecutive days ending at --date")
+
+    def handle(self, *args, **options):
+        last_day = options['date'] or timezone.localdate() - timedelta(days=1)
+        for offset in range(options['days'] - 1, -1, -1):
+            day = last_day - timedelta(days=offset)
+            created = take_snapshots(day)
+            self.stdout.write(f'{day}: {created} ta qoldiq saqlandi')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from seh_1.ledger import tracked_counters, verify_counters
+
+
+class Command(BaseCommand):
+    help = "Compare stock counters with the sum of their ledger movements"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help="Overwrite mismatching counters with the ledger value")
+
+    def handle(self, *args, **options):
+        mismatched = 0
+        for model, counter in tracked_counters():
+            label = f'{model._meta.label}.{counter}'
+            for object_id, value, expected in verify_counters(model, counter):
+                mismatched += 1
+                self.stdout.write(
+                    f'{label} #{object_id}: {value} != ledger {expected}')
+                if options['fix']:
+                    model._default_manager.filter(
+                        pk=object_id).update(**{counter: expected})
+
+        if mismatched:
+            self.stdout.write(self.style.WARNING(
+                f'{mismatched} ta mos kelmaydigan hisoblagich'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Barcha hisoblagichlar jurnal bilan mos'))
@@ -1,7 +1,7 @@
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import F
 
-from .models import Component
+from .low_stock import get_low_stock
 
 
 class ComponentNotificationMiddleware:
@@ -9,13 +9,15 @@ class ComponentNotificationMiddleware:
         self.get_response = get_response
 
     def __call__(self, request):
-        # Check if any child component has a total value below the limit
-        child_components = Component.objects.filter(
-            parent__isnull=False, total__lt=F('notification_limit'))
-        if child_components.exists() and not request.session.get('warning_message_displayed'):
-            message = f"Child component(s) with total value below the limit: {', '.join(child_components.values_list('title', flat=True))}"
-            messages.warning(request, message)
-            request.session['warning_message_displayed'] = True
+        # Static files and AJAX calls never render the warning
+        is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+        if not is_ajax and not request.path.startswith(settings.STATIC_URL):
+            # Check if any child component has a total value below the limit
+            low_stock = get_low_stock()
+            if low_stock and not request.session.get('warning_message_displayed'):
+                message = f"Child component(s) with total value below the limit: {', '.join(low_stock.values())}"
+                messages.warning(request, message)
+                request.session['warning_message_displayed'] = True
 
         response = self.get_response(request)
-        return response
\ No newline at end of file
+        return response
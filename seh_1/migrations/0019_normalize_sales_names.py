@@ -0,0 +1,40 @@
+# Generated by Django 4.2.5 on 2026-10-17 21:30
+
+from django.db import migrations
+
+
+# A frozen copy of seh_1.utils.normalize_names as of this migration.
+def normalize_names(queryset, fields, chunk_size=500):
+    """Title-case ``fields`` of every row in ``queryset`` with bulk_update."""
+    manager = queryset.model._default_manager
+    batch = []
+    for obj in queryset.only('pk', *fields).iterator(chunk_size=chunk_size):
+        changed = False
+        for field in fields:
+            value = getattr(obj, field)
+            if value and value != value.title():
+                setattr(obj, field, value.title())
+                changed = True
+        if changed:
+            batch.append(obj)
+        if len(batch) >= chunk_size:
+            manager.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        manager.bulk_update(batch, fields)
+
+
+def normalize(apps, schema_editor):
+    Sales = apps.get_model('seh_1', 'Sales')
+    normalize_names(Sales.objects.all(), ('buyer', 'seller'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seh_1', '0018_alter_sales_buyer_alter_sales_seller'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.5 on 2026-10-17 21:32
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seh_1', '0019_normalize_sales_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.CharField(max_length=50, verbose_name='Chat ID')),
+                ('payload', models.JSONField(verbose_name='Xabar')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Urinishlar')),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Keyingi urinish')),
+                ('sent', models.DateTimeField(blank=True, null=True, verbose_name='Yuborilgan vaqti')),
+                ('last_error', models.TextField(blank=True, verbose_name='Oxirgi xatolik')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Yaratilgan vaqti')),
+            ],
+            options={
+                'verbose_name': 'Xabar ',
+                'verbose_name_plural': 'Xabarlar navbati',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.5 on 2026-10-17 21:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('seh_1', '0020_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('counter', models.CharField(max_length=20, verbose_name='Hisoblagich')),
+                ('date', models.DateField(verbose_name='Sana')),
+                ('quantity', models.FloatField(verbose_name='Kun oxiridagi qoldiq')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Qoldiq ',
+                'verbose_name_plural': 'Kunlik qoldiqlar',
+                'unique_together': {('content_type', 'counter', 'date', 'object_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('counter', models.CharField(max_length=20, verbose_name='Hisoblagich')),
+                ('quantity', models.FloatField(verbose_name='Miqdor')),
+                ('reason', models.CharField(choices=[('opening', "Boshlang'ich qoldiq"), ('arrival', 'Keltirildi'), ('consumption', 'Ishlab chiqarishga sarflandi'), ('production', 'Ishlab chiqarildi'), ('cut', 'Kesildi'), ('sale', 'Sotildi'), ('reversal', 'Bekor qilindi'), ('adjustment', "Qo'lda tuzatildi")], max_length=20, verbose_name='Sabab')),
+                ('date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Vaqti')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Harakat ',
+                'verbose_name_plural': 'Ombor harakatlari',
+                'indexes': [models.Index(fields=['content_type', 'counter', 'date'], name='seh_1_stock_content_ba6a1f_idx'), models.Index(fields=['content_type', 'object_id', 'counter'], name='seh_1_stock_content_0d1dee_idx')],
+            },
+        ),
+    ]
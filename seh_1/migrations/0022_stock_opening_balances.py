@@ -0,0 +1,41 @@
+# Generated by Django 4.2.5 on 2026-10-17 21:35
+
+from django.db import migrations
+
+TRACKED_COUNTERS = (
+    ('seh_1', 'Component', 'total'),
+    ('seh_1', 'Product', 'total_new'),
+    ('seh_1', 'Product', 'total_cut'),
+    ('Azamat_seh', 'Component', 'total'),
+    ('Azamat_seh', 'Product', 'total_new'),
+    ('Anvaraka_sklad', 'Product', 'total'),
+)
+
+
+def opening_balances(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    StockMovement = apps.get_model('seh_1', 'StockMovement')
+
+    for app_label, model_name, counter in TRACKED_COUNTERS:
+        model = apps.get_model(app_label, model_name)
+        content_type, _ = ContentType.objects.get_or_create(
+            app_label=app_label, model=model_name.lower())
+        StockMovement.objects.bulk_create([
+            StockMovement(content_type=content_type, object_id=pk,
+                          counter=counter, quantity=value, reason='opening')
+            for pk, value in model.objects.exclude(**{counter: 0}).values_list('pk', counter)
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('seh_1', '0021_stock_ledger'),
+        ('Azamat_seh', '0014_normalize_sales_names'),
+        ('Anvaraka_sklad', '0006_normalize_selling_buyer'),
+    ]
+
+    operations = [
+        migrations.RunPython(opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.5 on 2026-10-17 21:54
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 500
+
+
+def backfill(apps, schema_editor):
+    # A frozen copy of seh_1.utils.refresh_sales_totals as of this migration.
+    Sales = apps.get_model('seh_1', 'Sales')
+    events = (
+        (apps.get_model('seh_1', 'SalesEvent'), 'cut_summary'),
+        (apps.get_model('seh_1', 'SalesEvent2'), 'uncut_summary'),
+    )
+    pks = list(Sales.objects.values_list('pk', flat=True))
+    for start in range(0, len(pks), CHUNK_SIZE):
+        chunk = pks[start:start + CHUNK_SIZE]
+        sales = {pk: Sales(pk=pk, total_price=0, total_profit=0,
+                           cut_summary=[], uncut_summary=[]) for pk in chunk}
+        for event_model, summary in events:
+            lines = event_model.objects.filter(sales__in=chunk).order_by(
+                'pk').values_list('sales_id', 'quantity_sold', 'product__name',
+                                  'single_sold_price', 'total_sold_price', 'profit')
+            for sales_id, quantity, name, price, total, profit in lines:
+                sale = sales[sales_id]
+                sale.total_price += total
+                sale.total_profit += profit
+                getattr(sale, summary).append(
+                    {'quantity': quantity, 'product': name, 'price': price})
+        Sales.objects.bulk_update(
+            sales.values(), ['total_price', 'total_profit', 'cut_summary', 'uncut_summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seh_1', '0023_product_unit_cost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sales',
+            name='cut_summary',
+            field=models.JSONField(default=list, editable=False, verbose_name='Kesilgan mahsulotlar'),
+        ),
+        migrations.AddField(
+            model_name='sales',
+            name='total_price',
+            field=models.FloatField(default=0, editable=False, verbose_name='Umumiy narx'),
+        ),
+        migrations.AddField(
+            model_name='sales',
+            name='total_profit',
+            field=models.FloatField(default=0, editable=False, verbose_name='Umumiy foyda'),
+        ),
+        migrations.AddField(
+            model_name='sales',
+            name='uncut_summary',
+            field=models.JSONField(default=list, editable=False, verbose_name='Kesilmagan mahsulotlar'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
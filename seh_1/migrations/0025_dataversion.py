@@ -0,0 +1,25 @@
+# Generated by Django 4.2.5 on 2026-10-17 21:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seh_1', '0024_sales_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=100, unique=True, verbose_name='Model')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Versiya')),
+            ],
+            options={
+                'verbose_name': "Ma'lumot versiyasi ",
+                'verbose_name_plural': "Ma'lumot versiyalari",
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.5 on 2026-10-17 22:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seh_1', '0025_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productproduction',
+            index=models.Index(fields=['date'], name='seh1_production_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productproduction',
+            index=models.Index(fields=['user', 'date'], name='seh1_production_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productproduction',
+            index=models.Index(fields=['product', 'date'], name='seh1_production_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productproduction',
+            index=models.Index(fields=['series', 'date'], name='seh1_production_series_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productreproduction',
+            index=models.Index(fields=['date'], name='seh1_reproduction_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productreproduction',
+            index=models.Index(fields=['user', 'date'], name='seh1_reproduction_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['date'], name='seh1_sales_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['buyer', 'date'], name='seh1_sales_buyer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['seller', 'date'], name='seh1_sales_seller_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['user', 'date'], name='seh1_sales_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warehouse',
+            index=models.Index(fields=['arrival_time'], name='seh1_warehouse_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warehouse',
+            index=models.Index(fields=['component', 'arrival_time'], name='seh1_warehouse_component_idx'),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 4.2.5 on 2026-10-17 22:20
+
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+import django.db.models.deletion
+
+CHUNK_SIZE = 500
+
+
+# A frozen copy of seh_1.utils.link_customers as of this migration.
+def link_customers(Customer, queryset, fields):
+    for foreign_key, text_field in fields.items():
+        variants = {}
+        names = queryset.order_by().values_list(text_field, flat=True).distinct()
+        for name in names.iterator(chunk_size=CHUNK_SIZE):
+            if name and name.strip():
+                variants.setdefault(' '.join(name.split()).casefold(), []).append(name)
+
+        keys = list(variants)
+        customers = {}
+        for start in range(0, len(keys), CHUNK_SIZE):
+            customers.update(Customer.objects.filter(
+                key__in=keys[start:start + CHUNK_SIZE]).values_list('key', 'pk'))
+        missing = [Customer(key=key, name=' '.join(variants[key][0].split()).title())
+                   for key in keys if key not in customers]
+        Customer.objects.bulk_create(missing, batch_size=CHUNK_SIZE)
+        for start in range(0, len(missing), CHUNK_SIZE):
+            customers.update(Customer.objects.filter(key__in=[
+                customer.key for customer in missing[start:start + CHUNK_SIZE]
+            ]).values_list('key', 'pk'))
+
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            queryset.filter(**{f'{text_field}__in': [
+                name for key in chunk for name in variants[key]]}).update(**{
+                    f'{foreign_key}_id': Case(
+                        *[When(**{f'{text_field}__in': variants[key]},
+                               then=Value(customers[key])) for key in chunk])})
+
+
+def backfill(apps, schema_editor):
+    Customer = apps.get_model('seh_1', 'Customer')
+    Sales = apps.get_model('seh_1', 'Sales')
+    link_customers(Customer, Sales.objects.all(), {
+        'buyer_customer': 'buyer', 'seller_customer': 'seller'})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seh_1', '0026_changelist_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=250, verbose_name='Nomi')),
+                ('key', models.CharField(editable=False, max_length=250, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Mijoz ',
+                'verbose_name_plural': 'Mijozlar',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='sales',
+            name='buyer_customer',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='sales_as_buyer', to='seh_1.customer', verbose_name='Sotuvchi'),
+        ),
+        migrations.AddField(
+            model_name='sales',
+            name='seller_customer',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='sales_as_seller', to='seh_1.customer', verbose_name='Haridor'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='sales',
+            name='seh1_sales_buyer_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='sales',
+            name='seh1_sales_seller_idx',
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['buyer_customer', 'date'], name='seh1_sales_buyer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['seller_customer', 'date'], name='seh1_sales_seller_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# The FTS5 trigram tables of seh_1.search as of this migration: the table,
+# its DDL and the statement filling it (the primary key is the rowid).
+SEARCH_INDEXES = (
+    ('seh_1_component_search',
+     "CREATE VIRTUAL TABLE seh_1_component_search USING fts5(title, tokenize='trigram')",
+     "INSERT INTO seh_1_component_search (rowid, title) "
+     "SELECT id, COALESCE(title, '') FROM seh_1_component"),
+    ('seh_1_product_search',
+     "CREATE VIRTUAL TABLE seh_1_product_search USING fts5(name, tokenize='trigram')",
+     "INSERT INTO seh_1_product_search (rowid, name) "
+     "SELECT id, COALESCE(name, '') FROM seh_1_product"),
+    ('seh_1_productreproduction_search',
+     "CREATE VIRTUAL TABLE seh_1_productreproduction_search "
+     "USING fts5(user_username, tokenize='trigram')",
+     "INSERT INTO seh_1_productreproduction_search (rowid, user_username) "
+     "SELECT r.id, COALESCE(u.username, '') FROM seh_1_productreproduction r "
+     "LEFT JOIN auth_user u ON u.id = r.user_id"),
+    ('seh_1_sales_search',
+     "CREATE VIRTUAL TABLE seh_1_sales_search USING fts5(buyer, seller, tokenize='trigram')",
+     "INSERT INTO seh_1_sales_search (rowid, buyer, seller) "
+     "SELECT id, COALESCE(buyer, ''), COALESCE(seller, '') FROM seh_1_sales"),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, create, fill in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+        schema_editor.execute(create)
+        schema_editor.execute(fill)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, create, fill in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seh_1', '0027_customers'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.5 on 2026-10-17 22:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('seh_1', '0028_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, editable=False, max_length=64)),
+                ('model', models.CharField(max_length=100, verbose_name='Model')),
+                ('query', models.TextField(blank=True, verbose_name='Filtrlar')),
+                ('status', models.CharField(choices=[('pending', 'Navbatda'), ('running', 'Tayyorlanmoqda'), ('done', 'Tayyor'), ('failed', 'Xatolik')], default='pending', max_length=10, verbose_name='Holati')),
+                ('progress', models.PositiveIntegerField(default=0, verbose_name='Yozilgan qatorlar')),
+                ('total', models.PositiveIntegerField(blank=True, null=True, verbose_name='Jami qatorlar')),
+                ('filename', models.CharField(max_length=100, verbose_name='Fayl nomi')),
+                ('error', models.TextField(blank=True, verbose_name='Xatolik')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Yaratilgan vaqti')),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Yangilangan vaqti')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Xodim')),
+            ],
+            options={
+                'verbose_name': 'Eksport ',
+                'verbose_name_plural': 'Eksportlar',
+                'ordering': ['-id'],
+            },
+        ),
+    ]
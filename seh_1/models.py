@@ -1,6 +1,11 @@
-from django.db.models import Sum
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import F, Sum
 from django.contrib import admin
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import Q
@@ -9,6 +14,8 @@ from django.utils import timezone
 from mptt.models import MPTTModel
 from openpyxl import Workbook
 
+from .utils import customer_display_name, customer_key
+
 
 class Component(MPTTModel):
     MEASUREMENT_CHOICES = [
@@ -58,6 +65,8 @@ class Product(models.Model):
         default=0, verbose_name="Kesilmaganlar soni")
     total_cut = models.IntegerField(
         default=0, verbose_name="Kesilganlar soni")
+    unit_cost = models.FloatField(
+        default=0, editable=False, verbose_name='Tan narxi')
 
     class Meta:
         verbose_name = 'Produkt '
@@ -67,10 +76,8 @@ class Product(models.Model):
         return self.name
 
     def calculate_product_price(self):
-        product_price = 0
-        for productcomponent in self.productcomponent_set.all():
-            product_price += productcomponent.quantity*productcomponent.component.price
-        return product_price
+        return self.productcomponent_set.aggregate(
+            price=Sum(F('quantity') * F('component__price')))['price'] or 0
 
 
 class ProductComponent(models.Model):
@@ -103,6 +110,14 @@ class ProductProduction(models.Model):
         verbose_name = 'Tovar '
         verbose_name_plural = 'Ishlab Chiqarilgan Tovarlar'
         ordering = ['-id']
+        # Changelist filters: date hierarchy ranges ordered by date, and the
+        # equality list_filter columns combined with the date range.
+        indexes = [
+            models.Index(fields=['date'], name='seh1_production_date_idx'),
+            models.Index(fields=['user', 'date'], name='seh1_production_user_idx'),
+            models.Index(fields=['product', 'date'], name='seh1_production_product_idx'),
+            models.Index(fields=['series', 'date'], name='seh1_production_series_idx'),
+        ]
 
     def __str__(self):
         return f'{self.series}-{self.product} ({self.quantity} dona'
@@ -122,6 +137,10 @@ class Warehouse(models.Model):
     class Meta:
         verbose_name = 'Keltirilgan Komponentlar '
         verbose_name_plural = 'Ombor'
+        indexes = [
+            models.Index(fields=['arrival_time'], name='seh1_warehouse_time_idx'),
+            models.Index(fields=['component', 'arrival_time'], name='seh1_warehouse_component_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         self.price = self.component.price * self.quantity
@@ -154,6 +173,10 @@ class ProductReProduction(models.Model):
     class Meta:
         verbose_name = 'Kesilgan tovarlar '
         verbose_name_plural = 'Kesish Bo\'limi'
+        indexes = [
+            models.Index(fields=['date'], name='seh1_reproduction_date_idx'),
+            models.Index(fields=['user', 'date'], name='seh1_reproduction_user_idx'),
+        ]
 
 
 class CuttingEvent(models.Model):
@@ -182,6 +205,33 @@ class CuttingEvent(models.Model):
         unique_together = ['product', 'product_reproduction']
 
 
+class Customer(models.Model):
+    """
+    A buyer or seller shared by the sales tables of all sections. Free-text
+    names are matched on ``key``, so spelling variants that differ only in
+    case or spacing resolve to the same customer.
+    """
+    name = models.CharField(max_length=250, verbose_name='Nomi')
+    key = models.CharField(max_length=250, unique=True, editable=False)
+
+    class Meta:
+        verbose_name = 'Mijoz '
+        verbose_name_plural = 'Mijozlar'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def for_name(cls, name):
+        """The customer for ``name``, created on first use; ``None`` for blanks."""
+        if not name or not name.strip():
+            return None
+        customer, created = cls.objects.get_or_create(
+            key=customer_key(name), defaults={'name': customer_display_name(name)})
+        return customer
+
+
 class Sales(models.Model):
     series = models.CharField(max_length=50, verbose_name="Seriya")
     buyer = models.CharField(max_length=250, verbose_name='Sotuvchi')
@@ -190,24 +240,53 @@ class Sales(models.Model):
         User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Xodim')
     date = models.DateTimeField(
         auto_now_add=True, verbose_name='Sotilgan sana')
-
-    def calculate_total_price(self):
-        sales_events = self.selling_cut.all()
-        total_price = sum(event.total_sold_price for event in sales_events)
-        return total_price
+    # Indexed through the (customer, date) indexes below.
+    buyer_customer = models.ForeignKey(
+        Customer, on_delete=models.PROTECT, null=True, blank=True, editable=False,
+        db_index=False, related_name='sales_as_buyer', verbose_name='Sotuvchi')
+    seller_customer = models.ForeignKey(
+        Customer, on_delete=models.PROTECT, null=True, blank=True, editable=False,
+        db_index=False, related_name='sales_as_seller', verbose_name='Haridor')
+
+    total_price = models.FloatField(
+        default=0, editable=False, verbose_name='Umumiy narx')
+    total_profit = models.FloatField(
+        default=0, editable=False, verbose_name='Umumiy foyda')
+    cut_summary = models.JSONField(
+        default=list, editable=False, verbose_name='Kesilgan mahsulotlar')
+    uncut_summary = models.JSONField(
+        default=list, editable=False, verbose_name='Kesilmagan mahsulotlar')
 
     def save(self, *args, **kwargs):
         self.buyer = self.buyer.title()
         self.seller = self.seller.title()
+        self.buyer_customer = Customer.for_name(self.buyer)
+        self.seller_customer = Customer.for_name(self.seller)
         super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = 'Sotuv '
         verbose_name_plural = "Sotuv Bo'limi "
+        indexes = [
+            models.Index(fields=['date'], name='seh1_sales_date_idx'),
+            models.Index(fields=['buyer_customer', 'date'], name='seh1_sales_buyer_idx'),
+            models.Index(fields=['seller_customer', 'date'], name='seh1_sales_seller_idx'),
+            models.Index(fields=['user', 'date'], name='seh1_sales_user_idx'),
+        ]
 
     def __str__(self):
-        total_price = self.calculate_total_price()
-        return f"{self.buyer} - {self.seller} - {total_price}$"
+        return f"{self.buyer} - {self.seller} - {self.total_price}$"
+
+    @staticmethod
+    def summary_text(lines, currency=None):
+        """
+        Render a stored line summary as ``2 ta Stretch (10.0$ dan), ...``.
+        Prices are left out when ``currency`` is None.
+        """
+        if currency is None:
+            return ", ".join(f"{line['quantity']} ta {line['product']}" for line in lines)
+        return ", ".join(f"{line['quantity']} ta {line['product']} ({line['price']}{currency} dan)"
+                         for line in lines)
 
 
 class SalesEvent(models.Model):
@@ -236,7 +315,7 @@ class SalesEvent(models.Model):
         self.total_sold_price = self.single_sold_price * self.quantity_sold
 
         self.profit = self.total_sold_price - \
-            (self.product.calculate_product_price() * self.quantity_sold)
+            (self.product.unit_cost * self.quantity_sold)
 
         super().save(*args, **kwargs)
 
@@ -277,7 +356,7 @@ class SalesEvent2(models.Model):
         self.total_sold_price = self.single_sold_price * self.quantity_sold
 
         self.profit = self.total_sold_price - \
-            (self.product.calculate_product_price() * self.quantity_sold)
+            (self.product.unit_cost * self.quantity_sold)
 
         super().save(*args, **kwargs)
 
@@ -288,3 +367,124 @@ class SalesEvent2(models.Model):
 
     def __str__(self):
         return str(self.quantity_sold)+' ta '+self.product.name
+
+
+class NotificationOutbox(models.Model):
+    chat_id = models.CharField(max_length=50, verbose_name='Chat ID')
+    payload = models.JSONField(verbose_name='Xabar')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Urinishlar')
+    next_attempt = models.DateTimeField(
+        default=timezone.now, verbose_name='Keyingi urinish')
+    sent = models.DateTimeField(
+        null=True, blank=True, verbose_name='Yuborilgan vaqti')
+    last_error = models.TextField(blank=True, verbose_name='Oxirgi xatolik')
+    created = models.DateTimeField(
+        auto_now_add=True, verbose_name='Yaratilgan vaqti')
+
+    class Meta:
+        verbose_name = 'Xabar '
+        verbose_name_plural = 'Xabarlar navbati'
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.chat_id}: {self.payload.get("text", "")}'
+
+
+class StockMovement(models.Model):
+    REASON_CHOICES = [
+        ('opening', "Boshlang'ich qoldiq"),
+        ('arrival', 'Keltirildi'),
+        ('consumption', 'Ishlab chiqarishga sarflandi'),
+        ('production', 'Ishlab chiqarildi'),
+        ('cut', 'Kesildi'),
+        ('sale', 'Sotildi'),
+        ('reversal', 'Bekor qilindi'),
+        ('adjustment', "Qo'lda tuzatildi"),
+    ]
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    item = GenericForeignKey('content_type', 'object_id')
+    counter = models.CharField(max_length=20, verbose_name='Hisoblagich')
+    quantity = models.FloatField(verbose_name='Miqdor')
+    reason = models.CharField(
+        max_length=20, choices=REASON_CHOICES, verbose_name='Sabab')
+    date = models.DateTimeField(default=timezone.now, verbose_name='Vaqti')
+
+    class Meta:
+        verbose_name = 'Harakat '
+        verbose_name_plural = 'Ombor harakatlari'
+        indexes = [
+            models.Index(fields=['content_type', 'counter', 'date']),
+            models.Index(fields=['content_type', 'object_id', 'counter']),
+        ]
+
+    def __str__(self):
+        return f'{self.get_reason_display()}: {self.quantity}'
+
+
+class StockSnapshot(models.Model):
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    counter = models.CharField(max_length=20, verbose_name='Hisoblagich')
+    date = models.DateField(verbose_name='Sana')
+    quantity = models.FloatField(verbose_name='Kun oxiridagi qoldiq')
+
+    class Meta:
+        verbose_name = 'Qoldiq '
+        verbose_name_plural = 'Kunlik qoldiqlar'
+        unique_together = ['content_type', 'counter', 'date', 'object_id']
+
+    def __str__(self):
+        return f'{self.date}: {self.quantity}'
+
+
+class DataVersion(models.Model):
+    label = models.CharField(max_length=100, unique=True, verbose_name='Model')
+    version = models.PositiveBigIntegerField(default=0, verbose_name='Versiya')
+
+    class Meta:
+        verbose_name = "Ma'lumot versiyasi "
+        verbose_name_plural = "Ma'lumot versiyalari"
+
+    def __str__(self):
+        return f'{self.label} v{self.version}'
+
+
+class ExportJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Navbatda'),
+        ('running', 'Tayyorlanmoqda'),
+        ('done', 'Tayyor'),
+        ('failed', 'Xatolik'),
+    ]
+
+    key = models.CharField(max_length=64, db_index=True, editable=False)
+    model = models.CharField(max_length=100, verbose_name='Model')
+    query = models.TextField(blank=True, verbose_name='Filtrlar')
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Xodim')
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Holati')
+    progress = models.PositiveIntegerField(default=0, verbose_name='Yozilgan qatorlar')
+    total = models.PositiveIntegerField(null=True, blank=True, verbose_name='Jami qatorlar')
+    filename = models.CharField(max_length=100, verbose_name='Fayl nomi')
+    error = models.TextField(blank=True, verbose_name='Xatolik')
+    created = models.DateTimeField(auto_now_add=True, verbose_name='Yaratilgan vaqti')
+    updated = models.DateTimeField(default=timezone.now, verbose_name='Yangilangan vaqti')
+
+    class Meta:
+        verbose_name = 'Eksport '
+        verbose_name_plural = 'Eksportlar'
+        ordering = ['-id']
+
+    def __str__(self):
+        return f'{self.filename} ({self.get_status_display()})'
+
+    @property
+    def path(self):
+        return Path(settings.EXPORT_ROOT) / f'{self.key}.xlsx'
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
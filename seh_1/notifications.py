@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import NotificationOutbox
+
+MAX_ATTEMPTS = 8
+BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 60 * 60
+REQUEST_TIMEOUT = 10
+# A claimed message is not due for other senders for this long; if its
+# sender dies, the message is retried afterwards.
+CLAIM_SECONDS = 5 * 60
+
+
+def queue_low_stock_notification(*components):
+    """Queue a Telegram message per admin and component after the commit."""
+    url = f'{settings.HOSTNAME}' + \
+        reverse('admin:seh_1_component_changelist')
+    messages = [
+        NotificationOutbox(chat_id=tg_id, payload={
+            'chat_id': tg_id,
+            'text': f'{component.title} limitdan kamayib ketdi!',
+            'reply_markup': {
+                'inline_keyboard': [[{'text': 'Ko\'rish', 'url': url}]]
+            }
+        })
+        for component in components
+        for tg_id in settings.ADMINS
+    ]
+    transaction.on_commit(
+        lambda: NotificationOutbox.objects.bulk_create(messages))
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS))
+
+
+def send_pending(batch_size=50):
+    """
+    Send one batch of due messages and return how many were delivered.
+
+    Failed messages are retried with exponential backoff until
+    ``MAX_ATTEMPTS`` is reached.
+    """
+    batch = claim_due(batch_size)
+
+    url = f'{settings.TELEGRAM_API_URL}/bot{settings.TOKEN}/sendMessage'
+    delivered = 0
+    with requests.Session() as session:
+        for message in batch:
+            try:
+                response = session.post(
+                    url, json=message.payload, timeout=REQUEST_TIMEOUT)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                message.last_error = str(e)
+                message.next_attempt = timezone.now() + backoff(message.attempts)
+            else:
+                message.sent = timezone.now()
+                message.last_error = ''
+                delivered += 1
+
+    NotificationOutbox.objects.bulk_update(
+        batch, ['next_attempt', 'sent', 'last_error'])
+    return delivered
+
+
+def claim_due(batch_size):
+    """
+    Claim up to ``batch_size`` due messages for this sender, so concurrent
+    ``send_notifications`` runs never post the same message twice.
+
+    Each row is claimed with a conditional ``UPDATE`` on the attempt count
+    seen here, which counts the attempt and moves ``next_attempt`` past
+    ``CLAIM_SECONDS``; rows another sender claimed first are skipped.
+    """
+    now = timezone.now()
+    due = NotificationOutbox.objects.filter(
+        sent__isnull=True, attempts__lt=MAX_ATTEMPTS, next_attempt__lte=now)
+    claimed = []
+    for message in due[:batch_size]:
+        if due.filter(pk=message.pk, attempts=message.attempts).update(
+                attempts=F('attempts') + 1,
+                next_attempt=now + timedelta(seconds=CLAIM_SECONDS)):
+            message.attempts += 1
+            claimed.append(message)
+    return claimed
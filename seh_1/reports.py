@@ -0,0 +1,191 @@
+import math
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models import CharField, F, Sum, Value
+
+from .costing import BOMMatrix, get_bom_matrix
+from .ledger import stock_at
+
+
+def _section(title, items, stock, currency=None):
+    rows = []
+    totals = {}
+    for item in items:
+        quantity = stock.get(item['id'], 0)
+        if not quantity:
+            continue
+        item_currency = currency or item['currency']
+        value = quantity * item['price']
+        rows.append({
+            'section': item['section'] or '-',
+            'title': item['title'],
+            'quantity': quantity,
+            'price': item['price'],
+            'value': value,
+            'currency': item_currency,
+        })
+        totals[item_currency] = totals.get(item_currency, 0) + value
+    return {'title': title, 'rows': rows, 'totals': totals}
+
+
+def _sum_stock(*stocks):
+    total = {}
+    for stock in stocks:
+        for object_id, quantity in stock.items():
+            total[object_id] = total.get(object_id, 0) + quantity
+    return total
+
+
+def stock_valuation(when):
+    """
+    Component and product stock of all three workshops at ``when``, valued
+    at the current prices.
+    """
+    Component = apps.get_model('seh_1', 'Component')
+    Product = apps.get_model('seh_1', 'Product')
+    AzamatComponent = apps.get_model('Azamat_seh', 'Component')
+    AzamatProduct = apps.get_model('Azamat_seh', 'Product')
+    AnvarakaProduct = apps.get_model('Anvaraka_sklad', 'Product')
+
+    return [
+        _section(
+            'Strech: Komponentlar',
+            Component.objects.filter(parent__isnull=False).values(
+                'id', 'title', 'price', section=F('parent__title')),
+            stock_at(Component, 'total', when), '$'),
+        _section(
+            'Strech: Produktlar',
+            Product.objects.values(
+                'id', 'price', title=F('name'), section=Value(None, CharField())),
+            _sum_stock(stock_at(Product, 'total_new', when),
+                       stock_at(Product, 'total_cut', when)), '$'),
+        _section(
+            'Multipak: Komponentlar',
+            AzamatComponent.objects.filter(parent__isnull=False).values(
+                'id', 'title', 'price', section=F('parent__title')),
+            stock_at(AzamatComponent, 'total', when), 'sum'),
+        _section(
+            'Multipak: Tovarlar',
+            AzamatProduct.objects.filter(parent__isnull=False).values(
+                'id', 'price', title=F('name'), section=F('parent__name')),
+            stock_at(AzamatProduct, 'total_new', when), 'sum'),
+        _section(
+            'Sklad: Mahsulotlar',
+            AnvarakaProduct.objects.filter(parent__isnull=False).values(
+                'id', 'title', 'price', 'currency', section=F('parent__title')),
+            stock_at(AnvarakaProduct, 'total', when)),
+    ]
+
+
+MRP_CATALOGUES = ('seh_1', 'Azamat_seh')
+CATALOGUE_CURRENCY = {'seh_1': '$', 'Azamat_seh': 'sum'}
+
+
+def material_requirements(app_label, plan):
+    """
+    Components needed to build ``plan`` (``{product_id: quantity}``) in the
+    ``app_label`` workshop, next to their current stock.
+
+    The BOM of all planned products is exploded in one batch; rows are sorted
+    with the largest shortage first.
+    """
+    Component = apps.get_model(app_label, 'Component')
+    ProductComponent = apps.get_model(app_label, 'ProductComponent')
+
+    plan = {pk: quantity for pk, quantity in plan.items() if quantity}
+    if not plan:
+        return []
+    required = BOMMatrix.load(ProductComponent, list(plan)).requirements(plan)
+
+    rows = []
+    for component in Component.objects.filter(pk__in=required).values(
+            'id', 'title', 'total', 'measurement', section=F('parent__title')):
+        shortage = max(required[component['id']] - component['total'], 0)
+        rows.append({
+            'section': component['section'] or '-',
+            'title': component['title'],
+            'measurement': component['measurement'],
+            'required': required[component['id']],
+            'total': component['total'],
+            'remaining': component['total'] - required[component['id']],
+            'shortage': shortage,
+        })
+    rows.sort(key=lambda row: (-row['shortage'], row['section'], row['title']))
+    return rows
+
+
+SALES_EVENT_MODELS = {
+    'seh_1': ('SalesEvent', 'SalesEvent2'),
+    'Azamat_seh': ('SalesEvent',),
+}
+SALES_CACHE_TIMEOUT = 60 * 5
+
+
+def sales_by_product(app_label, since):
+    """
+    ``{product_id: [quantity, revenue, profit]}`` of the sales made since
+    ``since``, summed over all sales event models of the workshop.
+    Cached for a few minutes per workshop and day.
+    """
+    key = f'sales_by_product:{app_label}:{since:%Y-%m-%d}'
+    totals = cache.get(key)
+    if totals is None:
+        totals = {}
+        for model_name in SALES_EVENT_MODELS[app_label]:
+            events = apps.get_model(app_label, model_name).objects.filter(
+                sales__date__gte=since).order_by().values('product').annotate(
+                quantity=Sum('quantity_sold'), revenue=Sum('total_sold_price'),
+                profit=Sum('profit'))
+            for event in events:
+                row = totals.setdefault(event['product'], [0, 0, 0])
+                row[0] += event['quantity']
+                row[1] += event['revenue']
+                row[2] += event['profit']
+        cache.set(key, totals, SALES_CACHE_TIMEOUT)
+    return totals
+
+
+def price_simulation(app_label, prices, since):
+    """
+    Unit cost, margin and sales profit of the products affected by the
+    hypothetical component ``prices`` (``{component_id: price}``).
+
+    Costs come from the cached BOM matrix, and the sales made since ``since``
+    are re-priced with the simulated cost. Nothing is written to the database.
+    """
+    Component = apps.get_model(app_label, 'Component')
+    Product = apps.get_model(app_label, 'Product')
+    ProductComponent = apps.get_model(app_label, 'ProductComponent')
+
+    matrix = get_bom_matrix(ProductComponent)
+    vector = matrix.price_vector(Component)
+    current = matrix.dot(vector)
+    simulated = matrix.dot(matrix.override(vector, prices))
+    changed = {pk: (old, new) for pk, old, new in zip(
+        matrix.product_ids, current, simulated) if not math.isclose(old, new)}
+
+    sales = sales_by_product(app_label, since)
+    rows = []
+    totals = {'recorded_profit': 0, 'simulated_profit': 0}
+    for product in Product.objects.filter(pk__in=changed).values('id', 'name', 'price'):
+        old, new = changed[product['id']]
+        quantity, revenue, profit = sales.get(product['id'], (0, 0, 0))
+        row = {
+            'name': product['name'],
+            'price': product['price'],
+            'cost': old,
+            'new_cost': new,
+            'margin': product['price'] - old,
+            'new_margin': product['price'] - new,
+            'quantity': quantity,
+            'revenue': revenue,
+            'recorded_profit': profit,
+            'simulated_profit': revenue - quantity * new,
+        }
+        rows.append(row)
+        totals['recorded_profit'] += profit
+        totals['simulated_profit'] += row['simulated_profit']
+    rows.sort(key=lambda row: row['new_margin'] - row['margin'])
+    return {'rows': rows, 'totals': totals,
+            'currency': CATALOGUE_CURRENCY[app_label]}
@@ -0,0 +1,159 @@
+"""
+SQLite FTS5 trigram indexes behind the admin ``search_fields``.
+
+Each searchable model gets a ``<db_table>_search`` virtual table with one
+column per search field and the model primary key as ``rowid``. A trigram
+MATCH finds the same substrings as ``icontains`` without scanning the
+model table, so search latency does not grow with the table. Terms shorter
+than three characters cannot be matched by trigrams and fall back to the
+regular ``LIKE`` search.
+
+The tables are created and filled by migrations, which spell out their
+DDL so later changes here do not alter old migrations, and kept in sync by
+``post_save``/``post_delete`` receivers that ``FullTextSearchMixin``
+connects for its model. Changing ``search_fields`` of such an admin needs
+a migration that recreates the table.
+"""
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.utils.text import smart_split, unescape_string_literal
+
+# Shortest term the trigram tokenizer can match.
+MIN_TERM_LENGTH = 3
+# Rows re-indexed per DELETE/INSERT round when refreshing given rows.
+REFRESH_CHUNK_SIZE = 500
+
+
+class SearchIndex:
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = tuple(fields)
+
+    @property
+    def table(self):
+        return f'{self.model._meta.db_table}_search'
+
+    @property
+    def columns(self):
+        return [field.replace('__', '_') for field in self.fields]
+
+    def available(self):
+        return connection.vendor == 'sqlite'
+
+    def refresh(self, pks=None, using='default'):
+        """Re-index the rows ``pks``, or every row of the model."""
+        if pks is not None:
+            pks = list(pks)
+            for start in range(0, len(pks), REFRESH_CHUNK_SIZE):
+                self._refresh(pks[start:start + REFRESH_CHUNK_SIZE], using)
+        else:
+            self._refresh(None, using)
+
+    def _refresh(self, pks, using):
+        db = connections[using]
+        table = db.ops.quote_name(self.table)
+        rows = self.model._default_manager.using(using).values_list('pk', *self.fields)
+        with db.cursor() as cursor:
+            if pks is None:
+                cursor.execute(f'DELETE FROM {table}')
+            else:
+                rows = rows.filter(pk__in=pks)
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE rowid IN ({", ".join(["%s"] * len(pks))})', pks)
+            columns = ', '.join(['rowid', *(db.ops.quote_name(column) for column in self.columns)])
+            cursor.executemany(
+                f'INSERT INTO {table} ({columns}) '
+                f'VALUES ({", ".join(["%s"] * (len(self.fields) + 1))})',
+                [(pk, *('' if value is None else str(value) for value in values))
+                 for pk, *values in rows.iterator(chunk_size=2000)])
+
+    def remove(self, pk, using='default'):
+        db = connections[using]
+        with db.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {db.ops.quote_name(self.table)} WHERE rowid = %s', [pk])
+
+    def match_expression(self, search_term):
+        """
+        FTS5 query requiring every term, like the admin search does, or
+        ``None`` if a term is too short for the trigram index.
+        """
+        terms = []
+        for term in smart_split(search_term):
+            if term.startswith(('"', "'")) and term[0] == term[-1]:
+                term = unescape_string_literal(term)
+            if len(term) < MIN_TERM_LENGTH:
+                return None
+            terms.append('"%s"' % term.replace('"', '""'))
+        return ' AND '.join(terms) or None
+
+    def filter(self, queryset, search_term):
+        """``queryset`` narrowed to the rows matching ``search_term``, or ``None``."""
+        expression = self.match_expression(search_term)
+        if expression is None or not self.available():
+            return None
+        table = connection.ops.quote_name(self.table)
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {table} WHERE {table} MATCH %s', (expression,)))
+
+    def connect(self):
+        """
+        Keep the index in sync with saves and deletes of the indexed rows,
+        including the raw saves of ``loaddata``. Does nothing where the
+        database has no index tables.
+        """
+        if not self.available():
+            return
+        uid = f'search_index:{self.table}'
+        local = {field for field in self.fields if '__' not in field}
+
+        def saved(sender, instance, using, update_fields=None, **kwargs):
+            if update_fields is not None and not local & set(update_fields):
+                return
+            self.refresh([instance.pk], using)
+
+        def deleted(sender, instance, using, **kwargs):
+            self.remove(instance.pk, using)
+
+        post_save.connect(saved, sender=self.model, weak=False, dispatch_uid=uid)
+        post_delete.connect(deleted, sender=self.model, weak=False, dispatch_uid=uid)
+
+        # Fields of related rows (``user__username``): re-index the rows
+        # pointing at a related row when it changes.
+        related = {}
+        for field in self.fields:
+            if '__' in field:
+                name, rest = field.split('__', 1)
+                related.setdefault(name, set()).add(rest.split('__', 1)[0])
+        for name, names in related.items():
+            relation = self.model._meta.get_field(name)
+
+            def related_saved(sender, instance, using, update_fields=None,
+                              name=name, names=names, **kwargs):
+                if update_fields is not None and not names & set(update_fields):
+                    return
+                self.refresh(self.model._default_manager.using(using).filter(
+                    **{name: instance}).values_list('pk', flat=True), using)
+
+            post_save.connect(related_saved, sender=relation.related_model, weak=False,
+                              dispatch_uid=f'{uid}:{name}')
+
+
+class FullTextSearchMixin:
+    """
+    Search the changelist through the FTS5 index of ``search_fields``
+    (plain substring fields only, no ``^``/``=``/``@`` prefixes).
+    """
+
+    def __init__(self, model, admin_site):
+        super().__init__(model, admin_site)
+        self.search_index = SearchIndex(model, self.search_fields)
+        self.search_index.connect()
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term:
+            matches = self.search_index.filter(queryset, search_term)
+            if matches is not None:
+                return matches, False
+        return super().get_search_results(request, queryset, search_term)
+
@@ -1,3 +1,1294 @@
-from django.test import TestCase
+import importlib
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import PAGE_VAR
+from django.contrib.auth.models import Permission, User
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core import serializers
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+
+from Anvaraka_sklad.models import Selling
+from Azamat_seh.models import Component as AzamatComponent
+from Azamat_seh.models import Product as AzamatProduct
+from Azamat_seh.models import ProductComponent as AzamatProductComponent
+from Azamat_seh.models import Sales as AzamatSales
+
+from . import views
+from .changelist import APPROXIMATE_COUNT, COUNT_VAR, CURSOR_VAR
+from .costing import catalogue_costs
+from .exports import (EXPORT_RETENTION, STALE_JOB_TIMEOUT, XLSX_CONTENT_TYPE,
+                      build_pending_exports, claim_export_job)
+from .ledger import (record_movements, stock_at, take_snapshots,
+                     tracked_counters, verify_counters)
+from .low_stock import get_low_stock
+from .middleware import ComponentNotificationMiddleware
+from .models import (Component, Customer, CuttingEvent, ExportJob, NotificationOutbox, Product,
+                     ProductComponent, ProductProduction, ProductReProduction,
+                     Sales, SalesEvent, SalesEvent2, StockMovement, Warehouse)
+from .notifications import MAX_ATTEMPTS, claim_due, send_pending
+from .search import SearchIndex
+from .utils import link_customers, refresh_sales_totals
+
+EXPORT_ROOT = tempfile.TemporaryDirectory()
+
+
+def get_export(client, url, data=None, **extra):
+    """
+    Request the export at ``url``, build the queued job as ``build_exports``
+    does and request it again for the finished file.
+    """
+    response = client.get(url, data, **extra)
+    if response.status_code == 302 and build_pending_exports():
+        response = client.get(url, data, **extra)
+    return response
+
+
+class NormalizeCustomerNamesTest(TestCase):
+    def test_command_title_cases_all_sales_tables(self):
+        Sales.objects.bulk_create([
+            Sales(series='1', buyer='ali valiyev', seller='hasan'),
+            Sales(series='2', buyer='Karim', seller='Olim'),
+        ])
+        AzamatSales.objects.bulk_create(
+            [AzamatSales(buyer='aziz', seller='bobur')])
+        Selling.objects.bulk_create([Selling(buyer='jasur aka')])
+
+        call_command('normalize_customer_names',
+                     chunk_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(Sales.objects.values_list('buyer', 'seller')),
+            [('Ali Valiyev', 'Hasan'), ('Karim', 'Olim')])
+        self.assertEqual(AzamatSales.objects.get().buyer, 'Aziz')
+        self.assertEqual(Selling.objects.get().buyer, 'Jasur Aka')
+
+
+class ViewsImportTest(TestCase):
+    def test_import_does_not_touch_database(self):
+        for size in (0, 50):
+            Sales.objects.bulk_create(
+                [Sales(series=str(i), buyer='ali', seller='vali') for i in range(size)])
+            with CaptureQueriesContext(connection) as queries:
+                importlib.reload(views)
+            self.assertEqual(len(queries), 0)
+
+
+class ComponentNotificationMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.section = Component.objects.create(
+            title='Plyonka', price=0, measurement='kg')
+        self.component = Component.objects.create(
+            parent=self.section, title='Rulon', price=2, measurement='kg',
+            total=1000, notification_limit=500)
+        self.middleware = ComponentNotificationMiddleware(
+            lambda request: HttpResponse())
+
+    def make_request(self, path='/admin/'):
+        request = RequestFactory().get(path)
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+        return request
+
+    def test_low_stock_set_follows_component_saves(self):
+        self.assertEqual(get_low_stock(), {})
+
+        self.component.total = 100
+        self.component.save()
+        self.assertEqual(get_low_stock(), {self.component.pk: 'Rulon'})
+
+        self.component.total = 800
+        self.component.save()
+        self.assertEqual(get_low_stock(), {})
+
+        self.component.total = 100
+        self.component.save()
+        self.component.delete()
+        self.assertEqual(get_low_stock(), {})
+
+    def test_no_queries_per_request(self):
+        self.component.total = 100
+        self.component.save()
+        get_low_stock()
+
+        request = self.make_request()
+        with CaptureQueriesContext(connection) as queries:
+            self.middleware(request)
+        self.assertEqual(len(queries), 0)
+        self.assertIn('Rulon', str(list(get_messages(request))[0]))
+
+        with CaptureQueriesContext(connection) as queries:
+            for path in ('/admin/', '/static/admin/css/base.css'):
+                self.middleware(self.make_request(path))
+        self.assertEqual(len(queries), 0)
+
+    def test_static_requests_are_skipped(self):
+        self.component.total = 100
+        self.component.save()
+
+        request = self.make_request('/static/admin/css/base.css')
+        self.middleware(request)
+        self.assertEqual(list(get_messages(request)), [])
+
+
+class TelegramStub(ThreadingHTTPServer):
+    """Local stand-in for api.telegram.org that records posted messages."""
+
+    def __init__(self):
+        self.received = []
+        self.status = 200
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers['Content-Length'])
+                stub.received.append(
+                    (self.path, json.loads(self.rfile.read(length))))
+                self.send_response(stub.status)
+                self.end_headers()
+                self.wfile.write(b'{"ok": true}')
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server_port}'
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class NotificationOutboxTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = TelegramStub()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.shutdown()
+        cls.stub.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.stub.received.clear()
+        self.stub.status = 200
+        section = Component.objects.create(
+            title='Plyonka', price=0, measurement='kg')
+        self.component = Component.objects.create(
+            parent=section, title='Rulon', price=2, measurement='kg',
+            total=600, notification_limit=500)
+        self.product = Product.objects.create(
+            name='Stretch', invalid_price=1, price=10)
+        ProductComponent.objects.create(
+            product=self.product, component=self.component, quantity=1)
+
+        overrides = override_settings(
+            TELEGRAM_API_URL=self.stub.url, TOKEN='secret', ADMINS=['11', '22'])
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_production_save_only_queues_messages(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductProduction.objects.create(
+                series='A1', product=self.product, quantity=200)
+
+        self.assertEqual(self.stub.received, [])
+        self.assertEqual(
+            sorted(NotificationOutbox.objects.values_list('chat_id', flat=True)), ['11', '22'])
+
+        self.assertEqual(send_pending(), 2)
+        path, payload = self.stub.received[0]
+        self.assertEqual(path, '/botsecret/sendMessage')
+        self.assertEqual(payload['text'], 'Rulon limitdan kamayib ketdi!')
+        self.assertFalse(NotificationOutbox.objects.filter(
+            sent__isnull=True).exists())
+
+    def test_rolled_back_production_queues_nothing(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            ProductProduction.objects.create(
+                series='A1', product=self.product, quantity=200)
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        NotificationOutbox.objects.create(chat_id='11', payload={'text': 'x'})
+        self.stub.status = 500
+
+        self.assertEqual(send_pending(), 0)
+        message = NotificationOutbox.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertIsNone(message.sent)
+        self.assertGreater(message.next_attempt, timezone.now())
+
+        # Not due yet, so nothing is posted again
+        self.assertEqual(send_pending(), 0)
+        self.assertEqual(len(self.stub.received), 1)
+
+        self.stub.status = 200
+        NotificationOutbox.objects.update(
+            next_attempt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(send_pending(), 1)
+        self.assertIsNotNone(NotificationOutbox.objects.get().sent)
+
+    def test_overlapping_senders_claim_each_message_once(self):
+        first, second = [NotificationOutbox.objects.create(
+            chat_id=chat_id, payload={'text': 'x'}) for chat_id in ('11', '22')]
+        self.assertEqual(claim_due(1), [first])
+        self.assertEqual(claim_due(5), [second])
+        self.assertEqual(claim_due(5), [])
+
+        # Another sender claims the row between this run's SELECT and UPDATE.
+        NotificationOutbox.objects.update(next_attempt=timezone.now())
+        overlap = []
+
+        def other_sender(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if sql.startswith('SELECT') and not overlap:
+                overlap.append(sql)
+                NotificationOutbox.objects.filter(pk=first.pk).update(
+                    attempts=F('attempts') + 1, next_attempt=timezone.now() + timedelta(minutes=5))
+            return result
+
+        with connection.execute_wrapper(other_sender):
+            self.assertEqual(claim_due(5), [second])
+        self.assertEqual(send_pending(), 0)
+        self.assertEqual(self.stub.received, [])
+
+    def test_gives_up_after_max_attempts(self):
+        NotificationOutbox.objects.create(
+            chat_id='11', payload={'text': 'x'}, attempts=MAX_ATTEMPTS)
+        self.assertEqual(send_pending(), 0)
+        self.assertEqual(self.stub.received, [])
+
+
+class ProductionStockTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.section = Component.objects.create(
+            title='Plyonka', price=0, measurement='kg')
+
+    def make_product(self, size):
+        product = Product.objects.create(
+            name=f'Stretch {size}', invalid_price=1, price=10)
+        components = [Component.objects.create(
+            parent=self.section, title=f'K{size}-{i}', price=1, measurement='kg',
+            total=10000, notification_limit=0) for i in range(size)]
+        ProductComponent.objects.bulk_create([ProductComponent(
+            product=product, component=component, quantity=i + 1)
+            for i, component in enumerate(components)])
+        return product, components
+
+    def test_production_updates_totals_and_reverts_on_delete(self):
+        product, components = self.make_product(3)
+
+        production = ProductProduction.objects.create(
+            series='A1', product=product, quantity=10)
+        product.refresh_from_db()
+        self.assertEqual(product.total_new, 10)
+        self.assertEqual(
+            [c.total for c in Component.objects.filter(pk__in=[c.pk for c in components]).order_by('title')],
+            [9990, 9980, 9970])
+
+        production.delete()
+        product.refresh_from_db()
+        self.assertEqual(product.total_new, 0)
+        self.assertEqual(set(Component.objects.filter(
+            pk__in=[c.pk for c in components]).values_list('total', flat=True)), {10000})
+
+    def test_query_count_does_not_grow_with_bom(self):
+        # The first production also creates the DataVersion row.
+        ProductProduction.objects.create(
+            series='A0', product=self.make_product(1)[0], quantity=1)
+        counts = []
+        for size in (5, 50):
+            product, _ = self.make_product(size)
+            with CaptureQueriesContext(connection) as queries:
+                ProductProduction.objects.create(
+                    series='A1', product=product, quantity=1)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class StockLedgerTest(TestCase):
+    def setUp(self):
+        section = Component.objects.create(
+            title='Plyonka', price=0, measurement='kg')
+        self.component = Component.objects.create(
+            parent=section, title='Rulon', price=2, measurement='kg',
+            notification_limit=0)
+        self.product = Product.objects.create(
+            name='Stretch', invalid_price=1, price=10)
+        ProductComponent.objects.create(
+            product=self.product, component=self.component, quantity=2)
+
+    def assertLedgerMatchesCounters(self):
+        for model, counter in tracked_counters():
+            self.assertEqual(verify_counters(model, counter), [])
+
+    def test_every_stock_change_is_recorded(self):
+        warehouse = Warehouse.objects.create(
+            component=self.component, quantity=100)
+        warehouse.quantity = 120
+        warehouse.save()
+        ProductProduction.objects.create(
+            series='A1', product=self.product, quantity=30)
+        cutting = CuttingEvent.objects.create(
+            product=self.product, quantity_cut=10,
+            product_reproduction=ProductReProduction.objects.create(series='A1'))
+        sales = Sales.objects.create(series='A1', buyer='ali', seller='vali')
+        SalesEvent.objects.create(
+            product=self.product, sales=sales, quantity_sold=4)
+        SalesEvent2.objects.create(
+            product=self.product, sales=sales, quantity_sold=5)
+        self.assertLedgerMatchesCounters()
+
+        cutting.delete()
+        Warehouse.objects.get().delete()
+        ProductProduction.objects.get().delete()
+        self.assertLedgerMatchesCounters()
+
+        self.assertEqual(
+            set(StockMovement.objects.values_list('reason', flat=True)),
+            {'arrival', 'consumption', 'production', 'cut', 'sale', 'reversal'})
+
+    def test_verify_reports_counters_changed_outside_the_ledger(self):
+        Warehouse.objects.create(component=self.component, quantity=100)
+        Component.objects.filter(pk=self.component.pk).update(total=90)
+        self.assertEqual(verify_counters(Component, 'total'),
+                         [(self.component.pk, 90, 100)])
+
+    def test_stock_at_uses_snapshot_plus_range(self):
+        tz = timezone.get_current_timezone()
+        days = [timezone.datetime(2024, 1, day, 12, tzinfo=tz)
+                for day in (1, 2, 3)]
+        for day, quantity in zip(days, (100, -30, 50)):
+            record_movements(Component, 'total', {
+                self.component.pk: quantity}, 'arrival')
+            StockMovement.objects.filter(date__gt=days[-1]).update(date=day)
+
+        self.assertEqual(stock_at(Component, 'total', days[1]),
+                         {self.component.pk: 100})
+        take_snapshots(days[0].date())
+        take_snapshots(days[1].date())
+
+        # Movements before the snapshot no longer matter
+        StockMovement.objects.filter(date=days[0]).delete()
+        with CaptureQueriesContext(connection) as queries:
+            stock = stock_at(Component, 'total', days[2] + timedelta(hours=1))
+        self.assertEqual(stock, {self.component.pk: 120})
+        self.assertLessEqual(len(queries), 3)
+        self.assertEqual(
+            stock_at(Component, 'total', days[2] - timedelta(hours=1)),
+            {self.component.pk: 70})
+
+
+class StockValuationReportTest(TestCase):
+    def setUp(self):
+        section = Component.objects.create(
+            title='Plyonka', price=0, measurement='kg')
+        self.component = Component.objects.create(
+            parent=section, title='Rulon', price=2, measurement='kg')
+        self.user = User.objects.create_superuser('admin', password='x')
+        self.client.force_login(self.user)
+
+    def test_values_stock_at_past_moment(self):
+        Warehouse.objects.create(component=self.component, quantity=100)
+        past = timezone.now() - timedelta(days=3)
+        StockMovement.objects.update(date=past)
+        take_snapshots(timezone.localdate(past))
+        Warehouse.objects.create(component=self.component, quantity=50)
+
+        response = self.client.get(reverse('stock_valuation'), {
+            'at': timezone.localtime(past + timedelta(days=2)).strftime('%Y-%m-%dT%H:%M')})
+        section = response.context['sections'][0]
+        self.assertEqual(section['totals'], {'$': 200})
+        self.assertEqual(section['rows'][0]['quantity'], 100)
+
+        response = self.client.get(reverse('stock_valuation'))
+        self.assertEqual(response.context['sections'][0]['totals'], {'$': 300})
+
+        response = self.client.get(
+            reverse('stock_valuation'), {'format': 'xlsx'})
+        self.assertEqual(
+            response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+    def test_invalid_moment_is_an_error(self):
+        response = self.client.get(reverse('stock_valuation'), {'at': 'kecha'})
+        self.assertContains(response, "Sana va vaqt noto&#x27;g&#x27;ri.", status_code=400)
+        self.assertNotContains(response, 'holatiga ko', status_code=400)
+        response = self.client.get(reverse('stock_valuation'), {'at': 'kecha', 'format': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+        Warehouse.objects.create(component=self.component, quantity=100)
+        at = timezone.localtime() + timedelta(hours=1)
+        response = self.client.get(reverse('stock_valuation'), {'at': at.isoformat()})
+        self.assertEqual(response.context['sections'][0]['totals'], {'$': 200})
+
+    def test_superuser_only(self):
+        self.client.force_login(User.objects.create_user('xodim', is_staff=True))
+        response = self.client.get(reverse('stock_valuation'))
+        self.assertEqual(response.status_code, 302)
+
+
+class UnitCostTest(TestCase):
+    def setUp(self):
+        section = Component.objects.create(
+            title='Plyonka', price=0, measurement='kg')
+        self.film = Component.objects.create(
+            parent=section, title='Rulon', price=2, measurement='kg')
+        self.glue = Component.objects.create(
+            parent=section, title='Yelim', price=5, measurement='kg')
+        self.product = Product.objects.create(
+            name='Stretch', invalid_price=10, price=20, total_cut=10)
+        self.other = Product.objects.create(
+            name='Paket', invalid_price=1, price=2)
+        ProductComponent.objects.create(
+            product=self.product, component=self.film, quantity=3)
+        self.bom = ProductComponent.objects.create(
+            product=self.product, component=self.glue, quantity=0.5)
+        ProductComponent.objects.create(
+            product=self.other, component=self.glue, quantity=1)
+
+    def unit_costs(self):
+        return dict(Product.objects.values_list('name', 'unit_cost'))
+
+    def test_follows_bom_and_price_changes(self):
+        self.assertEqual(self.unit_costs(), {'Stretch': 8.5, 'Paket': 5})
+
+        self.film.price = 4
+        with CaptureQueriesContext(connection) as queries:
+            self.film.save()
+        self.assertEqual(self.unit_costs(), {'Stretch': 14.5, 'Paket': 5})
+        self.assertEqual(len([q for q in queries if 'unit_cost' in q['sql']]), 1)
+
+        self.film.title = 'Rulon 500'
+        self.film.total = 50
+        with CaptureQueriesContext(connection) as queries:
+            self.film.save()
+        self.assertFalse(any('unit_cost' in q['sql'] for q in queries))
+
+        self.bom.quantity = 1
+        self.bom.save()
+        self.assertEqual(self.unit_costs(), {'Stretch': 17, 'Paket': 5})
+
+        self.glue.delete()
+        self.assertEqual(self.unit_costs(), {'Stretch': 12, 'Paket': 0})
+
+    def test_sales_profit_reads_stored_cost(self):
+        sales = Sales.objects.create(buyer='ali', seller='vali')
+        self.product.refresh_from_db()
+        with CaptureQueriesContext(connection) as queries:
+            event = SalesEvent.objects.create(
+                product=self.product, sales=sales, quantity_sold=2)
+        self.assertEqual(event.profit, 2 * (20 - 8.5))
+        self.assertFalse([q for q in queries if 'productcomponent' in q['sql']])
+
+
+class CostingTest(TestCase):
+    def setUp(self):
+        section = Component.objects.create(
+            title='Plyonka', price=0, measurement='kg')
+        self.components = [Component.objects.create(
+            parent=section, title=f'K{i}', price=i + 1, measurement='kg')
+            for i in range(4)]
+        self.products = [Product.objects.create(
+            name=f'P{i}', invalid_price=1, price=10) for i in range(3)]
+        ProductComponent.objects.bulk_create([ProductComponent(
+            product=product, component=component, quantity=(i + 1) * (j + 1) / 2)
+            for i, product in enumerate(self.products[:2])
+            for j, component in enumerate(self.components) if (i + j) % 3])
+
+    def test_matches_per_product_loop(self):
+        with CaptureQueriesContext(connection) as queries:
+            costs = catalogue_costs(Component, ProductComponent)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(set(costs), {p.pk for p in self.products[:2]})
+        for product in self.products[:2]:
+            self.assertAlmostEqual(
+                costs[product.pk], product.calculate_product_price())
+
+    def test_recalculate_action_repairs_stale_costs(self):
+        Component.objects.update(price=F('price') * 2)
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        response = self.client.post(reverse('admin:seh_1_product_changelist'), {
+            'action': 'recalculate_costs',
+            '_selected_action': [p.pk for p in self.products]})
+        self.assertEqual(response.status_code, 302)
+        for product in Product.objects.all():
+            self.assertAlmostEqual(
+                product.unit_cost, product.calculate_product_price())
+
+
+class MaterialRequirementsTest(TestCase):
+    def setUp(self):
+        section = Component.objects.create(
+            title='Plyonka', price=0, measurement='kg')
+        self.film = Component.objects.create(
+            parent=section, title='Rulon', price=2, measurement='kg', total=100)
+        self.glue = Component.objects.create(
+            parent=section, title='Yelim', price=5, measurement='kg', total=10)
+        self.stretch = Product.objects.create(
+            name='Stretch', invalid_price=1, price=2)
+        self.paket = Product.objects.create(name='Paket', invalid_price=1, price=2)
+        ProductComponent.objects.bulk_create([
+            ProductComponent(product=self.stretch, component=self.film, quantity=2),
+            ProductComponent(product=self.stretch, component=self.glue, quantity=0.5),
+            ProductComponent(product=self.paket, component=self.glue, quantity=1),
+        ])
+        self.client.force_login(User.objects.create_user('xodim', is_staff=True))
+
+    def test_plan_from_form(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('material_requirements'), {
+                f'qty_{self.stretch.pk}': '30', f'qty_{self.paket.pk}': '4'})
+        rows = response.context['rows']
+        self.assertEqual(
+            [(row['title'], row['required'], row['shortage']) for row in rows],
+            [('Yelim', 19, 9), ('Rulon', 60, 0)])
+        self.assertEqual(response.context['shortages'], 1)
+        self.assertEqual(len([q for q in queries if 'seh_1_productcomponent' in q['sql']]), 1)
+
+    def test_plan_from_sheet(self):
+        workbook = Workbook()
+        workbook.active.append(['Nomi', 'Miqdor'])
+        workbook.active.append(['stretch', 10])
+        workbook.active.append(["Yo'q", 1])
+        upload = BytesIO()
+        workbook.save(upload)
+        upload.seek(0)
+        upload.name = 'plan.xlsx'
+
+        response = self.client.post(
+            reverse('material_requirements'), {'plan': upload})
+        self.assertEqual(len(response.context['errors']), 1)
+        self.assertEqual(
+            {row['title']: row['required'] for row in response.context['rows']},
+            {'Rulon': 20, 'Yelim': 5})
+
+    def test_rejects_negative_and_non_finite_quantities(self):
+        for value in ('-5', 'nan', 'inf'):
+            with self.subTest(value):
+                response = self.client.post(reverse('material_requirements'), {
+                    f'qty_{self.stretch.pk}': value, f'qty_{self.paket.pk}': '4'})
+                self.assertEqual(response.context['errors'], ["Stretch: miqdor noto'g'ri."])
+                self.assertEqual(
+                    {row['title']: row['required'] for row in response.context['rows']},
+                    {'Yelim': 4})
+
+    def test_azamat_catalogue(self):
+        section = AzamatComponent.objects.create(
+            title='Granula', price=0, measurement='kg')
+        granula = AzamatComponent.objects.create(
+            parent=section, title='PE', price=1, measurement='kg', total=5)
+        group = AzamatProduct.objects.create(name='Paketlar', price=0, weight=0)
+        paket = AzamatProduct.objects.create(
+            parent=group, name='Paket', price=1, weight=1)
+        AzamatProductComponent.objects.create(
+            product=paket, component=granula, quantity=0.5)
+
+        url = reverse('material_requirements') + '?catalogue=Azamat_seh'
+        response = self.client.get(url)
+        self.assertEqual([p.name for p, _ in response.context['products']], ['Paket'])
+        response = self.client.post(url, {f'qty_{paket.pk}': '20'})
+        self.assertEqual(response.context['rows'][0]['shortage'], 5)
+
+
+class PriceSimulationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        section = Component.objects.create(
+            title='Plyonka', price=0, measurement='kg')
+        self.film = Component.objects.create(
+            parent=section, title='Rulon', price=2, measurement='kg')
+        self.glue = Component.objects.create(
+            parent=section, title='Yelim', price=5, measurement='kg')
+        self.stretch = Product.objects.create(
+            name='Stretch', invalid_price=4, price=10, total_new=10, total_cut=10)
+        self.paket = Product.objects.create(
+            name='Paket', invalid_price=1, price=8, total_cut=10)
+        ProductComponent.objects.create(
+            product=self.stretch, component=self.film, quantity=2)
+        ProductComponent.objects.create(
+            product=self.paket, component=self.glue, quantity=1)
+
+        sales = Sales.objects.create(buyer='ali', seller='vali')
+        SalesEvent.objects.create(
+            product=Product.objects.get(pk=self.stretch.pk), sales=sales, quantity_sold=3)
+        SalesEvent2.objects.create(
+            product=Product.objects.get(pk=self.stretch.pk), sales=sales, quantity_sold=2)
+        old_sales = Sales.objects.create(buyer='ali', seller='vali')
+        Sales.objects.filter(pk=old_sales.pk).update(
+            date=timezone.now() - timedelta(days=200))
+        SalesEvent.objects.create(
+            product=Product.objects.get(pk=self.stretch.pk), sales=old_sales, quantity_sold=5)
+
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+    def test_reprices_recent_sales_without_writing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('price_simulation'), {
+                f'price_{self.film.pk}': '3', 'months': '1'})
+        result = response.context['result']
+        self.assertEqual(len(result['rows']), 1)
+        row = result['rows'][0]
+        self.assertEqual((row['name'], row['cost'], row['new_cost']), ('Stretch', 4, 6))
+        self.assertEqual((row['margin'], row['new_margin']), (6, 4))
+        self.assertEqual(row['quantity'], 5)
+        self.assertEqual(row['recorded_profit'], 3 * 6 + 2 * 0)
+        self.assertEqual(row['simulated_profit'], 3 * 10 + 2 * 4 - 5 * 6)
+        self.assertFalse([q for q in queries if q['sql'].startswith(('UPDATE "seh_1', 'INSERT'))])
+        self.assertEqual(Component.objects.get(pk=self.film.pk).price, 2)
+
+    def test_bom_matrix_cache_follows_bom_changes(self):
+        self.client.post(reverse('price_simulation'), {f'price_{self.glue.pk}': '6'})
+        ProductComponent.objects.create(
+            product=self.stretch, component=self.glue, quantity=1)
+        response = self.client.post(
+            reverse('price_simulation'), {f'price_{self.glue.pk}': '6'})
+        self.assertEqual(
+            {row['name'] for row in response.context['result']['rows']}, {'Stretch', 'Paket'})
+
+    def test_months_are_bounded(self):
+        response = self.client.post(reverse('price_simulation'), {'months': '100000000'})
+        self.assertEqual(response.context['months'], 120)
+        self.assertEqual(len(response.context['result']['rows']), 0)
+
+        response = self.client.post(reverse('price_simulation'), {'months': 'uch'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['result'])
+        self.assertEqual(len(response.context['errors']), 1)
+
+    def test_superuser_only(self):
+        self.client.force_login(User.objects.create_user('xodim', is_staff=True))
+        self.assertEqual(self.client.get(reverse('price_simulation')).status_code, 302)
+
+
+class ComponentChangelistTest(TestCase):
+    QUERY_BUDGET = 12
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+    def make_sections(self, count, children=4):
+        for i in range(count):
+            section = Component.objects.create(
+                title=f'Bo\'lim {len(Component.objects.filter(parent=None))}',
+                price=0, measurement='kg')
+            for j in range(children):
+                Component.objects.create(
+                    parent=section, title=f'K{j}', price=2, measurement='kg',
+                    total=10 * j, notification_limit=15)
+
+    def get_changelist(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:seh_1_component_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_budget_does_not_grow_with_sections(self):
+        self.make_sections(2)
+        self.get_changelist()
+        response, small = self.get_changelist()
+        self.make_sections(8)
+        response, large = self.get_changelist()
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, self.QUERY_BUDGET)
+
+        sections = [row for row in response.context['cl'].result_list if row.parent_id is None]
+        self.assertEqual(len(sections), 10)
+        for section in sections:
+            self.assertEqual((section.subtree_price, section.subtree_low_stock), (120, 2))
+        self.assertContains(response, '120$')
+
+
+class ComputedColumnsTest(TestCase):
+    QUERY_BUDGET = 20
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', password='x')
+        self.client.force_login(self.user)
+        self.products = Product.objects.bulk_create([Product(
+            name=f'Stretch {i}', invalid_price=1, price=10) for i in range(3)])
+
+    def add_reproductions(self, count):
+        reproductions = ProductReProduction.objects.bulk_create([ProductReProduction(
+            series='R', user=self.user) for _ in range(count)])
+        CuttingEvent.objects.bulk_create([CuttingEvent(
+            product=product, product_reproduction=reproduction, quantity_cut=4)
+            for reproduction in reproductions for product in self.products])
+
+    def count_queries(self, url):
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_reproduction_page_runs_constant_queries(self):
+        url = reverse('admin:seh_1_productreproduction_changelist') + f'?date__year={timezone.now().year}'
+        self.add_reproductions(5)
+        _, small = self.count_queries(url)
+        self.add_reproductions(45)
+        response, large = self.count_queries(url)
+        self.assertEqual(small, large)
+        self.assertContains(response, '<td class="field-total_cut">12</td>', count=50)
+
+
+@override_settings(EXPORT_ROOT=EXPORT_ROOT.name)
+class SalesTotalsTest(TestCase):
+    QUERY_BUDGET = 20
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', password='x')
+        self.client.force_login(self.user)
+        self.products = Product.objects.bulk_create([Product(
+            name=f'Stretch {i}', invalid_price=1, price=10, total_new=100,
+            total_cut=100) for i in range(3)])
+
+    def add_sales(self, count):
+        sales = Sales.objects.bulk_create([Sales(
+            series='S', buyer='Ali', seller='Vali', user=self.user) for _ in range(count)])
+        for model in (SalesEvent, SalesEvent2):
+            model.objects.bulk_create([model(
+                product=product, sales=sale, quantity_sold=2, single_sold_price=10,
+                total_sold_price=20, profit=5) for sale in sales for product in self.products])
+        refresh_sales_totals(Sales, [sale.pk for sale in sales])
+
+    def test_events_keep_totals_and_summaries(self):
+        sales = Sales.objects.create(buyer='ali', seller='vali')
+        with CaptureQueriesContext(connection) as queries:
+            event = SalesEvent.objects.create(
+                product=self.products[0], sales=sales, quantity_sold=2)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE "seh_1_sales"')]), 1)
+        SalesEvent2.objects.create(
+            product=self.products[1], sales=sales, quantity_sold=3)
+
+        sales.refresh_from_db()
+        self.assertEqual((sales.total_price, sales.total_profit), (23, 23))
+        self.assertEqual(Sales.summary_text(sales.cut_summary, '$'), '2 ta Stretch 0 (10.0$ dan)')
+        self.assertEqual(Sales.summary_text(sales.uncut_summary), '3 ta Stretch 1')
+        self.assertEqual(str(sales), 'Ali - Vali - 23.0$')
+
+        event.delete()
+        sales.refresh_from_db()
+        self.assertEqual((sales.total_price, sales.cut_summary), (3, []))
+
+    def test_product_rename_refreshes_summaries_and_exports(self):
+        self.add_sales(2)
+        url = reverse('sales_export_excel')
+        b''.join(get_export(self.client, url).streaming_content)
+
+        product = self.products[0]
+        product.name = 'Plyonka'
+        product.save()
+        self.assertEqual([Sales.summary_text(sale.cut_summary) for sale in Sales.objects.all()],
+                         ['2 ta Plyonka, 2 ta Stretch 1, 2 ta Stretch 2'] * 2)
+        rows = list(load_workbook(BytesIO(
+            b''.join(get_export(self.client, url).streaming_content))).active.values)
+        self.assertTrue(rows[1][2].startswith('2 ta Plyonka'))
+
+        with CaptureQueriesContext(connection) as queries:
+            product.save(update_fields=['price'])
+        self.assertFalse(any('"seh_1_salesevent"' in q['sql'] for q in queries.captured_queries))
+
+    def test_sales_page_runs_constant_queries(self):
+        url = reverse('admin:seh_1_sales_changelist') + f'?date__year={timezone.now().year}'
+        self.add_sales(5)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        self.add_sales(95)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(small), len(large))
+        self.assertLessEqual(len(large), self.QUERY_BUDGET)
+        self.assertNotIn('seh_1_salesevent', ' '.join(q['sql'] for q in large))
+        self.assertContains(response, '120$', count=100)
+        self.assertContains(response, '2 ta Stretch 0 (10.0$ dan)', count=200)
+
+    def test_export_reads_sales_table_only(self):
+        self.add_sales(20)
+        with CaptureQueriesContext(connection) as queries:
+            response = get_export(self.client, reverse('sales_export_excel'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('seh_1_salesevent', ' '.join(q['sql'] for q in queries))
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        sales = Sales.objects.bulk_create(
+            [Sales(buyer='ali', seller='vali') for _ in range(250)])
+        now = timezone.now()
+        for n, sale in enumerate(sales):
+            # Pairs of rows share a date, so the pk has to break the tie.
+            sale.date = now - timedelta(hours=n // 2)
+        Sales.objects.bulk_update(sales, ['date'])
+        self.expected = list(Sales.objects.order_by('-date', '-pk').values_list('pk', flat=True))
+        self.url = reverse('admin:seh_1_sales_changelist')
+
+    def get(self, query_string):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url + query_string)
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+        return response, queries
+
+    def pks(self, response):
+        return [sale.pk for sale in response.context['cl'].result_list]
+
+    def test_adjacent_and_last_pages_seek_instead_of_offset(self):
+        first, _ = self.get('?q=')
+        self.assertEqual(self.pks(first), self.expected[:100])
+
+        query_string = first.context['cl'].get_query_string({PAGE_VAR: 2})
+        self.assertIn(CURSOR_VAR, query_string)
+        second, _ = self.get(query_string)
+        self.assertEqual(self.pks(second), self.expected[100:200])
+
+        third, _ = self.get(second.context['cl'].get_query_string({PAGE_VAR: 3}))
+        self.assertEqual(self.pks(third), self.expected[200:])
+
+        back, _ = self.get(third.context['cl'].get_query_string({PAGE_VAR: 2}))
+        self.assertEqual(self.pks(back), self.expected[100:200])
+
+        last, _ = self.get('?q=&p=3')
+        self.assertEqual(self.pks(last), self.expected[200:])
+
+    def test_count_is_cached_until_sales_change(self):
+        self.get('?q=')
+        response, queries = self.get('?q=')
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(response.context['cl'].result_count, 250)
+
+        Sales.objects.create(buyer='ali', seller='vali')
+        response, _ = self.get('?q=')
+        self.assertEqual(response.context['cl'].result_count, 251)
+
+        toggle = response.context['cl'].count_toggle[1]
+        self.assertIn(f'{COUNT_VAR}={APPROXIMATE_COUNT}', toggle)
+        Sales.objects.create(buyer='ali', seller='vali')
+        response, queries = self.get(toggle)
+        self.assertEqual(response.context['cl'].result_count, 251)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+
+class CustomerTest(TestCase):
+    def test_name_variants_share_one_customer_across_sections(self):
+        sale = Sales.objects.create(series='1', buyer='ali  valiyev', seller='Hasan')
+        azamat_sale = AzamatSales.objects.create(buyer='ALI VALIYEV', seller='hasan')
+        selling = Selling.objects.create(buyer='Ali Valiyev')
+
+        customer = Customer.objects.get(key='ali valiyev')
+        self.assertEqual(customer.name, 'Ali Valiyev')
+        self.assertEqual(
+            {sale.buyer_customer, azamat_sale.buyer_customer, selling.buyer_customer},
+            {customer})
+        self.assertEqual(sale.seller_customer, azamat_sale.seller_customer)
+
+    def test_link_customers_deduplicates_existing_names(self):
+        Sales.objects.bulk_create([
+            Sales(series='1', buyer='karim', seller='Olim'),
+            Sales(series='2', buyer='Karim ', seller='olim'),
+            Sales(series='3', buyer='Jasur', seller='Olim'),
+        ])
+        created = link_customers(Customer, Sales.objects.all(), {
+            'buyer_customer': 'buyer', 'seller_customer': 'seller'})
+
+        self.assertEqual(created, 3)
+        self.assertEqual(
+            sorted(Sales.objects.values_list('series', 'buyer_customer__name', 'seller_customer__name')),
+            [('1', 'Karim', 'Olim'), ('2', 'Karim', 'Olim'), ('3', 'Jasur', 'Olim')])
+
+    def test_changelist_filters_by_customer_without_scanning_sales(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        Sales.objects.create(series='1', buyer='Karim', seller='Olim')
+        Sales.objects.create(series='2', buyer='Jasur', seller='Olim')
+        karim = Customer.objects.get(key='karim')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:seh_1_sales_changelist') +
+                f'?buyer_customer__id__exact={karim.pk}')
+        self.assertEqual([sale.series for sale in response.context['cl'].result_list], ['1'])
+        self.assertFalse(any('DISTINCT' in query['sql'] and (
+            '"seh_1_sales"."buyer"' in query['sql'] or '"seh_1_sales"."seller"' in query['sql'])
+            for query in queries.captured_queries))
+
+    def test_customer_filters_list_only_referenced_customers(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        Sales.objects.create(series='1', buyer='Karim', seller='Olim')
+        AzamatSales.objects.create(buyer='Jasur', seller='Aziz')
+        Selling.objects.create(buyer='Botir')
+
+        response = self.client.get(reverse('admin:seh_1_sales_changelist') + '?date__year=2020')
+        choices = {spec.field_path: [name for pk, name in spec.lookup_choices]
+                   for spec in response.context['cl'].filter_specs
+                   if spec.field_path.endswith('_customer')}
+        self.assertEqual(choices, {'seller_customer': ['Olim'], 'buyer_customer': ['Karim']})
+
+
+@override_settings(EXPORT_ROOT=EXPORT_ROOT.name)
+class SearchIndexTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+    def search(self, url_name, term):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name), {'q': term})
+        self.queries = [query['sql'] for query in queries.captured_queries]
+        return response.context['cl'].result_list
+
+    def test_changelist_search_uses_the_index(self):
+        Sales.objects.create(series='1', buyer='Karimov Aziz', seller='Olim')
+        Sales.objects.create(series='2', buyer='Jasur', seller='Karimova')
+        Sales.objects.create(series='3', buyer='Jasur', seller='Olim')
+
+        rows = self.search('admin:seh_1_sales_changelist', 'karim')
+        self.assertEqual(sorted(sale.series for sale in rows), ['1', '2'])
+        self.assertTrue(any('MATCH' in sql for sql in self.queries))
+        self.assertFalse(any('LIKE' in sql for sql in self.queries))
+
+        rows = self.search('admin:seh_1_sales_changelist', 'karim aziz')
+        self.assertEqual([sale.series for sale in rows], ['1'])
+
+    def test_short_terms_fall_back_to_like(self):
+        Sales.objects.create(series='1', buyer='Ali', seller='Olim')
+        rows = self.search('admin:seh_1_sales_changelist', 'al')
+        self.assertEqual([sale.series for sale in rows], ['1'])
+        self.assertTrue(any('LIKE' in sql for sql in self.queries))
+
+    def test_index_follows_saves_and_deletes(self):
+        sale = Sales.objects.create(series='1', buyer='Karim', seller='Olim')
+        sale.buyer = 'Jasur'
+        sale.save()
+        self.assertEqual(list(self.search('admin:seh_1_sales_changelist', 'karim')), [])
+        self.assertEqual(len(self.search('admin:seh_1_sales_changelist', 'jasur')), 1)
+
+        sale.delete()
+        index = SearchIndex(Sales, ('buyer', 'seller'))
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {index.table}')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_fixture_rows_are_indexed(self):
+        sale = Sales.objects.create(series='1', buyer='Karim', seller='Olim')
+        fixture = serializers.serialize('json', [sale])
+        sale.delete()
+        for obj in serializers.deserialize('json', fixture):
+            obj.save()
+
+        rows = self.search('admin:seh_1_sales_changelist', 'karim')
+        self.assertEqual([row.series for row in rows], ['1'])
+
+    def test_related_field_follows_renamed_user(self):
+        worker = User.objects.create_user('sardor')
+        reproduction = ProductReProduction.objects.create(user=worker)
+        worker.username = 'bobur'
+        worker.save()
+
+        self.assertEqual(list(self.search('admin:seh_1_productreproduction_changelist', 'sardor')), [])
+        self.assertEqual(list(self.search('admin:seh_1_productreproduction_changelist', 'bobur')),
+                         [reproduction])
+
+    def test_component_export_searches_titles(self):
+        section = Component.objects.create(title='Mato', price=0, measurement='m')
+        Component.objects.create(parent=section, title='Paxta mato', price=2, measurement='m')
+        Component.objects.create(parent=section, title='Ip', price=1, measurement='m')
+
+        response = get_export(self.client, reverse('component_export_excel'), {'q': 'paxta'})
+        rows = list(load_workbook(BytesIO(b''.join(response.streaming_content))).active.values)
+        self.assertEqual([row[1] for row in rows[1:]], ['Paxta mato'])
+
+
+@override_settings(EXPORT_ROOT=EXPORT_ROOT.name)
+class StreamingExportTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+    def export(self, url_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = get_export(self.client, reverse(url_name))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        rows = list(load_workbook(BytesIO(b''.join(response.streaming_content))).active.values)
+        return rows, len(queries)
+
+    def add_reproductions(self, product, count):
+        worker = User.objects.get(username='admin')
+        for _ in range(count):
+            reproduction = ProductReProduction.objects.create(user=worker)
+            CuttingEvent.objects.create(
+                product_reproduction=reproduction, product=product, quantity_cut=1)
+
+    def test_every_export_streams_a_workbook(self):
+        for url_name in ('component_export_excel', 'product_export_excel',
+                         'warehouse_export_excel', 'production_export_excel',
+                         'reproduction_export_excel', 'sales_export_excel'):
+            with self.subTest(url_name):
+                rows, _ = self.export(url_name)
+                self.assertEqual(len(rows), 1)
+
+    def test_reproduction_export_prefetches_cutting_events(self):
+        product = Product.objects.create(
+            name='Stretch', price=10, invalid_price=5, total_new=10)
+        self.add_reproductions(product, 2)
+        self.export('reproduction_export_excel')
+        self.add_reproductions(product, 1)
+        rows, small = self.export('reproduction_export_excel')
+        self.add_reproductions(product, 3)
+        rows, large = self.export('reproduction_export_excel')
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[1][:3], ('admin', 1, '1 ta Stretch'))
+
+
+@override_settings(EXPORT_ROOT=EXPORT_ROOT.name)
+class ChangelistExportTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        for series, buyer in (('1', 'Karim'), ('2', 'Jasur'), ('3', 'Karim')):
+            Sales.objects.create(series=series, buyer=buyer, seller='Olim')
+
+    def export(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = get_export(self.client, reverse('sales_export_excel') + query)
+        self.queries = [query['sql'] for query in queries.captured_queries]
+        return response
+
+    def buyers(self, response):
+        rows = list(load_workbook(BytesIO(b''.join(response.streaming_content))).active.values)
+        return [row[0] for row in rows[1:]]
+
+    def test_export_uses_changelist_filters_search_and_ordering(self):
+        karim = Customer.objects.get(key='karim')
+        screen = self.client.get(reverse('admin:seh_1_sales_changelist') +
+                                 f'?buyer_customer__id__exact={karim.pk}&q=kar')
+        buyers = self.buyers(self.export(f'?buyer_customer__id__exact={karim.pk}&q=kar'))
+
+        self.assertEqual(buyers, [sale.buyer for sale in screen.context['cl'].result_list])
+        self.assertEqual(buyers, ['Karim', 'Karim'])
+
+        screen = self.client.get(reverse('admin:seh_1_sales_changelist') + '?q=')
+        self.assertEqual([sale.series for sale in screen.context['cl'].result_list], ['3', '2', '1'])
+        self.assertEqual(self.buyers(self.export('?q=')), ['Karim', 'Jasur', 'Karim'])
+
+    def test_export_skips_the_changelist_page_and_count(self):
+        self.export('?q=karim')
+        sales = [sql for sql in self.queries if 'FROM "seh_1_sales"' in sql]
+        # The total shown as progress and the rows themselves.
+        self.assertEqual(len(sales), 2)
+        self.assertIn('COUNT(*)', sales[0])
+        self.assertFalse(any('LIMIT' in sql for sql in sales))
+
+    def test_unknown_filter_redirects_to_changelist_error(self):
+        response = self.export('?no_such_field=1')
+        self.assertRedirects(response, reverse('admin:seh_1_sales_changelist') + '?e=1',
+                             fetch_redirect_response=False)
+
+    def test_admin_export_url(self):
+        response = get_export(self.client, reverse('admin:seh_1_sales_export'), {'q': 'jasur'})
+        self.assertEqual(self.buyers(response), ['Jasur'])
+
+
+@override_settings(EXPORT_ROOT=EXPORT_ROOT.name)
+class ExportJobTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        Sales.objects.create(series='1', buyer='Karim', seller='Olim')
+
+    def export(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = get_export(self.client, reverse('sales_export_excel') + query)
+        self.sales_queries = [q['sql'] for q in queries.captured_queries
+                              if 'FROM "seh_1_sales"' in q['sql']]
+        return response
+
+    def buyers(self, response):
+        rows = list(load_workbook(BytesIO(b''.join(response.streaming_content))).active.values)
+        return [row[0] for row in rows[1:]]
+
+    def test_repeated_export_is_served_from_the_finished_file(self):
+        self.assertEqual(self.buyers(self.export('?q=')), ['Karim'])
+        # Pagination parameters do not change the exported rows.
+        self.assertEqual(self.buyers(self.export(f'?q=&{PAGE_VAR}=2')), ['Karim'])
+        self.assertEqual(self.sales_queries, [])
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+    def test_changed_data_builds_a_new_file(self):
+        self.export()
+        Sales.objects.create(series='2', buyer='Jasur', seller='Olim')
+        self.assertEqual(self.buyers(self.export()), ['Jasur', 'Karim'])
+        self.assertEqual(ExportJob.objects.count(), 2)
+
+    def test_stale_and_expired_jobs_are_replaced(self):
+        self.export()
+        job = ExportJob.objects.get()
+        ExportJob.objects.update(status='running', updated=timezone.now() - STALE_JOB_TIMEOUT)
+        self.export()
+        self.assertEqual(ExportJob.objects.filter(status='done').count(), 1)
+
+        ExportJob.objects.update(created=timezone.now() - EXPORT_RETENTION)
+        Sales.objects.create(series='2', buyer='Jasur', seller='Olim')
+        self.export()
+        self.assertEqual(ExportJob.objects.count(), 1)
+        self.assertFalse(job.path.exists())
+
+    def test_request_queues_the_job_for_the_worker(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('sales_export_excel'))
+        job = ExportJob.objects.get()
+        status_url = reverse('admin:seh_1_exportjob_status', args=[job.pk])
+        self.assertRedirects(response, status_url)
+        self.assertEqual(job.status, 'pending')
+        self.assertFalse(any('FROM "seh_1_sales"' in q['sql'] for q in queries.captured_queries))
+
+        response = self.client.get(status_url)
+        self.assertContains(response, '<progress')
+        self.assertContains(response, 'http-equiv="refresh"')
+
+        call_command('build_exports')
+        response = self.client.get(status_url)
+        self.assertNotContains(response, 'http-equiv="refresh"')
+        download = reverse('admin:seh_1_exportjob_download', args=[job.pk])
+        self.assertContains(response, download)
+        response = self.client.get(download)
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        self.assertEqual(self.buyers(response), ['Karim'])
+
+    def test_workers_claim_each_job_once(self):
+        self.client.get(reverse('sales_export_excel'))
+        self.client.get(reverse('sales_export_excel') + '?q=karim')
+        first, second = ExportJob.objects.order_by('pk')
+
+        self.assertEqual(claim_export_job(), first.pk)
+        self.assertEqual(claim_export_job(), second.pk)
+        self.assertIsNone(claim_export_job())
+        self.assertEqual(build_pending_exports(), 0)
+        self.assertEqual(ExportJob.objects.filter(status='running').count(), 2)
+
+    def staff(self, username):
+        user = User.objects.create_user(username, password='x', is_staff=True)
+        user.user_permissions.add(Permission.objects.get(
+            codename='view_sales', content_type__app_label='seh_1'))
+        return user
+
+    def test_jobs_need_permission_on_the_exported_model(self):
+        self.export()
+        job = ExportJob.objects.get()
+        self.client.force_login(User.objects.create_user('worker', password='x', is_staff=True))
+        response = self.client.get(reverse('admin:seh_1_exportjob_status', args=[job.pk]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_users_share_a_queued_export(self):
+        for username in ('ali', 'vali'):
+            self.client.force_login(self.staff(username))
+            response = self.client.get(reverse('sales_export_excel') + '?q=karim')
+            job = ExportJob.objects.get()
+            status_url = reverse('admin:seh_1_exportjob_status', args=[job.pk])
+            self.assertRedirects(response, status_url)
+            self.assertContains(self.client.get(status_url), '<progress')
+
+        call_command('build_exports')
+        download = reverse('admin:seh_1_exportjob_download', args=[job.pk])
+        self.assertEqual(self.buyers(self.client.get(download)), ['Karim'])
+
+
+@override_settings(EXPORT_ROOT=EXPORT_ROOT.name)
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        Sales.objects.create(series='1', buyer='Karim', seller='Olim')
+        self.url = reverse('admin:seh_1_sales_changelist') + f'?date__year={timezone.now().year}'
+
+    def revalidate(self, url, etag):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.data_queries = [q['sql'] for q in queries.captured_queries
+                             if '"seh_1_sales' in q['sql']]
+        return response
+
+    def test_unchanged_changelist_is_not_modified(self):
+        # The first page sets the CSRF cookie, which is part of the ETag.
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertNotIn('no-store', response['Cache-Control'])
+
+        response = self.revalidate(self.url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.data_queries, [])
+        self.assertNotEqual(self.client.get(self.url + '&q=karim')['ETag'], etag)
+
+        Sales.objects.create(series='2', buyer='Jasur', seller='Olim')
+        response = self.revalidate(self.url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Jasur')
+
+    def request(self, user):
+        request = RequestFactory().get(self.url)
+        request.session = self.client.session
+        request._messages = FallbackStorage(request)
+        request.user = user
+        return request
+
+    def test_changelist_etag_depends_on_user_and_pending_messages(self):
+        etag = self.client.get(self.url)['ETag']
+        model_admin = admin.site._registry[Sales]
+        request = self.request(User.objects.get(username='admin'))
+        self.assertEqual(model_admin.get_changelist_etag(request), etag)
+
+        messages.info(request, 'Saqlandi')
+        self.assertIsNone(model_admin.get_changelist_etag(request))
+        request = self.request(User.objects.create_superuser('boss', password='x'))
+        self.assertNotEqual(model_admin.get_changelist_etag(request), etag)
+
+    def test_new_login_renders_the_changelist(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.logout()
+        self.client.login(username='admin', password='x')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+    def test_unchanged_export_is_not_modified(self):
+        url = reverse('sales_export_excel') + '?q=karim'
+        response = get_export(self.client, url)
+        etag = response['ETag']
+        b''.join(response.streaming_content)
+
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.data_queries, [])
+
+        Sales.objects.create(series='2', buyer='Karim', seller='Olim')
+        response = self.revalidate(url, etag)
+        # The changed data queues a new file rather than answering 304.
+        self.assertEqual(response.status_code, 302)
+        build_pending_exports()
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        b''.join(response.streaming_content)
@@ -16,4 +16,10 @@ urlpatterns = [
          name='reproduction_export_excel'),
     path('sales/export-excel/', views.export_sales_excel,
          name='sales_export_excel'),
+    path('reports/valuation/', views.stock_valuation_report,
+         name='stock_valuation'),
+    path('reports/requirements/', views.material_requirements_report,
+         name='material_requirements'),
+    path('reports/price-simulation/', views.price_simulation_report,
+         name='price_simulation'),
 ]
@@ -0,0 +1,158 @@
+from django.db.models import (Case, F, FloatField, OuterRef, Subquery, Sum,
+                              Value, When)
+from django.db.models.functions import Coalesce
+
+
+def normalize_names(queryset, fields, chunk_size=500):
+    """
+    Title-case the given text fields of every row in ``queryset``.
+
+    Rows are streamed in chunks and only the ones that actually change are
+    written back with ``bulk_update``, so no model ``save()`` or signal runs.
+    Returns the number of updated rows.
+    """
+    manager = queryset.model._default_manager
+    updated = 0
+    batch = []
+
+    for obj in queryset.only('pk', *fields).iterator(chunk_size=chunk_size):
+        changed = False
+        for field in fields:
+            value = getattr(obj, field)
+            if value and value != value.title():
+                setattr(obj, field, value.title())
+                changed = True
+        if changed:
+            batch.append(obj)
+
+        if len(batch) >= chunk_size:
+            manager.bulk_update(batch, fields)
+            updated += len(batch)
+            batch = []
+
+    if batch:
+        manager.bulk_update(batch, fields)
+        updated += len(batch)
+
+    return updated
+
+
+def customer_key(name):
+    """Lookup key of a customer name: whitespace collapsed and case folded."""
+    return ' '.join(name.split()).casefold()
+
+
+def customer_display_name(name):
+    return ' '.join(name.split()).title()
+
+
+def link_customers(customer_model, queryset, fields, chunk_size=500):
+    """
+    Point the customer foreign keys of every row in ``queryset`` at the
+    customer whose key matches the row's name, creating missing customers.
+
+    ``fields`` maps foreign key names to the text field they mirror. Name
+    variants that share a key end up on a single customer. Returns the number
+    of created customers.
+    """
+    manager = customer_model._default_manager
+    created = 0
+    for foreign_key, text_field in fields.items():
+        variants = {}
+        names = queryset.order_by().values_list(text_field, flat=True).distinct()
+        for name in names.iterator(chunk_size=chunk_size):
+            if name and name.strip():
+                variants.setdefault(customer_key(name), []).append(name)
+
+        keys = list(variants)
+        customers = {}
+        for start in range(0, len(keys), chunk_size):
+            customers.update(manager.filter(
+                key__in=keys[start:start + chunk_size]).values_list('key', 'pk'))
+        missing = [customer_model(key=key, name=customer_display_name(variants[key][0]))
+                   for key in keys if key not in customers]
+        manager.bulk_create(missing, batch_size=chunk_size)
+        created += len(missing)
+        for start in range(0, len(missing), chunk_size):
+            customers.update(manager.filter(key__in=[
+                customer.key for customer in missing[start:start + chunk_size]
+            ]).values_list('key', 'pk'))
+
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            queryset.filter(**{f'{text_field}__in': [
+                name for key in chunk for name in variants[key]]}).update(**{
+                    f'{foreign_key}_id': Case(
+                        *[When(**{f'{text_field}__in': variants[key]},
+                               then=Value(customers[key])) for key in chunk])})
+    return created
+
+
+def consume_components(component_model, bom, quantity):
+    """
+    Take ``quantity`` products worth of components out of stock.
+
+    ``bom`` is an iterable of ``(component_id, quantity_per_product)`` pairs;
+    pass a negative ``quantity`` to put the components back. All totals are
+    changed by a single ``UPDATE ... SET total = total - CASE ... END``, so
+    concurrent productions cannot overwrite each other's counts. Returns the
+    ``{component_id: amount}`` that was subtracted.
+    """
+    amounts = {}
+    for component_id, per_product in bom:
+        amounts[component_id] = amounts.get(
+            component_id, 0) + per_product * quantity
+    if not amounts:
+        return amounts
+
+    component_model._default_manager.filter(pk__in=amounts).update(
+        total=F('total') - Case(
+            *[When(pk=pk, then=Value(amount)) for pk, amount in amounts.items()],
+            output_field=FloatField()))
+    return amounts
+
+
+def refresh_unit_costs(products, bom_model):
+    """
+    Recompute the stored ``unit_cost`` of every product in ``products``.
+
+    ``bom_model`` is the app's ``ProductComponent`` model. The cost is the sum
+    of ``quantity * component.price`` over the product's BOM, written for all
+    the given products by a single ``UPDATE`` with a correlated subquery.
+    Products without components get a cost of zero. Returns the number of
+    updated rows.
+    """
+    cost = bom_model._default_manager.filter(
+        product=OuterRef('pk')).order_by().values('product').annotate(
+        cost=Sum(F('quantity') * F('component__price'))).values('cost')
+    return products.update(unit_cost=Coalesce(
+        Subquery(cost, output_field=FloatField()), Value(0.0)))
+
+
+def refresh_sales_totals(sales_model, pks, chunk_size=500):
+    """
+    Recompute the stored ``total_price``, ``total_profit``, ``cut_summary``
+    and ``uncut_summary`` of the given seh_1 ``Sales`` rows.
+
+    The lines of both event models are read with one query each and the
+    sales are written back with ``bulk_update``, so a single sale costs one
+    ``UPDATE``. Works with historical models inside migrations.
+    """
+    pks = list(pks)
+    for start in range(0, len(pks), chunk_size):
+        chunk = pks[start:start + chunk_size]
+        sales = {pk: sales_model(pk=pk, total_price=0, total_profit=0,
+                                 cut_summary=[], uncut_summary=[]) for pk in chunk}
+        for relation, summary in (('selling_cut', 'cut_summary'), ('selling', 'uncut_summary')):
+            event_model = sales_model._meta.get_field(relation).related_model
+            lines = event_model._default_manager.filter(sales__in=chunk).order_by(
+                'pk').values_list('sales_id', 'quantity_sold', 'product__name',
+                                  'single_sold_price', 'total_sold_price', 'profit')
+            for sales_id, quantity, name, price, total, profit in lines:
+                sale = sales[sales_id]
+                sale.total_price += total
+                sale.total_profit += profit
+                getattr(sale, summary).append(
+                    {'quantity': quantity, 'product': name, 'price': price})
+        sales_model._default_manager.bulk_update(
+            sales.values(), ['total_price', 'total_profit', 'cut_summary', 'uncut_summary'])
@@ -0,0 +1,60 @@
+"""
+Per-model data versions for cache invalidation.
+
+Every tracked model has a ``DataVersion`` row that is bumped with an
+``F('version') + 1`` update whenever one of its rows is saved or deleted.
+Cached reports put the versions of the models they read into their cache
+key, so all workers stop using stale entries after a change, even with a
+per-process cache backend. Responses built from them get ETags from the
+same versions, so clients can revalidate without the data being read.
+"""
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.http import quote_etag
+
+
+def _label(model):
+    return model if isinstance(model, str) else model._meta.label_lower
+
+
+def bump_version(*models):
+    from .models import DataVersion
+
+    for model in models:
+        label = _label(model)
+        if DataVersion.objects.filter(label=label).update(version=F('version') + 1):
+            continue
+        try:
+            with transaction.atomic():
+                DataVersion.objects.create(label=label, version=1)
+        except IntegrityError:
+            DataVersion.objects.filter(label=label).update(version=F('version') + 1)
+
+
+def get_versions(*models):
+    """Return the current versions of ``models`` as a tuple, in one query."""
+    from .models import DataVersion
+
+    labels = [_label(model) for model in models]
+    versions = dict(DataVersion.objects.filter(
+        label__in=labels).values_list('label', 'version'))
+    return tuple(versions.get(label, 0) for label in labels)
+
+
+def versioned_cache_key(prefix, models, *parts):
+    """
+    Cache key for data derived from ``models``, further keyed by ``parts``
+    (e.g. a filter querystring). Costs one query for the versions.
+    """
+    digest = hashlib.md5(repr((parts, get_versions(*models))).encode()).hexdigest()
+    return f'{prefix}:{digest}'
+
+
+def versioned_etag(models, *parts):
+    """
+    Quoted ETag of a response built from ``models`` and ``parts`` (e.g. the
+    path and the user). Costs one query for the versions.
+    """
+    return quote_etag(versioned_cache_key('etag', models, *parts))
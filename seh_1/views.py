@@ -1,484 +1,390 @@
-from datetime import datetime
-
-import requests
-from django.contrib.auth.decorators import login_required
-from django.db.models import Q
+import math
+from datetime import datetime, timedelta
+
+from django.apps import apps
+from django.contrib import admin
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.db import transaction
+from django.db.models import F
 from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from django.http import HttpResponse
-from django.urls import reverse
-from openpyxl import Workbook
-from openpyxl.styles import Alignment
-from openpyxl.utils import get_column_letter
-from pytz import timezone
-
-from conf import settings
-
-from .models import (CuttingEvent, Product, ProductProduction,
-                     ProductReProduction, Sales, SalesEvent, SalesEvent2,
-                     Warehouse, Component)
-
-sales = Sales.objects.all()
-
-for sale in sales:
-    sale.buyer = sale.buyer.title()
-    sale.seller = sale.seller.title()
-    sale.save()
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.shortcuts import render
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+
+from .costing import discard_bom_matrix
+from .exports import export_changelist
+from .ledger import day_start, move_stock, record_movements
+from .low_stock import discard_low_stock, update_low_stock
+from .models import (CuttingEvent, Product, ProductComponent,
+                     ProductProduction, ProductReProduction, Sales,
+                     SalesEvent, SalesEvent2, Warehouse, Component)
+from .notifications import queue_low_stock_notification
+from .reports import (MRP_CATALOGUES, material_requirements, price_simulation,
+                      stock_valuation)
+from .utils import (consume_components, refresh_sales_totals,
+                    refresh_unit_costs)
+from .versions import bump_version
+
+# Longest sales history the price simulation looks back over.
+MAX_SIMULATION_MONTHS = 120
 
 
 @login_required
 def component_export_excel(request):
-    components = Component.objects.exclude(parent=None)
-
-    # Create a new workbook
-    workbook = Workbook()
-    worksheet = workbook.active
-
-    search_query = request.GET.get('q')
-    if search_query:
-        components = components.filter(Q(name__icontains=search_query))
-
-    # Apply filters based on request parameters
-    filters = request.GET.dict()
-    filters.pop('q', None)
-    filters.pop('o', None)
-    filters.pop('p', None)
-    filters.pop('all', None)
-
-    if filters:
-        components = components.filter(**filters)
-
-    # Write headers
-    headers = ['Bo\'lim', 'Nomi', 'Narxi', 'O\'lchov birligi', 'Umumiy']
-    worksheet.append(headers)
-
-    # Write data rows
-    for component in components:
-        row = [
-            component.parent.title,
-            component.title,
-            str(component.price)+'$',
-            component.measurement,
-            component.total,
-        ]
-        worksheet.append(row)
-
-    # Set the response headers for file download
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=component.xlsx'
-
-    worksheet.column_dimensions['A'].width = 20
-    worksheet.column_dimensions['B'].width = 20
-    worksheet.column_dimensions['C'].width = 20
-    worksheet.column_dimensions['D'].width = 20
-    worksheet.column_dimensions['E'].width = 20
-    worksheet.column_dimensions['F'].width = 20
-    worksheet.column_dimensions['G'].width = 20
-    worksheet.column_dimensions['H'].width = 20
-
-    # Save workbook to response
-    workbook.save(response)
-
-    return response
+    return export_changelist(request, Component)
 
 
 @login_required
 def export_excel(request):
-    products = Product.objects.all()
-
-    # Create a new workbook
-    workbook = Workbook()
-    worksheet = workbook.active
-
-    search_query = request.GET.get('q')
-    if search_query:
-        products = products.filter(Q(name__icontains=search_query))
-
-    # Apply filters based on request parameters
-    filters = request.GET.dict()
-    filters.pop('q', None)
-    filters.pop('o', None)
-    filters.pop('p', None)
-    filters.pop('all', None)
-
-    if filters:
-        products = products.filter(**filters)
-
-    # Write headers
-    headers = ['Nomi', 'Tan narxi', 'Sotuv narxi',
-               'Kesilmaganlar soni', 'Kesilganlar soni', 'Mavjud tovar narxi',]
-    worksheet.append(headers)
-
-    # Write data rows
-    for product in products:
-        product_price = 0
-        for productcomponent in product.productcomponent_set.all():
-            product_price += productcomponent.quantity*productcomponent.component.price
-        product_price = "{:,.1f}".format(product_price)+'$'
-
-        row = [
-            product.name,
-            product_price,
-            str(product.price)+'$',
-            product.total_new,
-            product.total_cut,
-            "{:,.1f}".format(
-                (product.total_new + product.total_cut)*product.price),
-        ]
-        worksheet.append(row)
-
-    # Set the response headers for file download
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=products.xlsx'
-
-    worksheet.column_dimensions['A'].width = 20
-    worksheet.column_dimensions['B'].width = 20
-    worksheet.column_dimensions['C'].width = 20
-    worksheet.column_dimensions['D'].width = 20
-    worksheet.column_dimensions['E'].width = 20
-    worksheet.column_dimensions['F'].width = 20
-    worksheet.column_dimensions['G'].width = 20
-    worksheet.column_dimensions['H'].width = 20
-
-    # Save workbook to response
-    workbook.save(response)
-
-    return response
+    return export_changelist(request, Product)
 
 
 @login_required
 def export_warehouse_excel(request):
-    queryset = Warehouse.objects.all()
-
-    # Create a new workbook
-    workbook = Workbook()
-    worksheet = workbook.active
-
-    search_query = request.GET.get('q')
-    if search_query:
-        queryset = queryset.filter(Q(name__icontains=search_query))
-
-    filters = request.GET.dict()
-    filters.pop('q', None)
-    filters.pop('o', None)
-    filters.pop('p', None)
-    filters.pop('all', None)
-
-    if filters:
-        queryset = queryset.filter(**filters)
-
-    # Write headers
-    headers = ['Komponent', 'Miqdori',
-               'Keltirilgan narxi', 'Keltirilgan vaqti', 'Xodim']
-    worksheet.append(headers)
-
-    # Write data rows
-    for warehouse in queryset:
-        row = [
-            str(warehouse.component),
-            warehouse.quantity,
-            warehouse.price,
-            warehouse.arrival_time,
-            warehouse.user.username,
-
-        ]
-        worksheet.append(row)
-
-    # Remove time zone information from arrival_time
-    for column in worksheet.iter_cols(min_col=4, max_col=4, min_row=2):
-        for cell in column:
-            if cell.value:
-                cell.value = cell.value.replace(tzinfo=None)
-
-    # Set column alignment
-    for column in worksheet.columns:
-        column_letter = get_column_letter(column[0].column)
-        alignment = Alignment(horizontal='left')
-        worksheet.column_dimensions[column_letter].alignment = alignment
-
-    # Set column width for Arrival Time
-    worksheet.column_dimensions['A'].width = 20
-    worksheet.column_dimensions['B'].width = 20
-    worksheet.column_dimensions['C'].width = 20
-    worksheet.column_dimensions['D'].width = 20
-    worksheet.column_dimensions['E'].width = 20
-    worksheet.column_dimensions['F'].width = 20
-    worksheet.column_dimensions['G'].width = 20
-    worksheet.column_dimensions['H'].width = 20
-
-    # Set the response headers for file download
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=warehouse.xlsx'
-
-    # Save workbook to response
-    workbook.save(response)
-
-    return response
+    return export_changelist(request, Warehouse)
 
 
 @login_required
 def export_production_excel(request):
-    queryset = ProductProduction.objects.all()
-
-    # Create a new workbook
-    workbook = Workbook()
-    worksheet = workbook.active
-
-    search_query = request.GET.get('q')
-    if search_query:
-        queryset = queryset.filter(Q(series=search_query))
-
-    filters = request.GET.dict()
-    filters.pop('q', None)
-    filters.pop('o', None)
-    filters.pop('p', None)
-    filters.pop('all', None)
-
-    if filters:
-        queryset = queryset.filter(**filters)
-
-    # Write headers
-    headers = ['Seriya', 'Produkt', 'Kesilmaganlar soni',
-               'Xodim', 'Ishlab chiqarilish vaqti']
-    worksheet.append(headers)
-
-    # Write data rows
-    for production in queryset:
-        row = [
-            production.series,
-            str(production.product),
-            production.quantity,
-            production.user.username,
-            production.date.replace(
-                tzinfo=None),  # Remove timezone information
-        ]
-        worksheet.append(row)
-
-    # Set column width for Arrival Time
-    worksheet.column_dimensions['A'].width = 20
-    worksheet.column_dimensions['B'].width = 20
-    worksheet.column_dimensions['C'].width = 20
-    worksheet.column_dimensions['D'].width = 20
-    worksheet.column_dimensions['E'].width = 20
-    worksheet.column_dimensions['F'].width = 20
-    worksheet.column_dimensions['G'].width = 30
-    worksheet.column_dimensions['H'].width = 20
-
-    # Set the response headers for file download
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=production.xlsx'
-
-    # Save workbook to response
-    workbook.save(response)
-
-    return response
+    return export_changelist(request, ProductProduction)
 
 
 @login_required
 def export_reproduction_excel(request):
-    queryset = ProductReProduction.objects.all()
-
-    # Create a new workbook
-    workbook = Workbook()
-    worksheet = workbook.active
-
-    search_query = request.GET.get('q')
-    if search_query:
-        queryset = queryset.filter(Q(user__username__icontains=search_query))
-
-    filters = request.GET.dict()
-    filters.pop('q', None)
-    filters.pop('o', None)
-    filters.pop('p', None)
-    filters.pop('all', None)
-    if filters:
-        queryset = queryset.filter(**filters)
-
-    # Write headers
-    headers = ['Xodim', 'Umumiy kesilganlar',
-               'Kesilgan mahsulotlar', 'Kesilgan vaqti']
-    worksheet.append(headers)
-
-    # Write data rows
-    for reproduction in queryset:
-        cutting_events = reproduction.cutting.all()
-        events = ", ".join(str(str(cutting_event.quantity_cut) + ' ta ' +
-                           cutting_event.product.name) for cutting_event in cutting_events)
-        total_cut = 0
-        for cuttingevent in reproduction.cutting.all():
-            total_cut += cuttingevent.quantity_cut
-        row = [
-            reproduction.user.username,
-            total_cut,
-            events,
-            reproduction.date.replace(
-                tzinfo=None),  # Remove timezone information
-        ]
-        worksheet.append(row)
-
-    worksheet.column_dimensions['A'].width = 20
-    worksheet.column_dimensions['B'].width = 20
-    worksheet.column_dimensions['C'].width = 50
-    worksheet.column_dimensions['D'].width = 20
-    worksheet.column_dimensions['E'].width = 20
-    worksheet.column_dimensions['F'].width = 20
-    worksheet.column_dimensions['G'].width = 20
-    worksheet.column_dimensions['H'].width = 20
-    # Set the response headers for file download
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=reproduction.xlsx'
-
-    # Save workbook to response
-    workbook.save(response)
-
-    return response
+    return export_changelist(request, ProductReProduction)
 
 
 @login_required
 def export_sales_excel(request):
-    queryset = Sales.objects.all()
-
-    # Create a new workbook
-    workbook = Workbook()
-    worksheet = workbook.active
-
-    search_query = request.GET.get('q')
-    if search_query:
-        queryset = queryset.filter(
-            Q(buyer__icontains=search_query) | Q(seller__icontains=search_query))
-
-    filters = request.GET.dict()
-    filters.pop('q', None)
-    filters.pop('o', None)
-    filters.pop('all', None)
-    filters.pop('p', None)
-    if filters:
-        queryset = queryset.filter(**filters)
-
-    # Write headers
-    headers = ['Haridor', 'Sotuvchi',
-               'Kesilgan mahsulotlar', 'Kesilmagan mahsulotlar', 'Narx', 'Xodim', 'Sotilgan sana']
-    worksheet.append(headers)
-
-    # Write data rows
-    for sale in queryset:
-        sales_events = sale.selling_cut.all()
-        cuts = ", ".join(str(
-            sale_event)+f' ({sale_event.single_sold_price} dan)' for sale_event in sales_events)
-
-        sales_event2s = sale.selling.all()
-        non_cuts = ", ".join(str(
-            sale_event2)+f' ({sale_event2.single_sold_price} dan)' for sale_event2 in sales_event2s)
-
-        sales_events = sale.selling_cut.all()
-        total_price = sum(event.total_sold_price for event in sales_events)
-
-        sales_events2 = sale.selling.all()
-        total_price2 = sum(event.total_sold_price for event in sales_events2)
-        formatted_price = "{:,.1f}".format(total_price + total_price2)
-
-        row = [
-            sale.buyer,
-            sale.seller,
-            cuts,
-            non_cuts,
-            formatted_price,
-            sale.user.username if sale.user else '-',
-            sale.date.replace(
-                tzinfo=None),  # Remove timezone information
-        ]
-        worksheet.append(row)
-
-    worksheet.column_dimensions['A'].width = 20
-    worksheet.column_dimensions['B'].width = 20
-    worksheet.column_dimensions['C'].width = 50
-    worksheet.column_dimensions['D'].width = 50
-    worksheet.column_dimensions['E'].width = 20
-    worksheet.column_dimensions['F'].width = 20
-    worksheet.column_dimensions['G'].width = 20
-    worksheet.column_dimensions['H'].width = 20
-    # Set the response headers for file download
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=sales.xlsx'
-
-    # Save workbook to response
-    workbook.save(response)
-
-    return response
+    return export_changelist(request, Sales)
+
+
+@user_passes_test(lambda user: user.is_superuser)
+def stock_valuation_report(request):
+    at = timezone.now()
+    if request.GET.get('at'):
+        try:
+            at = datetime.fromisoformat(request.GET['at'])
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+        except ValueError:
+            # A report for "now" must not be labelled with the asked moment.
+            error = "Sana va vaqt noto'g'ri."
+            if request.GET.get('format') == 'xlsx':
+                return HttpResponseBadRequest(error)
+            context = {
+                **admin.site.each_context(request),
+                'title': 'Ombor qiymati',
+                'at': timezone.localtime(),
+                'errors': [error],
+                'sections': [],
+            }
+            return render(request, 'admin/stock_valuation.html', context, status=400)
+
+    sections = stock_valuation(at)
+
+    if request.GET.get('format') == 'xlsx':
+        workbook = Workbook()
+        worksheet = workbook.active
+        worksheet.append([f"{timezone.localtime(at):%d.%m.%Y %H:%M} holatiga ko'ra"])
+
+        for section in sections:
+            worksheet.append([])
+            worksheet.append([section['title']])
+            worksheet.append(['Bo\'lim', 'Nomi', 'Miqdor',
+                             'Narxi', 'Qiymati', 'Valyuta'])
+            for row in section['rows']:
+                worksheet.append([row['section'], row['title'], row['quantity'],
+                                  row['price'], row['value'], row['currency']])
+            for currency, total in section['totals'].items():
+                worksheet.append(['', 'Jami', '', '', total, currency])
+
+        for column in 'ABCDEF':
+            worksheet.column_dimensions[column].width = 20
+
+        response = HttpResponse(
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        response['Content-Disposition'] = f'attachment; filename=valuation_{at:%Y%m%d_%H%M}.xlsx'
+        workbook.save(response)
+        return response
+
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Ombor qiymati',
+        'at': timezone.localtime(at),
+        'sections': sections,
+    }
+    return render(request, 'admin/stock_valuation.html', context)
+
+
+def _read_plan(request, products):
+    """
+    Planned ``{product_id: quantity}`` from the ``qty_<id>`` form fields or,
+    when given, from an uploaded sheet of (product name, quantity) rows.
+    Returns the plan and the list of problems found while reading it.
+    """
+    plan = {}
+    errors = []
+    upload = request.FILES.get('plan')
+    if upload:
+        by_name = {product.name.strip().lower(): product.pk for product in products}
+        try:
+            workbook = load_workbook(upload, read_only=True, data_only=True)
+        except Exception:
+            return plan, ["Faylni o'qib bo'lmadi, .xlsx fayl yuklang."]
+        for number, row in enumerate(workbook.active.iter_rows(values_only=True), 1):
+            if not row or row[0] is None:
+                continue
+            quantity = row[1] if len(row) > 1 else None
+            if not _valid_quantity(quantity):
+                if number > 1:
+                    errors.append(f"{number}-qator: miqdor noto'g'ri.")
+                continue
+            pk = by_name.get(str(row[0]).strip().lower())
+            if pk is None:
+                errors.append(f"{number}-qator: '{row[0]}' tovari topilmadi.")
+                continue
+            plan[pk] = plan.get(pk, 0) + quantity
+        return plan, errors
+
+    for product in products:
+        value = request.POST.get(f'qty_{product.pk}', '').strip()
+        if not value:
+            continue
+        try:
+            quantity = float(value)
+        except ValueError:
+            quantity = None
+        if _valid_quantity(quantity):
+            plan[product.pk] = quantity
+        else:
+            errors.append(f"{product.name}: miqdor noto'g'ri.")
+    return plan, errors
+
+
+def _valid_quantity(quantity):
+    # float() also accepts 'nan', 'inf' and negative numbers.
+    return (isinstance(quantity, (int, float)) and not isinstance(quantity, bool) and
+            math.isfinite(quantity) and quantity >= 0)
+
+
+@login_required
+def material_requirements_report(request):
+    app_label = request.GET.get('catalogue', 'seh_1')
+    if app_label not in MRP_CATALOGUES:
+        app_label = 'seh_1'
+    app_config = apps.get_app_config(app_label)
+    product_model = app_config.get_model('Product')
+
+    products = product_model.objects.order_by('name')
+    if any(field.name == 'parent' for field in product_model._meta.fields):
+        products = products.filter(parent__isnull=False)
+    products = list(products.only('pk', 'name'))
+
+    plan = {}
+    errors = []
+    rows = None
+    if request.method == 'POST':
+        plan, errors = _read_plan(request, products)
+        rows = material_requirements(app_label, plan)
+
+    if rows is not None and request.POST.get('format') == 'xlsx':
+        workbook = Workbook()
+        worksheet = workbook.active
+        worksheet.append(['Bo\'lim', 'Nomi', "O'lchov birligi", 'Kerak',
+                          'Mavjud', 'Qoladi', 'Yetishmaydi'])
+        for row in rows:
+            worksheet.append([row['section'], row['title'], row['measurement'],
+                              row['required'], row['total'], row['remaining'],
+                              row['shortage']])
+        for column in 'ABCDEFG':
+            worksheet.column_dimensions[column].width = 20
+
+        response = HttpResponse(
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        response['Content-Disposition'] = f'attachment; filename=mrp_{app_label}.xlsx'
+        workbook.save(response)
+        return response
+
+    context = {
+        **admin.site.each_context(request),
+        'title': f'Komponent ehtiyoji ({app_config.verbose_name})',
+        'catalogue': app_label,
+        'catalogues': [apps.get_app_config(label) for label in MRP_CATALOGUES],
+        'products': [(product, plan.get(product.pk, '')) for product in products],
+        'errors': errors,
+        'rows': rows,
+        'shortages': sum(1 for row in rows or () if row['shortage']),
+    }
+    return render(request, 'admin/material_requirements.html', context)
+
+
+@user_passes_test(lambda user: user.is_superuser)
+def price_simulation_report(request):
+    app_label = request.GET.get('catalogue', 'seh_1')
+    if app_label not in MRP_CATALOGUES:
+        app_label = 'seh_1'
+    app_config = apps.get_app_config(app_label)
+    components = app_config.get_model('Component').objects.filter(
+        parent__isnull=False).order_by('parent__title', 'title').values(
+        'pk', 'title', 'price', 'measurement', section=F('parent__title'))
+
+    prices = {}
+    errors = []
+    months = 3
+    result = None
+    if request.method == 'POST':
+        for component in components:
+            value = request.POST.get(f'price_{component["pk"]}', '').strip()
+            if not value:
+                continue
+            try:
+                prices[component['pk']] = float(value)
+            except ValueError:
+                errors.append(f"{component['title']}: narx noto'g'ri.")
+        try:
+            months = min(max(int(request.POST.get('months', months)), 1), MAX_SIMULATION_MONTHS)
+        except ValueError:
+            errors.append(f"Oylar soni 1 dan {MAX_SIMULATION_MONTHS} gacha butun son bo'lishi kerak.")
+        else:
+            since = day_start(timezone.localdate() - timedelta(days=30 * months))
+            result = price_simulation(app_label, prices, since)
+
+    context = {
+        **admin.site.each_context(request),
+        'title': f'Narx simulyatsiyasi ({app_config.verbose_name})',
+        'catalogue': app_label,
+        'catalogues': [apps.get_app_config(label) for label in MRP_CATALOGUES],
+        'components': [(component, prices.get(component['pk'], '')) for component in components],
+        'months': months,
+        'errors': errors,
+        'result': result,
+    }
+    return render(request, 'admin/price_simulation.html', context)
 
 
 @receiver(post_save, sender=ProductProduction)
-def subtract_component_total(sender, instance, created, **kwargs):
-    if created:
-        product_components = instance.product.productcomponent_set.all()
-        product = instance.product
-        product.total_new += instance.quantity
-        product.save()
+@receiver(post_delete, sender=ProductProduction)
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+@receiver(post_save, sender=Sales)
+@receiver(post_delete, sender=Sales)
+@receiver(post_save, sender=SalesEvent)
+@receiver(post_delete, sender=SalesEvent)
+@receiver(post_save, sender=SalesEvent2)
+@receiver(post_delete, sender=SalesEvent2)
+@receiver(post_save, sender=Component)
+@receiver(post_delete, sender=Component)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductComponent)
+@receiver(post_delete, sender=ProductComponent)
+@receiver(post_save, sender=ProductReProduction)
+@receiver(post_delete, sender=ProductReProduction)
+@receiver(post_save, sender=CuttingEvent)
+@receiver(post_delete, sender=CuttingEvent)
+def data_changed(sender, **kwargs):
+    bump_version(sender)
 
-        for product_component in product_components:
-            total_quantity_by_component = product_component.quantity * \
-                instance.quantity
-            component = product_component.component
-            component.total -= total_quantity_by_component
 
-            # if component.total < 0:
-            #     component.total = 0
+@receiver(post_save, sender=Component)
+def component_low_stock_update(sender, instance, **kwargs):
+    update_low_stock(instance)
 
-            component.save()
 
-            try:
-                for tg_id in settings.ADMINS:
-                    if component.total <= component.notification_limit:
-                        message_text = f'{component.title} limitdan kamayib ketdi!'
-                        url = f'https://api.telegram.org/bot{settings.TOKEN}/sendMessage'
+@receiver(post_delete, sender=Component)
+def component_low_stock_delete(sender, instance, **kwargs):
+    discard_low_stock(instance.pk)
+
+
+@receiver(pre_save, sender=Component)
+def component_remember_price(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not instance.pk or (update_fields is not None and 'price' not in update_fields):
+        return
+    instance._stored_price = Component.objects.filter(
+        pk=instance.pk).values_list('price', flat=True).first()
+
 
-                        inline_keyboard = [[{
-                            'text': 'Ko\'rish',
-                            'url': f'{settings.HOSTNAME}'+reverse('admin:seh_1_component_changelist')
-                        }]]
+@receiver(post_save, sender=Component)
+def component_price_update(sender, instance, created, **kwargs):
+    # Stock, title and parent edits leave the unit costs alone.
+    stored_price = instance.__dict__.pop('_stored_price', None)
+    if created or stored_price is None or stored_price == instance.price:
+        return
+    refresh_unit_costs(Product.objects.filter(
+        productcomponent__component=instance), ProductComponent)
 
-                        message = {
-                            'chat_id': tg_id,
-                            'text': message_text,
-                            'reply_markup': {
-                                'inline_keyboard': inline_keyboard
-                            }
-                        }
 
-                        response = requests.post(url, json=message)
-                        print(response.text)
+@receiver(pre_save, sender=Product)
+def product_remember_name(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not instance.pk or (update_fields is not None and 'name' not in update_fields):
+        return
+    instance._stored_name = Product.objects.filter(
+        pk=instance.pk).values_list('name', flat=True).first()
 
-            except Exception as e:
-                print(e)
+
+@receiver(post_save, sender=Product)
+def product_rename(sender, instance, created, **kwargs):
+    stored_name = instance.__dict__.pop('_stored_name', None)
+    if created or stored_name is None or stored_name == instance.name:
+        return
+    # The sales summaries hold a copy of the product name.
+    sales = set(SalesEvent.objects.filter(product=instance).values_list('sales_id', flat=True))
+    sales.update(SalesEvent2.objects.filter(product=instance).values_list('sales_id', flat=True))
+    refresh_sales_totals(Sales, sales)
+
+
+@receiver(post_save, sender=ProductComponent)
+@receiver(post_delete, sender=ProductComponent)
+def product_component_update(sender, instance, **kwargs):
+    refresh_unit_costs(Product.objects.filter(
+        pk=instance.product_id), ProductComponent)
+    discard_bom_matrix(ProductComponent)
+
+
+@receiver(post_save, sender=ProductProduction)
+def subtract_component_total(sender, instance, created, **kwargs):
+    if created:
+        with transaction.atomic():
+            move_stock(Product, instance.product_id, 'production',
+                       total_new=instance.quantity)
+            bom = ProductComponent.objects.filter(
+                product_id=instance.product_id).values_list('component_id', 'quantity')
+            amounts = consume_components(Component, bom, instance.quantity)
+            record_movements(Component, 'total', {
+                pk: -amount for pk, amount in amounts.items()}, 'consumption')
+
+        components = list(Component.objects.filter(pk__in=amounts))
+        update_low_stock(*components)
+
+        low_components = [
+            component for component in components if component.total <= component.notification_limit]
+        if low_components:
+            queue_low_stock_notification(*low_components)
 
 
 @receiver(post_delete, sender=ProductProduction)
 def delete_component_total(sender, instance, **kwargs):
-    product_components = instance.product.productcomponent_set.all()
-    product = instance.product
-    product.total_new -= instance.quantity
-    product.save()
+    with transaction.atomic():
+        move_stock(Product, instance.product_id, 'reversal',
+                   total_new=-instance.quantity)
+        bom = ProductComponent.objects.filter(
+            product_id=instance.product_id).values_list('component_id', 'quantity')
+        amounts = consume_components(Component, bom, -instance.quantity)
+        record_movements(Component, 'total', {
+            pk: -amount for pk, amount in amounts.items()}, 'reversal')
 
-    for product_component in product_components:
-        total_quantity_by_component = product_component.quantity * instance.quantity
-        component = product_component.component
-        component.total += total_quantity_by_component
-        component.save()
+    update_low_stock(*Component.objects.filter(pk__in=amounts))
 
 
 @receiver(post_save, sender=Warehouse)
 def add_component_total(sender, instance, created, **kwargs):
     if created:
-        print("qo'shildi" * 88)
-        component = instance.component
-        component.total += instance.quantity
-        component.save()
+        move_stock(Component, instance.component_id, 'arrival',
+                   total=instance.quantity)
+        update_low_stock(*Component.objects.filter(pk=instance.component_id))
 
 
 @receiver(pre_save, sender=Warehouse)
@@ -486,49 +392,48 @@ def update_component_total_on_edit(sender, instance, **kwargs):
     if instance.pk:
         # Warehouse object is being edited (not a new object)
         old_warehouse = Warehouse.objects.get(pk=instance.pk)
-        component = instance.component
-        component.total = component.total - old_warehouse.quantity + instance.quantity
-        component.save()
+        if (old_warehouse.component_id, old_warehouse.quantity) != (instance.component_id, instance.quantity):
+            move_stock(Component, old_warehouse.component_id, 'reversal',
+                       total=-old_warehouse.quantity)
+            move_stock(Component, instance.component_id, 'arrival',
+                       total=instance.quantity)
+            update_low_stock(*Component.objects.filter(
+                pk__in=[old_warehouse.component_id, instance.component_id]))
 
 
 @receiver(post_delete, sender=Warehouse)
 def update_component_total_on_delete(sender, instance, **kwargs):
-    component = instance.component
-    component.total -= instance.quantity
-    component.save()
+    move_stock(Component, instance.component_id, 'reversal',
+               total=-instance.quantity)
+    update_low_stock(*Component.objects.filter(pk=instance.component_id))
 
 
 @receiver(post_save, sender=CuttingEvent)
 def curring_create(sender, instance, created, **kwargs):
     if created:
-        product = instance.product
-        product.total_new -= instance.quantity_cut
-        product.total_cut += instance.quantity_cut
-        product.save()
+        move_stock(Product, instance.product_id, 'cut',
+                   total_new=-instance.quantity_cut, total_cut=instance.quantity_cut)
 
 
 @receiver(post_delete, sender=CuttingEvent)
 def cutting_delete(sender, instance, **kwargs):
-    product = instance.product
-    product.total_new += instance.quantity_cut
-    product.total_cut -= instance.quantity_cut
-    product.save()
+    move_stock(Product, instance.product_id, 'reversal',
+               total_new=instance.quantity_cut, total_cut=-instance.quantity_cut)
 
 
 @receiver(post_save, sender=SalesEvent)
 def sales_create(sender, instance, created, **kwargs):
     if created:
-        product = instance.product
-        product.total_cut -= instance.quantity_sold
-        product.save()
+        move_stock(Product, instance.product_id, 'sale',
+                   total_cut=-instance.quantity_sold)
+    refresh_sales_totals(Sales, [instance.sales_id])
 
 
 @receiver(post_delete, sender=SalesEvent)
 def sales_delete(sender, instance, **kwargs):
-
-    product = instance.product
-    product.total_cut += instance.quantity_sold
-    product.save()
+    move_stock(Product, instance.product_id, 'reversal',
+               total_cut=instance.quantity_sold)
+    refresh_sales_totals(Sales, [instance.sales_id])
 
     try:
         sales = instance.sales
@@ -541,16 +446,16 @@ def sales_delete(sender, instance, **kwargs):
 @receiver(post_save, sender=SalesEvent2)
 def sales2_create(sender, instance, created, **kwargs):
     if created:
-        product = instance.product
-        product.total_new -= instance.quantity_sold
-        product.save()
+        move_stock(Product, instance.product_id, 'sale',
+                   total_new=-instance.quantity_sold)
+    refresh_sales_totals(Sales, [instance.sales_id])
 
 
 @receiver(post_delete, sender=SalesEvent2)
 def sales2_delete(sender, instance, **kwargs):
-    product = instance.product
-    product.total_new += instance.quantity_sold
-    product.save()
+    move_stock(Product, instance.product_id, 'reversal',
+               total_new=instance.quantity_sold)
+    refresh_sales_totals(Sales, [instance.sales_id])
 
     sales = instance.sales
     if sales.selling_cut.all().count() == 0 and sales.selling.all().count() == 0: